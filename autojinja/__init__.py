@@ -1,14 +1,68 @@
 __version__ = "1.14.1"
 
-from . import defaults
-from . import exceptions
-from . import main
-from . import path
-from .path import DirPath, Path
-from . import parser
-from .parser import ParserSettings
-from . import templates
-from .templates import Context, CogTemplate, CogTemplateContext, JinjaTemplate, JinjaTemplateContext, RawTemplate, RawTemplateContext, Template
-from . import utils
-
-import os
+import sys
+
+### Submodules and attributes are imported on first access, so that jinja2 is only imported when templates are used
+
+_submodules = [
+    "cache",
+    "daemon",
+    "defaults",
+    "depfile",
+    "discovery",
+    "environment",
+    "events",
+    "exceptions",
+    "main",
+    "parser",
+    "path",
+    "report",
+    "runner",
+    "schedule",
+    "shard",
+    "templates",
+    "tracker",
+    "utils",
+    "watch",
+]
+
+_attributes = {
+    "DirPath": "path",
+    "Path": "path",
+    "ParserSettings": "parser",
+    "Context": "templates",
+    "CogTemplate": "templates",
+    "CogTemplateContext": "templates",
+    "JinjaTemplate": "templates",
+    "JinjaTemplateContext": "templates",
+    "RawTemplate": "templates",
+    "RawTemplateContext": "templates",
+    "Template": "templates",
+    "declare": "tracker",
+}
+
+__all__ = [*_submodules, *_attributes]
+
+def _import(name: str):
+    """ Imports the given submodule, which also sets it as attribute of this package.
+        Imported with __import__ rather than importlib, so that it is reported by 'python -X importtime'.
+    """
+    return __import__(f"{__name__}.{name}", fromlist=[name])
+
+def __getattr__(name: str):
+    """ Imports the given submodule or attribute on first access.
+    """
+    if name in _submodules:
+        return _import(name)
+    if name in _attributes:
+        value = getattr(_import(_attributes[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+def __dir__():
+    return sorted(set([*globals(), *__all__]))
+
+if sys.version_info < (3, 7): # Module __getattr__ isn't supported
+    for name in __all__:
+        globals()[name] = __getattr__(name)
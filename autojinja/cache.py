@@ -0,0 +1,196 @@
+"""
+Persistent run manifest, allowing to skip python scripts whose inputs didn't change since their last execution.
+For each python script, the manifest records the files it read, the files it wrote, the directories it listed
+and the environment variables it has been executed with that can change its behaviour
+(additional environment variables, '--includes' and autojinja settings).
+"""
+
+from . import discovery
+from . import path
+from . import runner
+from . import schedule
+from . import tracker
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Environment variables always part of the environment hash, along with the additional environment variables
+HASHED_ENVVARS = ["PYTHONPATH"]
+HASHED_ENVVARS_PREFIX = "AUTOJINJA_" # Settings
+
+def file_hash(filepath: str) -> Optional[str]:
+    """ Returns the sha256 content hash of the given file, or None if it can't be read.
+    """
+    sha = hashlib.sha256()
+    try:
+        with open(filepath, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                sha.update(chunk)
+    except OSError:
+        return None
+    return sha.hexdigest()
+
+def env_hash(env: Dict[str, str], envvars: Iterable[str] = ()) -> str:
+    """ Returns a hash of the environment variables of the given environment that can change the behaviour of python scripts:
+        the given additional environment variables, the import directories and autojinja settings.
+        Other variables, such as terminal or session variables, aren't part of the hash.
+    """
+    names = set(envvars)
+    items = sorted([(k, v) for k, v in env.items() if k in names or k in HASHED_ENVVARS or k.startswith(HASHED_ENVVARS_PREFIX)])
+    return hashlib.sha256(json.dumps(items).encode("utf-8")).hexdigest()
+
+def stable_mtime(mtime: int) -> Optional[int]:
+    """ Returns the given modification time, or None if it is too recent to tell apart modifications made in the same tick.
+    """
+    return mtime if int(time.time() * 1e9) - mtime > discovery.RACY_DELAY else None
+
+def file_state(filepath: str) -> Optional[List[Any]]:
+    """ Returns the [mtime, size, hash] of the given file, or None if it doesn't exist.
+        Recent modification times aren't recorded, so that the file is compared by content next time.
+    """
+    fingerprint = tracker.fingerprint(filepath)
+    if fingerprint == None:
+        return None
+    return [stable_mtime(fingerprint[0]), fingerprint[1], file_hash(filepath)]
+
+def is_file_unchanged(filepath: str, state: Optional[List[Any]]) -> bool:
+    """ Returns True if the given file still matches its recorded state.
+        Content hashes are only computed when the modification time differs.
+    """
+    fingerprint = tracker.fingerprint(filepath)
+    if fingerprint == None or state == None:
+        return fingerprint == None and state == None
+    if fingerprint[0] == state[0] and fingerprint[1] == state[1]:
+        return True
+    if fingerprint[1] != state[1]:
+        return False
+    if file_hash(filepath) != state[2]:
+        return False
+    state[0] = stable_mtime(fingerprint[0]) # Touched only
+    return True
+
+class RunCache:
+    """ Run manifest stored in a cache directory """
+    def __init__(self, dirpath: str, envvars: Iterable[str] = ()):
+        self.dirpath: path.Path = path.DirPath(dirpath).abspath
+        self.envvars: Set[str] = set(envvars) # Additional environment variables, part of the environment hash
+        self.filepath: path.Path = self.dirpath.join(MANIFEST_FILENAME)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        """ Loads the manifest, ignoring it if it doesn't exist or is invalid.
+        """
+        try:
+            with open(self.filepath, 'r', encoding = "utf-8") as file:
+                manifest = json.load(file)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.entries = manifest.get("scripts", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def save(self):
+        """ Writes the manifest atomically.
+        """
+        os.makedirs(self.dirpath, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix="manifest-", suffix=".tmp", dir=self.dirpath)
+        try:
+            with os.fdopen(fd, 'w', encoding = "utf-8") as file:
+                json.dump({ "version": MANIFEST_VERSION, "scripts": self.entries }, file)
+            os.replace(tmp, self.filepath)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+
+    def is_up_to_date(self, script: str, env: Dict[str, str]) -> bool:
+        """ Returns True if the given python script doesn't need to be executed again.
+        """
+        entry = self.entries.get(tracker.normpath(script))
+        if entry == None or entry.get("env") != env_hash(env, self.envvars):
+            return False
+        for files in [entry["inputs"], entry["outputs"]]:
+            for filepath, state in files.items():
+                if not is_file_unchanged(filepath, state):
+                    return False
+        for dirpath, state in entry.get("listed", {}).items():
+            if tracker.listing(dirpath) != state:
+                return False # Entries added or removed
+        return True
+
+    def update(self, results: List[runner.ScriptResult], env: Dict[str, str]):
+        """ Records the files accessed by successfully executed python scripts.
+            Failed or untracked python scripts are removed from the manifest.
+        """
+        for result in results:
+            script = tracker.normpath(result.script)
+            if result.failed or result.record == None:
+                self.entries.pop(script, None)
+                continue
+            record = result.record
+            outputs = [*record.outputs, *record.generated]
+            self.entries[script] = { "env": env_hash(env, self.envvars),
+                                     "inputs": { x: file_state(x) for x in record.inputs if x not in outputs },
+                                     "outputs": { x: file_state(x) for x in dict.fromkeys(outputs) },
+                                     "listed": { x: tracker.listing(x) for x in record.listed },
+                                     "generated": record.generated }
+
+    def record(self, script: str) -> Optional[tracker.Recorder]:
+        """ Returns the files accessed by the given python script during its last execution, if recorded.
+        """
+        entry = self.entries.get(tracker.normpath(script))
+        if entry == None:
+            return None
+        generated = entry.get("generated", {})
+        return tracker.Recorder.from_dict({ "script": tracker.normpath(script),
+                                            "inputs": list(entry["inputs"]),
+                                            "outputs": [x for x in entry["outputs"] if x not in generated],
+                                            "listed": list(entry.get("listed", {})),
+                                            "generated": generated })
+
+    def outdated(self, scripts: List[path.Path], env: Dict[str, str], graph: Optional[schedule.Graph] = None) -> List[path.Path]:
+        """ Returns the python scripts that need to be executed, keeping their order.
+            Python scripts depending on outdated ones are outdated too, as the files they read are about to be written again.
+            Dependencies are given by the graph if any, and by files recorded as written by a python script and read by another.
+        """
+        outdated = set([x for x in scripts if not self.is_up_to_date(x, env)])
+        prerequisites = graph.subset(scripts) if graph != None else { x: set() for x in scripts }
+        ### Recorded files
+        writers: Dict[str, Set[path.Path]] = {}
+        for script in scripts:
+            for filepath in self.entries.get(tracker.normpath(script), {}).get("outputs", {}):
+                writers.setdefault(filepath, set()).add(script)
+        for script in scripts:
+            for filepath in self.entries.get(tracker.normpath(script), {}).get("inputs", {}):
+                prerequisites[script].update(writers.get(filepath, ()))
+            prerequisites[script].discard(script)
+        ### Transitive dependents
+        dependents: Dict[path.Path, List[path.Path]] = { x: [] for x in scripts }
+        for script, values in prerequisites.items():
+            for prerequisite in values:
+                dependents[prerequisite].append(script)
+        stack = list(outdated)
+        while stack:
+            for dependent in dependents[stack.pop()]:
+                if dependent not in outdated:
+                    outdated.add(dependent)
+                    stack.append(dependent)
+        return [x for x in scripts if x in outdated]
+
+def run(scripts: List[path.Path], script_runner: runner.Runner, run_cache: RunCache, force: bool = False, graph: Optional[schedule.Graph] = None) -> List[runner.ScriptResult]:
+    """ Executes the given python scripts, skipping up-to-date ones unless forced, and returns their results.
+        The manifest is updated even if some python scripts fail.
+    """
+    script_runner.track = tracker.is_supported()
+    results = script_runner.execute(scripts if force else run_cache.outdated(scripts, script_runner.env, graph), graph)
+    run_cache.update(results, script_runner.env)
+    run_cache.save()
+    return results
@@ -0,0 +1,255 @@
+"""
+Long-lived autojinja server executing python scripts in-process, and its thin client.
+The client forwards its arguments, environment and current working directory through a unix domain socket,
+the server streams the outputs back and finally sends the exit code.
+"""
+
+import contextlib
+import io
+import json
+import os
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_IDLE_TIMEOUT = 600
+
+serving: bool = False
+
+def current_uid() -> int:
+    return os.getuid() if hasattr(os, "getuid") else 0
+
+def default_socket_path() -> str:
+    """ Returns the default socket path of the autojinja server, one per user.
+        The socket is created in the user's runtime directory if any, otherwise in a private directory of the temporary directory.
+    """
+    runtime_dirpath = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dirpath and os.path.isdir(runtime_dirpath):
+        return os.path.join(runtime_dirpath, "autojinja.sock")
+    return os.path.join(tempfile.gettempdir(), f"autojinja-{current_uid()}", "autojinja.sock")
+
+def private_dirpath(dirpath: str):
+    """ Creates the given directory accessible only by the current user, if it doesn't exist.
+        Raises an error if it exists but belongs to another user or is accessible by other users.
+    """
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(dirpath, 0o700)
+    info = os.lstat(dirpath)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != current_uid() or info.st_mode & 0o077:
+        raise Exception(f"Directory at path \"{dirpath}\" must be a directory accessible only by the current user")
+
+def peer_uid(connection: socket.socket, socket_path: str) -> Optional[int]:
+    """ Returns the user id of the process at the other end of the given connection.
+        Falls back to the owner of the socket file where peer credentials aren't supported.
+    """
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", credentials)[1] # pid, uid, gid
+    try:
+        return os.stat(socket_path).st_uid
+    except OSError:
+        return None
+
+def check_support():
+    if not hasattr(socket, "AF_UNIX"):
+        raise Exception("autojinja server requires unix domain sockets, which aren't supported on this platform")
+
+def send(connection: socket.socket, message: Dict):
+    connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+class _StreamWriter(io.TextIOBase):
+    """ Forwards written text to the client """
+    def __init__(self, connection: socket.socket, name: str, lock: threading.Lock):
+        self.connection: socket.socket = connection
+        self.name: str = name
+        self.lock: threading.Lock = lock
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            with self.lock:
+                send(self.connection, { self.name: text })
+        return len(text)
+
+def _sources_mtimes() -> Dict[str, float]:
+    """ Returns the modification times of all loaded autojinja and jinja2 sources.
+    """
+    mtimes: Dict[str, float] = {}
+    for name, module in list(sys.modules.items()):
+        if name.split('.', 1)[0] in ["autojinja", "jinja2"]:
+            filepath = getattr(module, "__file__", None)
+            if filepath and os.path.isfile(filepath):
+                mtimes[filepath] = os.path.getmtime(filepath)
+    return mtimes
+
+def _handle(connection: socket.socket, request: Dict):
+    from . import main
+    lock = threading.Lock()
+    old_cwd = os.getcwd()
+    old_environ = dict(os.environ)
+    errcode = 0
+    error: Optional[str] = None
+    try:
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.chdir(request["cwd"])
+        with contextlib.redirect_stdout(_StreamWriter(connection, "stdout", lock)), \
+             contextlib.redirect_stderr(_StreamWriter(connection, "stderr", lock)):
+            try:
+                main(*request["arguments"])
+            except SystemExit as e:
+                errcode = e.code if isinstance(e.code, int) else 0 if e.code == None else 1
+            except Exception as e:
+                errcode = 1
+                error = str(e)
+    finally:
+        os.chdir(old_cwd)
+        os.environ.clear()
+        os.environ.update(old_environ)
+    send(connection, { "exit": errcode, "error": error })
+
+def serve(socket_path: Optional[str] = None, idle_timeout: Optional[float] = None):
+    """ Serves autojinja requests on the given unix domain socket.
+        Python scripts are executed in-process, so that jinja2 and compiled templates remain loaded.
+        The server stops after being idle for idle_timeout seconds, or when autojinja or jinja2 sources change.
+        Modified templates are reloaded, and python scripts and their local modules are imported again on each request.
+        Requests are handled one at a time, as python scripts share the server's working directory and environment.
+        A client disconnecting or sending an invalid request only drops its own connection.
+    """
+    global serving
+    check_support()
+    from . import runner
+    runner.warm_up()
+    if socket_path == None:
+        socket_path = default_socket_path()
+        private_dirpath(os.path.dirname(socket_path))
+    idle_timeout = DEFAULT_IDLE_TIMEOUT if idle_timeout == None else idle_timeout
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        ### Bind socket, replacing stale ones
+        if os.path.exists(socket_path):
+            client = _connect(socket_path)
+            if client != None:
+                client.close()
+                return # Already served
+            os.remove(socket_path)
+        old_umask = os.umask(0o177) # Socket only accessible by the current user
+        try:
+            server.bind(socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        server.settimeout(idle_timeout if idle_timeout > 0 else None)
+        mtimes = _sources_mtimes()
+        serving = True
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                break # Idle
+            with connection:
+                try:
+                    if hasattr(socket, "SO_PEERCRED") and peer_uid(connection, socket_path) != current_uid():
+                        continue # Requests from other users
+                    connection.settimeout(None)
+                    with connection.makefile('r', encoding="utf-8") as file:
+                        line = file.readline()
+                    if not line:
+                        continue
+                    if _sources_mtimes() != mtimes:
+                        send(connection, { "restart": True })
+                        break # Stale sources
+                    _handle(connection, json.loads(line))
+                except (OSError, ValueError, KeyError):
+                    continue # Disconnected client or invalid request, only its connection is dropped
+    finally:
+        serving = False
+        server.close()
+        with contextlib.suppress(OSError):
+            os.remove(socket_path)
+
+def _connect(socket_path: str) -> Optional[socket.socket]:
+    """ Connects to the autojinja server at the given path, or returns None if there is none.
+        Raises an error if the server belongs to another user, before anything is sent to it.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        return None
+    if peer_uid(client, socket_path) != current_uid():
+        client.close()
+        raise Exception(f"autojinja server at path \"{socket_path}\" belongs to another user")
+    return client
+
+def _spawn(socket_path: str, idle_timeout: Optional[float]):
+    """ Starts an autojinja server in the background.
+    """
+    env = os.environ.copy()
+    package_dirpath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([package_dirpath, env["PYTHONPATH"]]) if "PYTHONPATH" in env else package_dirpath
+    arguments = [sys.executable, "-m", "autojinja", "--serve", "--socket", socket_path]
+    if idle_timeout != None:
+        arguments += ["--idle-timeout", str(idle_timeout)]
+    subprocess.Popen(arguments,
+                     env=env,
+                     stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+def _connect_or_spawn(socket_path: str, idle_timeout: Optional[float], timeout: float = 10) -> socket.socket:
+    client = _connect(socket_path)
+    if client != None:
+        return client
+    _spawn(socket_path, idle_timeout)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client = _connect(socket_path)
+        if client != None:
+            return client
+        time.sleep(0.05)
+    raise Exception(f"Couldn't connect to autojinja server at path \"{socket_path}\"")
+
+def forward(arguments: List[str], socket_path: Optional[str] = None, idle_timeout: Optional[float] = None, env: Optional[Dict[str, str]] = None, cwd: Optional[str] = None):
+    """ Forwards the given arguments, environment and current working directory to an autojinja server.
+        Starts the server in the background if needed, and streams back its outputs.
+        Raises an error if the server reports one.
+    """
+    check_support()
+    if socket_path == None:
+        socket_path = default_socket_path()
+        private_dirpath(os.path.dirname(socket_path))
+    request = { "arguments": list(arguments),
+                "env": dict(env if env != None else os.environ),
+                "cwd": cwd or os.getcwd() }
+    for _ in range(2):
+        with _connect_or_spawn(socket_path, idle_timeout) as client:
+            send(client, request)
+            with client.makefile('r', encoding="utf-8") as file:
+                for line in file:
+                    message = json.loads(line)
+                    if "stdout" in message:
+                        sys.stdout.write(message["stdout"])
+                    elif "stderr" in message:
+                        sys.stderr.write(message["stderr"])
+                    elif "restart" in message:
+                        break # Server stopped, start a new one
+                    elif "exit" in message:
+                        sys.stdout.flush()
+                        if message["error"] != None:
+                            raise Exception(message["error"])
+                        if message["exit"] != 0:
+                            raise Exception(f"Error {message['exit']} while executing autojinja server request")
+                        return
+        time.sleep(0.05) # Let the stale server remove its socket
+    raise Exception(f"Couldn't execute request on autojinja server at path \"{socket_path}\"")
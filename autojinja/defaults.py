@@ -12,13 +12,35 @@ AUTOJINJA_DEFAULT_COG_END    = "end"
 AUTOJINJA_DEFAULT_EDIT_OPEN  = "<<["
 AUTOJINJA_DEFAULT_EDIT_CLOSE = "]>>"
 AUTOJINJA_DEFAULT_EDIT_END   = "end"
+AUTOJINJA_DEFAULT_CACHE_DIR  = ".autojinja-cache"
 
+AUTOJINJA_CACHE_DIR      = "AUTOJINJA_CACHE_DIR"
+AUTOJINJA_CHECK          = "AUTOJINJA_CHECK"
 AUTOJINJA_CWD            = "AUTOJINJA_CWD"
 AUTOJINJA_REMOVE_MARKERS = "AUTOJINJA_REMOVE_MARKERS"
 AUTOJINJA_SILENT         = "AUTOJINJA_SILENT"
 AUTOJINJA_SUMMARY        = "AUTOJINJA_SUMMARY"
 AUTOJINJA_THIS_DIRPATH   = "THIS_DIRPATH"
 
+def osenviron_cache_dir(env: Optional[os._Environ] = None) -> Optional[str]:
+    """ Returns the directory of compiled templates, relative to the autojinja working directory.
+        Returns None if compiled templates aren't cached on disk.
+    """
+    env = env or os.environ
+    value = env.get(AUTOJINJA_CACHE_DIR)
+    if not value:
+        return None
+    return os.path.join(osenviron_cwd(env), value)
+
+def osenviron_check(env: Optional[os._Environ] = None) -> int:
+    env = env or os.environ
+    if AUTOJINJA_CHECK not in env:
+        return 0
+    value = env[AUTOJINJA_CHECK]
+    if value != "0" and value != "1":
+        raise Exception(f"Expected 0 or 1 for environment variable '{AUTOJINJA_CHECK}'")
+    return 1 if value == "1" else 0
+
 def osenviron_cwd(env: Optional[os._Environ] = None) -> str:
     env = env or os.environ
     if AUTOJINJA_CWD not in env:
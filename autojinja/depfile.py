@@ -0,0 +1,75 @@
+"""
+Writes Make/Ninja depfiles and outputs files from the files accessed by executed python scripts.
+Build systems can then re-execute autojinja only when one of the recorded dependencies changes.
+"""
+
+from . import path
+from . import tracker
+
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def escape(filepath: str) -> str:
+    """ Returns the given path escaped for Make/Ninja depfiles.
+    """
+    filepath = filepath.replace('\\', '/')
+    filepath = filepath.replace('$', '$$')
+    filepath = filepath.replace('#', '\\#')
+    filepath = filepath.replace(' ', '\\ ')
+    return filepath
+
+def collect(records: Iterable[Optional[tracker.Recorder]], common_files: List[str] = []) -> Tuple[List[str], List[str]]:
+    """ Returns the dependencies and the generated files of the given records, in order of appearance.
+        Generated files are never dependencies, even if read by python scripts.
+    """
+    inputs: Dict[str, None] = {} # Ordered set
+    outputs: Dict[str, None] = {} # Ordered set
+    records = [x for x in records if x != None]
+    for record in records:
+        outputs.update(dict.fromkeys(record.generated))
+    for record in records:
+        for filepath in record.inputs:
+            if filepath not in outputs and filepath not in record.outputs:
+                inputs[filepath] = None
+    for filepath in common_files:
+        inputs[tracker.normpath(filepath)] = None
+    return list(inputs), list(outputs)
+
+def write_depfile(filepath: str, targets: List[str], dependencies: List[str]):
+    """ Writes a Make/Ninja depfile, one dependency per line.
+    """
+    lines = [f"{' '.join([escape(x) for x in targets])}:"]
+    lines += [f"  {escape(x)}" for x in dependencies]
+    content = " \\\n".join(lines) + "\n"
+    write_file(filepath, content)
+
+def write_outputs_file(filepath: str, outputs: List[str]):
+    """ Writes the given generated files, one path per line.
+    """
+    write_file(filepath, "".join([f"{x}\n" for x in outputs]))
+
+def write_file(filepath: str, content: str):
+    """ Writes the given file only if its content changed, so that build systems don't consider it newer.
+    """
+    filepath = path.Path(filepath).abspath
+    if filepath.isfile:
+        with open(filepath, 'r', encoding = "utf-8", newline = "") as file:
+            if file.read() == content:
+                return
+    dirpath = filepath.dirpath
+    if not dirpath.isdir:
+        os.makedirs(dirpath, exist_ok=True)
+    with open(filepath, 'w', encoding = "utf-8", newline = "") as file:
+        file.write(content)
+
+def write(records: Iterable[Optional[tracker.Recorder]], common_files: List[str], depfile: Optional[str], outputs_file: Optional[str], targets: Optional[List[str]] = None):
+    """ Writes the depfile and the outputs file of the given records, when requested.
+        Depfile targets default to the generated files, or to the depfile without its extension if nothing is generated.
+    """
+    dependencies, outputs = collect(records, common_files)
+    if depfile:
+        if not targets:
+            targets = outputs or [path.Path(depfile).abspath.no_ext]
+        write_depfile(depfile, targets, dependencies)
+    if outputs_file:
+        write_outputs_file(outputs_file, outputs)
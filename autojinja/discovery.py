@@ -0,0 +1,322 @@
+"""
+Discovers python scripts in directories, by filename or by tag on their first line.
+Directories are visited with os.scandir, heavy directories are pruned by default,
+and '.autojinjaignore' files are honored with the gitignore syntax.
+"""
+
+from . import defaults
+from . import path
+from . import utils
+
+import collections
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+IGNORE_FILENAME = ".autojinjaignore"
+INDEX_FILENAME = "discovery.json"
+INDEX_VERSION = 1
+
+# Entries modified less than this many nanoseconds ago aren't indexed, as they may change within the same timestamp
+RACY_DELAY = 2_000_000_000
+
+# Directories pruned by default, can be re-included with negated patterns (ex: '!build/')
+DEFAULT_IGNORE_PATTERNS = [".git/", ".hg/", ".svn/", "node_modules/", "build/", "__pycache__/",
+                           ".venv/", "venv/", ".tox/", ".nox/", ".eggs/", "*.egg-info/",
+                           ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", f"{defaults.AUTOJINJA_DEFAULT_CACHE_DIR}/"]
+
+# Marker of python virtual environments, pruned by default
+VIRTUALENV_MARKER = "pyvenv.cfg"
+
+def translate(pattern: str) -> str:
+    """ Returns the regular expression matching the given gitignore glob pattern.
+    """
+    i, n = 0, len(pattern)
+    result = ""
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i+3] == "**/":
+                result += "(?:.*/)?"
+                i += 3
+                continue
+            if pattern[i:i+2] == "**":
+                result += ".*"
+                i += 2
+                continue
+            result += "[^/]*"
+        elif c == '?':
+            result += "[^/]"
+        elif c == '[':
+            j = pattern.find(']', i + 2 if pattern[i+1:i+2] in ["!", "^"] else i + 1)
+            if j < 0:
+                result += re.escape(c)
+            else:
+                chars = pattern[i+1:j]
+                if chars[0] in "!^":
+                    chars = "^" + chars[1:]
+                result += f"[{chars}]"
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result += re.escape(pattern[i])
+        else:
+            result += re.escape(c)
+        i += 1
+    return result
+
+class IgnoreRule:
+    """ Single gitignore pattern """
+    def __init__(self, pattern: str, base: str = ""):
+        self.negated: bool = pattern.startswith('!')
+        if self.negated:
+            pattern = pattern[1:]
+        elif pattern.startswith('\\'):
+            pattern = pattern[1:] if pattern[1:2] in ["!", "#"] else pattern
+        self.dir_only: bool = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        self.anchored: bool = '/' in pattern # Relative to the ignore file's directory
+        pattern = pattern.lstrip('/')
+        self.base: str = base
+        self.regex = re.compile(translate(pattern) + r"\Z", re.IGNORECASE if sys.platform == "win32" else 0)
+
+    def match(self, relpath: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            return self.regex.match(relpath) != None
+        return self.regex.match(name) != None
+
+class IgnoreRules:
+    """ Ordered gitignore patterns, the last matching pattern wins """
+    def __init__(self, rules: Optional[List[IgnoreRule]] = None):
+        self.rules: List[IgnoreRule] = rules or []
+
+    @staticmethod
+    def parse(lines: Iterable[str], base: str = "") -> List[IgnoreRule]:
+        rules: List[IgnoreRule] = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if not line or line.startswith('#'):
+                continue
+            rules.append(IgnoreRule(line, base))
+        return rules
+
+    @staticmethod
+    def default() -> "IgnoreRules":
+        return IgnoreRules(IgnoreRules.parse(DEFAULT_IGNORE_PATTERNS))
+
+    def extend(self, dirpath: str) -> "IgnoreRules":
+        """ Returns these rules followed by the rules of the ignore file inside the given directory, if any.
+        """
+        try:
+            with open(os.path.join(dirpath, IGNORE_FILENAME), 'r', encoding = "utf-8") as file:
+                lines = file.readlines()
+        except OSError:
+            return self
+        return IgnoreRules(self.rules + IgnoreRules.parse(lines, normalize(dirpath)))
+
+    def is_ignored(self, filepath: str, is_dir: bool) -> bool:
+        """ Returns True if the given normalized path is ignored.
+        """
+        name = filepath.rsplit('/', 1)[-1]
+        ignored = False
+        for rule in self.rules:
+            if rule.negated != ignored:
+                continue # Can't change the result
+            relpath = filepath[len(rule.base)+1:] if rule.base and filepath.startswith(rule.base + '/') else filepath
+            if rule.match(relpath, name, is_dir):
+                ignored = not rule.negated
+        return ignored
+
+def normalize(filepath: str) -> str:
+    """ Returns the given path as absolute, with slashes only.
+    """
+    return os.path.abspath(filepath).replace('\\', '/')
+
+def join(dirpath: str, name: str) -> str:
+    return dirpath + name if dirpath.endswith('/') else f"{dirpath}/{name}"
+
+def scan(dirpath: str) -> Tuple[List[str], List[str], bool]:
+    """ Returns the sorted file and directory names inside the given directory, and whether it is a virtual environment.
+        Relies on directory entry types, symbolic links to directories aren't followed.
+    """
+    filenames: List[str] = []
+    dirnames: List[str] = []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirnames.append(entry.name)
+                    elif entry.is_file():
+                        filenames.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return [], [], False
+    filenames.sort()
+    dirnames.sort()
+    return filenames, dirnames, VIRTUALENV_MARKER in filenames
+
+def is_file_tagged(filepath: str, tag: str) -> bool:
+    try:
+        return utils.is_file_tagged(filepath, tag)
+    except Exception:
+        sys.stderr.write(f"[autojinja]  Couldn't read file at path  {path.Path(filepath).abspath}\n")
+        return False
+
+class DiscoveryIndex:
+    """ Persistent index of scanned directories and tagged files.
+        Directories are only scanned again when their modification time changes,
+        and files are only read again when their modification time or size changes.
+    """
+    def __init__(self, filepath: str, filename: str = defaults.AUTOJINJA_DEFAULT_FILENAME, tag: str = defaults.AUTOJINJA_DEFAULT_TAG):
+        self.filepath: str = filepath
+        self.filename: str = filename
+        self.tag: str = tag
+        self.dirs: Dict[str, List[Any]] = {}  # dirpath: [mtime, filenames, dirnames]
+        self.files: Dict[str, List[Any]] = {} # filepath: [mtime, size, tagged]
+        self.used_dirs: Dict[str, List[Any]] = {}
+        self.used_files: Dict[str, List[Any]] = {}
+        self.load()
+
+    def load(self):
+        """ Loads the index, ignoring it if it doesn't exist, is invalid or has been built for another tag or filename.
+        """
+        try:
+            with open(self.filepath, 'r', encoding = "utf-8") as file:
+                index = json.load(file)
+            if index.get("version") == INDEX_VERSION and index.get("tag") == self.tag and index.get("filename") == self.filename:
+                self.dirs = index.get("dirs", {})
+                self.files = index.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def save(self):
+        """ Writes the index, without entries removed from the directories scanned since loaded.
+        """
+        def is_removed(filepath: str, position: int) -> bool:
+            dirpath, name = filepath.rsplit('/', 1)
+            entry = self.used_dirs.get(dirpath or '/')
+            return entry != None and name not in entry[position]
+        dirs = { k: v for k, v in { **self.dirs, **self.used_dirs }.items() if not is_removed(k, 2) }
+        files = { k: v for k, v in { **self.files, **self.used_files }.items() if not is_removed(k, 1) }
+        dirpath = os.path.dirname(os.path.abspath(self.filepath))
+        os.makedirs(dirpath, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix="discovery-", suffix=".tmp", dir=dirpath)
+        try:
+            with os.fdopen(fd, 'w', encoding = "utf-8") as file:
+                json.dump({ "version": INDEX_VERSION, "tag": self.tag, "filename": self.filename, "dirs": dirs, "files": files }, file)
+            os.replace(tmp, self.filepath)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def scan(self, dirpath: str) -> Tuple[List[str], List[str], bool]:
+        """ Returns the same as scan(), only scanning the directory if it changed.
+        """
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+        except OSError:
+            return [], [], False
+        entry = self.dirs.get(dirpath)
+        if entry == None or entry[0] != mtime:
+            filenames, dirnames, _ = scan(dirpath)
+            entry = [mtime if int(time.time() * 1e9) - mtime > RACY_DELAY else None, filenames, dirnames]
+        self.used_dirs[dirpath] = entry
+        return entry[1], entry[2], VIRTUALENV_MARKER in entry[1]
+
+    def is_file_tagged(self, filepath: str, tag: str) -> bool:
+        """ Returns the same as is_file_tagged(), only reading the file if it changed.
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return is_file_tagged(filepath, tag)
+        entry = self.files.get(filepath)
+        if entry == None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            tagged = is_file_tagged(filepath, tag)
+            entry = [stat.st_mtime_ns if int(time.time() * 1e9) - stat.st_mtime_ns > RACY_DELAY else None, stat.st_size, tagged]
+        self.used_files[filepath] = entry
+        return entry[2]
+
+def walk(dirpath: str, recursive: bool = True, ignore: bool = True, index: Optional[DiscoveryIndex] = None) -> Iterator[Tuple[str, List[str]]]:
+    """ Yields each visited directory as a normalized path with its sorted filenames, in depth-first order.
+        Ignored files, ignored directories and virtual environments are skipped when ignore is enabled.
+    """
+    rules = IgnoreRules.default() if ignore else IgnoreRules()
+    stack: List[Tuple[str, IgnoreRules]] = [(normalize(dirpath), rules)]
+    top = True
+    while stack:
+        dirpath, rules = stack.pop()
+        filenames, dirnames, is_virtualenv = index.scan(dirpath) if index != None else scan(dirpath)
+        if ignore:
+            if is_virtualenv and not top:
+                continue
+            if IGNORE_FILENAME in filenames:
+                rules = rules.extend(dirpath)
+            filenames = [x for x in filenames if not rules.is_ignored(join(dirpath, x), False)]
+        top = False
+        yield dirpath, filenames
+        if recursive:
+            subdirpaths = [join(dirpath, x) for x in dirnames]
+            if ignore:
+                subdirpaths = [x for x in subdirpaths if not rules.is_ignored(x, True)]
+            stack.extend([(x, rules) for x in reversed(subdirpaths)])
+
+def discover(dirpaths: Union[str, Iterable[str]],
+             search_filename: bool = True,
+             search_tag: bool = True,
+             recursive: bool = True,
+             filename: str = defaults.AUTOJINJA_DEFAULT_FILENAME,
+             tag: str = defaults.AUTOJINJA_DEFAULT_TAG,
+             ignore: bool = True,
+             workers: Optional[int] = None,
+             index: Optional[DiscoveryIndex] = None) -> Iterator[path.Path]:
+    """ Yields python scripts found in the given directories, in a deterministic order:
+        for each directory, the script named after filename, then tagged scripts by name, then subdirectories by name.
+        First lines of candidate scripts are read concurrently by a pool of workers.
+        Unchanged directories and files aren't read again when an index is provided.
+    """
+    if isinstance(dirpaths, str):
+        dirpaths = [dirpaths]
+    pending: Deque[Tuple[str, Optional[concurrent.futures.Future]]] = collections.deque() # None when found by filename
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers) if search_tag else None
+    tagged = index.is_file_tagged if index != None else is_file_tagged
+    def pop():
+        script, future = pending.popleft()
+        if future == None or future.result():
+            return path.Path(script)
+        return None
+    try:
+        for dirpath in dirpaths:
+            for wroot, filenames in walk(dirpath, recursive, ignore, index):
+                found = search_filename and filename in filenames
+                if found:
+                    pending.append((join(wroot, filename), None))
+                if search_tag:
+                    for x in filenames:
+                        if x.endswith(".py") and not (found and x == filename):
+                            script = join(wroot, x)
+                            pending.append((script, executor.submit(tagged, script, tag)))
+                ### Yield scripts in order as soon as available
+                while pending and (pending[0][1] == None or pending[0][1].done()):
+                    script = pop()
+                    if script != None:
+                        yield script
+        while pending:
+            script = pop()
+            if script != None:
+                yield script
+    finally:
+        if executor != None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,38 @@
+"""
+Jinja2 environment raising AttributeErrors of properties instead of returning undefined values.
+Defined in a dedicated module so that exceptions.prepend_jinja2_traceback recognizes its frames like jinja2's own frames.
+"""
+
+import jinja2
+from typing import Any
+
+class PropertyEnvironment(jinja2.Environment):
+    """ Jinja2 environment whose getattr and getitem methods don't hide errors raised by properties """
+    def getattr(self, obj: Any, attribute: str) -> Any:
+        """ Get an item or attribute of an object but prefer the attribute.
+            AttributeErrors are raised again if the object doesn't have such item either.
+        """
+        try:
+            return getattr(obj, attribute)
+        except AttributeError as e:
+            try:
+                return obj[attribute]
+            except Exception:
+                pass
+            raise e
+
+    def getitem(self, obj: Any, argument: Any) -> Any:
+        """ Get an item or attribute of an object but prefer the item.
+            AttributeErrors are raised if the object doesn't have such attribute either.
+        """
+        try:
+            return obj[argument]
+        except (AttributeError, TypeError, LookupError):
+            if isinstance(argument, str):
+                try:
+                    attr = str(argument)
+                except Exception:
+                    pass
+                else:
+                    return getattr(obj, attr)
+            return self.undefined(obj=obj, name=argument)
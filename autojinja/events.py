@@ -0,0 +1,84 @@
+"""
+Writes structured events about executed python scripts, one JSON object per line:
+    {"event": "script_started", "script": PATH}
+    {"event": "file_generated", "script": PATH, "path": PATH, "status": "new"|"changed"|"unchanged", "bytes": N}
+    {"event": "error", "script": PATH, "message": TEXT, "type": NAME, "line": N, "column": N}
+    {"event": "script_finished", "script": PATH, "exit_code": N, "duration": SECONDS, "output": TEXT}
+    {"event": "watching", "files": N}
+Each line is written with a single write call, so that events of concurrent python scripts never interleave.
+"""
+
+from . import path
+
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, List
+
+FORMATS = ["jsonl"]
+
+class EventWriter:
+    """ Writes events as JSON lines to the given stream, stdout by default """
+    def __init__(self, stream = None):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, events: List[Dict[str, Any]]):
+        """ Writes the given events as consecutive lines.
+            Writes directly to the file descriptor when available, so that each line is flushed at once.
+        """
+        text = "".join([json.dumps(x, ensure_ascii=False) + "\n" for x in events])
+        with self.lock:
+            stream = self.stream or sys.stdout # Resolved at each write, stdout may be redirected
+            try:
+                fd = stream.fileno()
+            except (AttributeError, OSError, ValueError):
+                fd = None # In-memory stream
+            if fd != None:
+                stream.flush()
+                data = text.encode("utf-8")
+                while data:
+                    data = data[os.write(fd, data):]
+            else:
+                stream.write(text)
+                stream.flush()
+
+    def emit(self, event: str, **values):
+        self.write([{ "event": event, **values }])
+
+    def script_started(self, script: str):
+        self.emit("script_started", script=path.no_antislash(script))
+
+    def watching(self, files: int):
+        self.emit("watching", files=files)
+
+    def script_finished(self, result, silent: bool = False):
+        """ Writes the files generated by the given script result, its error if it failed, then its completion.
+            The captured output is included unless silent, or if the script failed.
+        """
+        script = path.no_antislash(result.script)
+        events: List[Dict[str, Any]] = []
+        if result.record != None:
+            for filepath, values in result.record.generated.items():
+                if values["status"] != "declared":
+                    events.append({ "event": "file_generated", "script": script, "path": filepath, "status": values["status"], "bytes": values["size"] })
+        if result.failed:
+            error = (result.record.error if result.record != None else None) or {}
+            events.append({ "event": "error",
+                            "script": script,
+                            "message": error.get("message") or f"Error {result.errcode} while executing script at path \"{result.script}\"",
+                            "type": error.get("type"),
+                            "line": error.get("line"),
+                            "column": error.get("column") })
+        events.append({ "event": "script_finished",
+                        "script": script,
+                        "exit_code": result.errcode,
+                        "duration": result.wall_time,
+                        "output": result.out if result.out and (not silent or result.failed) else None })
+        self.write(events)
+
+    def error(self, message: str):
+        """ Writes an error that isn't related to a specific python script.
+        """
+        self.emit("error", script=None, message=message, type=None, line=None, column=None)
@@ -1,7 +1,7 @@
 from . import parser
 
 import os
-from typing import Generic, Tuple, Type, TypeVar
+from typing import Generic, Optional, Tuple, Type, TypeVar
 import traceback
 
 _TException = TypeVar("_TException", bound=Exception)
@@ -10,25 +10,38 @@ _TException = TypeVar("_TException", bound=Exception)
 
 class CommonException(Exception, Generic[_TException]):
     @staticmethod
-    def from_marker(exceptionType: Type[_TException], marker: parser.Marker, pos: int, size: int, message: str) -> _TException:
+    def from_marker(exceptionType: Type[_TException], marker: "parser.Marker", pos: int, size: int, message: str) -> _TException:
         line = line_at_index(marker.string, pos)
         (l, c) = index_to_coordinates(marker.string, pos)
-        message = f"{message}\n{line}\n{' ' * (c-1)}{'^' * size} line {marker.parent_lineno + l-1}, column {marker.parent_column + c}"
+        lineno = marker.parent_lineno + l-1
+        column = marker.parent_column + c
+        message = f"{message}\n{line}\n{' ' * (c-1)}{'^' * size} line {lineno}, column {column}"
         exception = exceptionType(message)
+        exception.lineno = lineno
+        exception.column = column
         return exception
     
     @staticmethod
-    def from_exception(exception: _TException, marker: parser.Marker) -> _TException:
+    def from_exception(exception: _TException, marker: "parser.Marker") -> _TException:
         exception = prepend_jinja2_traceback(exception)
         text = format_text(marker.header)
-        stack = f"\n  During {'reinsertion' if marker.is_edit else 'generation'} of \"{marker.open} {text} {marker.close}\" at line {marker.parent_lineno + marker.header_open_lineno-1}, column {marker.parent_column + marker.header_open_column+1}"
+        lineno = marker.parent_lineno + marker.header_open_lineno-1
+        column = marker.parent_column + marker.header_open_column+1
+        stack = f"\n  During {'reinsertion' if marker.is_edit else 'generation'} of \"{marker.open} {text} {marker.close}\" at line {lineno}, column {column}"
         message = str(exception).lstrip('\n')
         message = f"{stack}\n{message}"
         exception = wrap_exception(exception, message)
+        try:
+            exception.lineno = lineno # Position of the outermost marker
+            exception.column = column
+        except AttributeError:
+            pass # Immutable exception
         return exception
 
     def __init__(self, message: str):
         super().__init__(message)
+        self.lineno: Optional[int] = None # Marker position, when known
+        self.column: Optional[int] = None
 
 ### Parsing exception
 
@@ -38,7 +51,7 @@ class ParsingException(CommonException):
 
 class OpenMarkerNotFoundException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "OpenMarkerNotFoundException":
+    def from_marker(marker: "parser.Marker") -> "OpenMarkerNotFoundException":
         return CommonException.from_marker(OpenMarkerNotFoundException,
                                            marker,
                                            marker.header_open,
@@ -49,7 +62,7 @@ class OpenMarkerNotFoundException(ParsingException):
 
 class CloseMarkerNotFoundException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "CloseMarkerNotFoundException":
+    def from_marker(marker: "parser.Marker") -> "CloseMarkerNotFoundException":
         return CommonException.from_marker(CloseMarkerNotFoundException,
                                            marker,
                                            marker.header_open,
@@ -60,7 +73,7 @@ class CloseMarkerNotFoundException(ParsingException):
 
 class EndMarkerNotFoundException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "EndMarkerNotFoundException":
+    def from_marker(marker: "parser.Marker") -> "EndMarkerNotFoundException":
         return CommonException.from_marker(EndMarkerNotFoundException,
                                            marker,
                                            marker.header_close - len(marker.close),
@@ -71,7 +84,7 @@ class EndMarkerNotFoundException(ParsingException):
 
 class RequireHeaderInlineException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "RequireHeaderInlineException":
+    def from_marker(marker: "parser.Marker") -> "RequireHeaderInlineException":
         return CommonException.from_marker(RequireHeaderInlineException,
                                            marker,
                                            marker.header_open,
@@ -82,7 +95,7 @@ class RequireHeaderInlineException(ParsingException):
 
 class RequireHeaderMultilineException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "RequireHeaderMultilineException":
+    def from_marker(marker: "parser.Marker") -> "RequireHeaderMultilineException":
         return CommonException.from_marker(RequireHeaderMultilineException,
                                            marker,
                                            marker.header_open,
@@ -93,7 +106,7 @@ class RequireHeaderMultilineException(ParsingException):
 
 class WrongHeaderIndentationException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker, pos) -> "WrongHeaderIndentationException":
+    def from_marker(marker: "parser.Marker", pos) -> "WrongHeaderIndentationException":
         return CommonException.from_marker(WrongHeaderIndentationException,
                                            marker,
                                            pos,
@@ -104,7 +117,7 @@ class WrongHeaderIndentationException(ParsingException):
 
 class RequireNewlineException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "RequireNewlineException":
+    def from_marker(marker: "parser.Marker") -> "RequireNewlineException":
         return CommonException.from_marker(RequireNewlineException,
                                            marker,
                                            marker.header_open,
@@ -115,7 +128,7 @@ class RequireNewlineException(ParsingException):
 
 class RequireInlineException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "RequireInlineException":
+    def from_marker(marker: "parser.Marker") -> "RequireInlineException":
         return CommonException.from_marker(RequireInlineException,
                                            marker,
                                            marker.header_open,
@@ -126,7 +139,7 @@ class RequireInlineException(ParsingException):
 
 class WrongInclusionException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "WrongInclusionException":
+    def from_marker(marker: "parser.Marker") -> "WrongInclusionException":
         return CommonException.from_marker(WrongInclusionException,
                                            marker,
                                            marker.header_open,
@@ -137,7 +150,7 @@ class WrongInclusionException(ParsingException):
 
 class DuplicateEditException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "DuplicateEditException":
+    def from_marker(marker: "parser.Marker") -> "DuplicateEditException":
         return CommonException.from_marker(DuplicateEditException,
                                            marker,
                                            marker.header_open,
@@ -148,7 +161,7 @@ class DuplicateEditException(ParsingException):
 
 class DirectlyEnclosedEditException(ParsingException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "DirectlyEnclosedEditException":
+    def from_marker(marker: "parser.Marker") -> "DirectlyEnclosedEditException":
         return CommonException.from_marker(DirectlyEnclosedEditException,
                                            marker,
                                            marker.header_open,
@@ -165,7 +178,7 @@ class GenerationException(CommonException):
 
 class RequireBodyInlineException(GenerationException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "RequireBodyInlineException":
+    def from_marker(marker: "parser.Marker") -> "RequireBodyInlineException":
         return CommonException.from_marker(RequireBodyInlineException,
                                            marker,
                                            marker.header_open,
@@ -176,7 +189,7 @@ class RequireBodyInlineException(GenerationException):
 
 class NonGeneratedEditException(GenerationException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "NonGeneratedEditException":
+    def from_marker(marker: "parser.Marker") -> "NonGeneratedEditException":
         return CommonException.from_marker(NonGeneratedEditException,
                                            marker,
                                            marker.header_open,
@@ -187,7 +200,7 @@ class NonGeneratedEditException(GenerationException):
 
 class AlreadyGeneratedEditException(GenerationException):
     @staticmethod
-    def from_marker(marker: parser.Marker) -> "AlreadyGeneratedEditException":
+    def from_marker(marker: "parser.Marker") -> "AlreadyGeneratedEditException":
         return CommonException.from_marker(AlreadyGeneratedEditException,
                                            marker,
                                            marker.header_open,
@@ -295,18 +308,16 @@ def prepend_jinja2_traceback(exception: _TException, tb: str = None) -> _TExcept
     if hasattr(exception, "_wrapped_exception"):
         stacktrace = None
     elif stacktrace != None:
-        token1 = f"jinja2{os.sep}environment.py\", " # Jinja2 hack
-        token2 = f"jinja2{os.sep}runtime.py\", " # Jinja2 hack
+        tokens = [f"jinja2{os.sep}environment.py\", ", # Jinja2 hack
+                  f"jinja2{os.sep}runtime.py\", ",
+                  f"autojinja{os.sep}environment.py\", "]
         startidx = -1
         while True:
-            idx = stacktrace.find(token1, startidx+1)
-            if idx < 0:
-                idx = stacktrace.find(token2, startidx+1)
-                if idx < 0:
-                    break # Token not found
-                startidx = stacktrace.find('\n', idx+len(token2))
-            else:
-                startidx = stacktrace.find('\n', idx+len(token1))
+            found = [(idx, token) for token in tokens for idx in [stacktrace.find(token, startidx+1)] if idx >= 0]
+            if not found:
+                break # Token not found
+            idx, token = min(found)
+            startidx = stacktrace.find('\n', idx+len(token))
             while True:
                 if startidx < 0:
                     startidx = len(stacktrace)
@@ -4,6 +4,7 @@ Visits directories and executes python scripts to perform content generation
 Usage
 -----
 autojinja [OPTIONS] (PYTHON_SCRIPT | DIRECTORY)...
+autojinja --serve [--socket=PATH] [--idle-timeout=SECONDS]
 
 Examples
 --------
@@ -28,6 +29,8 @@ OPTIONS:
     --filename=FILENAME           Filename searched by '--search-filename'. Default value is '__jinja__.py'
     --tag=TAG                     Tag searched by '--search-tag'. Default value is 'autojinja'
                                   Python scripts' first line must contain this tag (ex: '### autojinja ###')
+    --no-ignore                   Visits all subdirectories, including heavy directories skipped by default ('.git', 'node_modules',
+                                  'build', virtual environments...) and paths listed in '.autojinjaignore' files
     -e, --env=NAME=VALUE/FILE     Additional environment variable or .env file
     -i, --includes=DIRECTORIES    Additional import directories for executed python scripts
                                   Directory list separated by ':' (Unix only) or ';' (Windows and Unix)
@@ -56,17 +59,61 @@ OPTIONS:
                                         ^------ show (1) / hide (0) executing script path
                                               0: [autojinja]  -------  <path>
                                               1: [autojinja]  -------  <path>  (from <path>)
+    -j, --jobs=N                  Number of python scripts executed concurrently. Default value is '1', or '0' with '--check'
+                                  '0' executes as many python scripts as processors
+                                  Outputs of concurrent python scripts are written as one unit per script
+    -k, --keep-going              Executes all python scripts even if some fail, and reports all failures at the end
+    --in-process                  Executes python scripts sequentially inside the autojinja python interpreter
+                                  Avoids starting a new python process and reimporting jinja2 for each python script
+    --daemon                      Forwards the command to a background autojinja server, started if not running
+                                  The server executes python scripts in-process and keeps jinja2 loaded between commands
+    --serve                       Runs an autojinja server in the foreground, no PYTHON_SCRIPT or DIRECTORY required
+    --socket=PATH                 Unix domain socket of the autojinja server used by '--daemon' and '--serve'
+                                  Default value is 'autojinja.sock' in '$XDG_RUNTIME_DIR', or in a private 'autojinja-<uid>' temporary directory
+    --idle-timeout=SECONDS        Stops the autojinja server after being idle for the given duration. Default value is '600'
+    -w, --watch                   Keeps running after executing python scripts, and re-executes python scripts whenever
+                                  the files they accessed change (python scripts, environment files, templates, data files)
+    --cache                       Skips python scripts whose accessed files and environment didn't change since their last execution
+                                  Executions are recorded in a manifest stored in the cache directory
+    --index                       Keeps an index of visited directories and tagged python scripts in the cache directory
+                                  Only changed directories are scanned again and only changed python scripts are read again
+    --cache-dir=DIRECTORY         Cache directory used by '--cache' and '--index'. Default value is '.autojinja-cache'
+    --force                       Executes all python scripts even if up-to-date, and refreshes the cache
+    --depfile=FILE                Writes a Make/Ninja depfile listing all files read by executed python scripts
+                                  (python scripts, environment files, templates, imported local modules, data files)
+    --depfile-target=TARGET       Target of the depfile, can be repeated. Default value is all generated files
+    --outputs-file=FILE           Writes all files generated with 'autojinja.utils.generate_file', one path per line
+    --report=FILE                 Writes a JSON report with the duration, CPU time, maximum memory, exit code and generated files
+                                  of each executed python script, and prints the slowest python scripts
+    --check                       Executes all python scripts without writing generated files, prints differences with
+                                  existing files and fails if any generated file is out of date
+    --events=FORMAT               Writes structured events to stdout instead of notifications, one JSON object per line ('jsonl')
+                                  Events report started and finished python scripts, generated files and errors
+    --shard=I/N                   Only executes the I-th of N shards of python scripts, to split the execution across N machines
+                                  Shards only depend on relative paths, python scripts depending on each other are kept together
+    --shard-durations=REPORT      Balances shards with durations read from reports written by '--report', can be repeated
 """
 
+from . import cache
+from . import daemon
+from . import depfile
+from . import discovery
 from . import defaults
+from . import events
 from . import path
+from . import report
+from . import runner
+from . import schedule
+from . import shard
+from . import tracker
 from . import utils
+from . import watch
 
 import argparse
 import os
-import subprocess
 import sys
-from typing import List
+import time
+from typing import Dict, List, Optional
 
 this_module = sys.modules[__name__]
 
@@ -75,7 +122,7 @@ def main(*arguments):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter,
                                      description="Visits directories and executes python scripts to perform content generation")
     parser.add_argument("arguments",
-                        nargs="+",
+                        nargs="*",
                         help="PYTHON_SCRIPT:\n"
                              "    Python script to execute\n"
                              "    The filepath must end with '.py' extension\n\n"
@@ -105,6 +152,10 @@ def main(*arguments):
                         default=defaults.AUTOJINJA_DEFAULT_TAG,
                         help=f"tag searched by '--search-tag'. Default tag is '{defaults.AUTOJINJA_DEFAULT_TAG}'\n"
                              f"Python scripts' first line must contain this tag (ex: '### {defaults.AUTOJINJA_DEFAULT_TAG} ###')")
+    parser.add_argument("--no-ignore",
+                        action="store_true",
+                        help=f"visits all subdirectories, including heavy directories skipped by default ('.git', 'node_modules',\n"
+                             f"'build', virtual environments...) and paths listed in '{discovery.IGNORE_FILENAME}' files")
     parser.add_argument("-e",
                         "--env",
                         action="append",
@@ -143,15 +194,97 @@ def main(*arguments):
                              f"      ^------ show (1) / hide (0) executing script path\n"
                              f"            0: [autojinja]  -------  <path>\n"
                              f"            1: [autojinja]  -------  <path>  (from <path>)")
+    parser.add_argument("-j",
+                        "--jobs",
+                        type=int,
+                        help="number of python scripts executed concurrently. Default value is '1', or '0' with '--check'\n"
+                             "'0' executes as many python scripts as processors\n"
+                             "Outputs of concurrent python scripts are written as one unit per script")
+    parser.add_argument("-k",
+                        "--keep-going",
+                        action="store_true",
+                        help="executes all python scripts even if some fail, and reports all failures at the end")
+    parser.add_argument("--in-process",
+                        action="store_true",
+                        help="executes python scripts sequentially inside the autojinja python interpreter\n"
+                             "Avoids starting a new python process and reimporting jinja2 for each python script")
+    parser.add_argument("--daemon",
+                        action="store_true",
+                        help="forwards the command to a background autojinja server, started if not running\n"
+                             "The server executes python scripts in-process and keeps jinja2 loaded between commands")
+    parser.add_argument("--serve",
+                        action="store_true",
+                        help="runs an autojinja server in the foreground, no PYTHON_SCRIPT or DIRECTORY required")
+    parser.add_argument("--socket",
+                        help="unix domain socket of the autojinja server used by '--daemon' and '--serve'\n"
+                             "Default value is 'autojinja.sock' in '$XDG_RUNTIME_DIR', or in a private 'autojinja-<uid>' temporary directory")
+    parser.add_argument("--idle-timeout",
+                        type=float,
+                        help=f"stops the autojinja server after being idle for the given duration. Default value is '{daemon.DEFAULT_IDLE_TIMEOUT}'")
+    parser.add_argument("-w",
+                        "--watch",
+                        action="store_true",
+                        help="keeps running after executing python scripts, and re-executes python scripts whenever\n"
+                             "the files they accessed change (python scripts, environment files, templates, data files)")
+    parser.add_argument("--cache",
+                        action="store_true",
+                        help="skips python scripts whose accessed files and environment didn't change since their last execution\n"
+                             "Executions are recorded in a manifest stored in the cache directory")
+    parser.add_argument("--index",
+                        action="store_true",
+                        help="keeps an index of visited directories and tagged python scripts in the cache directory\n"
+                             "Only changed directories are scanned again and only changed python scripts are read again")
+    parser.add_argument("--cache-dir",
+                        default=defaults.AUTOJINJA_DEFAULT_CACHE_DIR,
+                        help=f"cache directory used by '--cache' and '--index'. Default value is '{defaults.AUTOJINJA_DEFAULT_CACHE_DIR}'")
+    parser.add_argument("--force",
+                        action="store_true",
+                        help="executes all python scripts even if up-to-date, and refreshes the cache")
+    parser.add_argument("--depfile",
+                        help="writes a Make/Ninja depfile listing all files read by executed python scripts\n"
+                             "(python scripts, environment files, templates, imported local modules, data files)")
+    parser.add_argument("--depfile-target",
+                        action="append",
+                        help="target of the depfile, can be repeated. Default value is all generated files")
+    parser.add_argument("--outputs-file",
+                        help="writes all files generated with 'autojinja.utils.generate_file', one path per line")
+    parser.add_argument("--report",
+                        help="writes a JSON report with the duration, CPU time, maximum memory, exit code and generated files\n"
+                             "of each executed python script, and prints the slowest python scripts")
+    parser.add_argument("--check",
+                        action="store_true",
+                        help="executes all python scripts without writing generated files, prints differences with\n"
+                             "existing files and fails if any generated file is out of date")
+    parser.add_argument("--events",
+                        choices=events.FORMATS,
+                        help="writes structured events to stdout instead of notifications, one JSON object per line ('jsonl')\n"
+                             "Events report started and finished python scripts, generated files and errors")
+    parser.add_argument("--shard",
+                        help="only executes the I-th of N shards of python scripts, to split the execution across N machines\n"
+                             "Shards only depend on relative paths, python scripts depending on each other are kept together")
+    parser.add_argument("--shard-durations",
+                        action="append",
+                        help="balances shards with durations read from reports written by '--report', can be repeated")
 
     args = parser.parse_args(arguments)
 
+    ### Autojinja server
+    if args.serve:
+        daemon.serve(args.socket, args.idle_timeout)
+        return
+    if not args.arguments:
+        parser.error("the following arguments are required: arguments")
+    if args.daemon and not daemon.serving:
+        daemon.forward(arguments, args.socket, args.idle_timeout)
+        return
+
     ### Prepare environment
     env = os.environ.copy()
 
     # Additional environment variables
+    args.envvars = set() # Names, part of the run cache's environment
     if args.env:
-        utils.parse_envvars(env, args.env)
+        utils.parse_envvars(env, args.env, args.envvars)
 
     # Additional import directories
     if args.includes:
@@ -187,19 +320,39 @@ def main(*arguments):
         args.silent = 1
     env[defaults.AUTOJINJA_SILENT] = str(args.silent)
 
+    # check
+    if args.check:
+        env[defaults.AUTOJINJA_CHECK] = "1"
+        args.keep_going = True # Reports all out of date files
+        if args.jobs == None and not args.in_process:
+            args.jobs = 0 # Concurrently
+    elif defaults.AUTOJINJA_CHECK in env:
+        del env[defaults.AUTOJINJA_CHECK]
+
     # summary
+    if args.events:
+        args.summary = "0" # Replaced by events
     if args.summary != None:
         env[defaults.AUTOJINJA_SUMMARY] = str(args.summary)
     args.summary = defaults.osenviron_summary(env)
     env[defaults.AUTOJINJA_SUMMARY] = str(args.summary)
 
-    ### Parse arguments
-    def is_file_tagged(script: path.Path):
-        try:
-            return utils.is_file_tagged(script, args.tag)
-        except Exception:
-            sys.stderr.write(f"[autojinja]  Couldn't read file at path  {script.abspath}\n")
+    event_writer = events.EventWriter() if args.events else None
+    try:
+        run(args, env, event_writer)
+    except Exception as e:
+        if event_writer != None:
+            event_writer.error(str(e))
+        raise
 
+def run(args: argparse.Namespace, env: Dict[str, str], event_writer: Optional[events.EventWriter] = None):
+    """ Resolves and executes python scripts according to the given parsed arguments.
+    """
+    ### Parse arguments
+    shard_index, shard_count = shard.parse(args.shard) if args.shard else (1, 1)
+    index = None
+    if args.index:
+        index = discovery.DiscoveryIndex(path.DirPath(args.cache_dir).join(discovery.INDEX_FILENAME), args.filename, args.tag)
     files: List[path.Path] = []
     for x in [path.Path(x) for x in args.arguments]:
         if x.isfile:
@@ -211,46 +364,74 @@ def main(*arguments):
         else:
             if not args.search_filename and not args.search_tag:
                 raise Exception("Directory arguments require '--search-filename' or '--search-tag'")
-            if args.recursive:
-                for wroot, _, wfiles in os.walk(x):
-                    for script in [path.Path(wroot).join(x) for x in wfiles]:
-                        ## JINJA
-                        if args.search_filename:
-                            if script.filename == args.filename:
-                                files.append(script)
-                        ## PYTHON
-                        if args.search_tag:
-                            if script.ext == ".py":
-                                if is_file_tagged(script):
-                                    files.append(script)
-            else:
-                ## JINJA
-                if args.search_filename:
-                    script = x.join(args.filename)
-                    if script.isfile:
-                        files.append(script)
-                ## PYTHON
-                if args.search_tag:
-                    for script in x.files("*.py"):
-                        if is_file_tagged(script):
-                            files.append(script)
+            files.extend(discovery.discover(x, args.search_filename, args.search_tag, args.recursive, args.filename, args.tag, not args.no_ignore, index=index))
+    if index != None:
+        index.save()
 
     # Make absolute and remove duplicates
     files = [x.abspath for x in files]
     files = list(dict.fromkeys(files))
 
     ### Execute python scripts
-    for script in files:
-        process = subprocess.Popen([sys.executable, "-u", script],
-                                    cwd=script.dirpath,
-                                    env=env,
-                                    stdout = subprocess.PIPE if args.silent else None,
-                                    stderr = subprocess.STDOUT if args.silent else None,
-                                    universal_newlines = True if args.silent else None)
-        out, _ = process.communicate()
-        errcode = process.returncode
-        if errcode != 0:
-            raise Exception(f"{out if args.silent else ''}Error {errcode} while executing script at path \"{script}\"")
+    if daemon.serving and runner.jobs_count(args.jobs) <= 1:
+        args.in_process = True # Keeps jinja2 loaded in the autojinja server
+    script_runner = runner.Runner(env, args.silent, args.jobs, args.keep_going, args.in_process, event_writer=event_writer)
+    envfiles = [x for x in args.env or [] if '=' not in x]
+    if args.depfile or args.outputs_file:
+        if not tracker.is_supported():
+            raise Exception("Options '--depfile' and '--outputs-file' require python 3.8 or later")
+        script_runner.track = True
+    if args.report or args.events:
+        script_runner.track = script_runner.track or tracker.is_supported() # Generated files
+    if args.check:
+        if not tracker.is_supported():
+            raise Exception("Option '--check' requires python 3.8 or later")
+        script_runner.track = True
+    if args.cache:
+        run_cache = cache.RunCache(args.cache_dir, args.envvars) # Files recorded on previous runs, if any
+        graph = schedule.recorded_graph(files, [run_cache.record(x) for x in files])
+    else:
+        graph = schedule.Graph(files)
+    if shard_count > 1:
+        durations = shard.read_durations(args.shard_durations) if args.shard_durations else None
+        files = shard.select(files, shard_index, shard_count, graph, durations)
+    if args.watch:
+        watch.watch(files, script_runner, envfiles, graph=graph)
+        return
+    start = time.perf_counter()
+    if args.cache and not args.check:
+        results = cache.run(files, script_runner, run_cache, args.force, graph)
+        records = [run_cache.record(x) for x in files] # Includes skipped python scripts
+    else:
+        results = script_runner.execute(files, graph)
+        records = { x.script: x.record for x in results }
+        records = [records[x] for x in files if x in records]
+    if args.report:
+        ordered = { x.script: x for x in results }
+        ordered = [ordered[x] for x in files if x in ordered]
+        report.write_report(args.report, ordered, time.perf_counter() - start)
+        if event_writer == None:
+            print(report.format_table(ordered, cwd=os.getcwd()))
+            sys.stdout.flush()
+    if args.check:
+        check_outputs(runner.in_order(results, files), args.silent, script_runner.skipped_messages(files))
+        return
+    script_runner.check(results, files)
+    depfile.write(records, envfiles, args.depfile, args.outputs_file, args.depfile_target)
+
+def check_outputs(results: List[runner.ScriptResult], silent: bool = False, skipped: Optional[List[str]] = None):
+    """ Raises an error reporting failed scripts, skipped scripts and out of date generated files.
+        Differences are printed from the recorded files when silent, as the output of python scripts is discarded.
+    """
+    messages = [x.error_message(silent) for x in results if x.failed] + (skipped or [])
+    for result in results:
+        for filepath, values in (result.record.generated if result.record != None else {}).items():
+            if values["status"] in ["new", "changed"]:
+                if silent and values.get("diff"):
+                    sys.stdout.write(values["diff"])
+                messages.append(f"Generated file at path \"{filepath}\" is out of date (from \"{result.script}\")")
+    if messages:
+        raise Exception("\n".join(messages))
 
 class module_call:
     """ Overrides main() and main.attr
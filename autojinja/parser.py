@@ -321,6 +321,11 @@ class ParserSettings:
     def remove_markers(self, remove_markers: Optional[bool]):
         self._removeMarkers = remove_markers or defaults.osenviron_remove_markers()
 
+    def parsing_key(self) -> Tuple[str, str, str, bool, str, str, str, bool]:
+        """ Returns the settings affecting parsed markers, the other ones only affecting generation.
+        """
+        return (self.cog_open, self.cog_close, self.cog_end, self.cog_as_comment, self.edit_open, self.edit_close, self.edit_end, self.edit_as_comment)
+
 class Parser:
     def __init__(self, string: str, settings: ParserSettings, lineno: Optional[int] = None, column: Optional[int] = None):
         self.string: str = string
@@ -355,13 +360,11 @@ class Parser:
             sections[-1][1] = cog_marker.header_open
             sections.append([cog_marker.header_close, -1])
         sections[-1][1] = len(self.string)
+        linenoidx = -1
+        lineno = 1
         for section in sections:
             idx = section[0]
-            linenoidx = self.string.rfind('\n', 0, idx)
-            if linenoidx < 0:
-                lineno = 1
-            else:
-                lineno = self.string.count('\n', 0, linenoidx) + 1
+            linenoidx, lineno = self.get_lineno(idx, linenoidx, lineno) # Counted from the previous section
             while True:
                 marker = Marker(self.string, True, self.settings.edit_open, self.settings.edit_close, self.settings.edit_end, self.settings.edit_as_comment, True, False, self.lineno, self.column)
                 marker, idx, linenoidx, lineno = self.find_marker(marker, idx, section[1], linenoidx, lineno)
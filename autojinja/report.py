@@ -0,0 +1,62 @@
+"""
+Reports the duration, resource usage and generated files of executed python scripts.
+"""
+
+from . import path
+from . import runner
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+REPORT_VERSION = 1
+DEFAULT_TOP = 10
+
+def entry(result: runner.ScriptResult) -> Dict[str, Any]:
+    """ Returns the report entry of the given script result.
+        Generated files are only known when tracked.
+    """
+    generated = list(result.record.generated.values()) if result.record != None else []
+    written = [x for x in generated if x["status"] != "declared"]
+    changed = [x for x in written if x["status"] != "unchanged"]
+    return { "script": path.no_antislash(result.script),
+             "exit_code": result.errcode,
+             "wall_time": result.wall_time,
+             "cpu_time": result.cpu_time,
+             "max_rss": result.max_rss,
+             "files_written": len(written) if result.record != None else None,
+             "files_changed": len(changed) if result.record != None else None,
+             "bytes_written": sum([x["size"] for x in changed]) if result.record != None else None }
+
+def write_report(filepath: str, results: List[runner.ScriptResult], wall_time: float, cwd: Optional[str] = None):
+    """ Writes the JSON report of the given script results.
+        The current working directory allows reading durations on other machines, see '--shard-durations'.
+    """
+    report = { "version": REPORT_VERSION,
+               "cwd": path.no_antislash(cwd or os.getcwd()),
+               "wall_time": wall_time,
+               "scripts": [entry(x) for x in results] }
+    dirpath = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(dirpath, exist_ok=True)
+    with open(filepath, 'w', encoding = "utf-8") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+def format_table(results: List[runner.ScriptResult], top: int = DEFAULT_TOP, cwd: Optional[str] = None) -> str:
+    """ Returns a table of the slowest python scripts.
+    """
+    entries = sorted([entry(x) for x in results], key=lambda x: x["wall_time"] or 0, reverse=True)[:top]
+    def number(value: Optional[float], format: str) -> str:
+        return "-" if value == None else format.format(value)
+    lines = [f"[autojinja]  {len(entries)} slowest of {len(results)} python scripts",
+             f"{'wall (s)':>10}  {'cpu (s)':>10}  {'rss (MB)':>10}  {'written':>8}  {'changed':>8}  {'exit':>5}  script"]
+    for x in entries:
+        script = path.Path(x["script"]).relpath(cwd) if cwd else x["script"]
+        lines.append(f"{number(x['wall_time'], '{:.3f}'):>10}  "
+                     f"{number(x['cpu_time'], '{:.3f}'):>10}  "
+                     f"{number(None if x['max_rss'] == None else x['max_rss'] / (1024 * 1024), '{:.1f}'):>10}  "
+                     f"{number(x['files_written'], '{}'):>8}  "
+                     f"{number(x['files_changed'], '{}'):>8}  "
+                     f"{x['exit_code']:>5}  "
+                     f"{script}")
+    return "\n".join(lines)
@@ -0,0 +1,347 @@
+"""
+Executes python scripts in dedicated python processes, sequentially or concurrently.
+Python scripts can also be executed inside the current python interpreter.
+"""
+
+from . import defaults
+from . import events
+from . import path
+from . import schedule
+from . import tracker
+
+import concurrent.futures
+import contextlib
+import io
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Set
+
+shared_environments: Dict[Optional[str], Any] = {} # Default jinja2 environments by directory of compiled templates, reused by python scripts executed in-process
+
+class ScriptResult:
+    def __init__(self, script: path.Path, errcode: int, out: Optional[str], err: Optional[str] = None):
+        self.script: path.Path = script
+        self.errcode: int = errcode
+        self.out: Optional[str] = out
+        self.err: Optional[str] = err # Captured separately from out when requested
+        self.record: Optional[tracker.Recorder] = None # Accessed files, when tracked
+        self.wall_time: Optional[float] = None # Seconds
+        self.cpu_time: Optional[float] = None  # Seconds, user and system
+        self.max_rss: Optional[int] = None     # Bytes
+
+    @property
+    def failed(self) -> bool:
+        return self.errcode != 0
+
+    def error_message(self, silent: bool) -> str:
+        """ Returns the error message of a failed script.
+            Captured output is prepended when silent.
+        """
+        out = self.out if silent and self.out else ""
+        return f"{out}Error {self.errcode} while executing script at path \"{self.script}\""
+
+def in_order(results: List[ScriptResult], scripts: List[path.Path]) -> List[ScriptResult]:
+    """ Returns the given results sorted in the order of the given python scripts.
+    """
+    indices = { x: i for i, x in enumerate(scripts) }
+    return sorted(results, key=lambda x: indices.get(x.script, len(indices)))
+
+def jobs_count(jobs: Optional[int]) -> int:
+    """ Returns the number of workers for the given jobs option.
+        0 means as many workers as processors.
+    """
+    if jobs == None:
+        return 1
+    if jobs < 0:
+        raise Exception(f"Expected a positive number of jobs, got {jobs}")
+    if jobs == 0:
+        return os.cpu_count() or 1
+    return jobs
+
+def is_local_module(name: str, module) -> bool:
+    """ Returns True if the given module has been imported from outside the python installation.
+        autojinja and jinja2 modules are never considered local, so that they remain loaded.
+    """
+    if name.split('.', 1)[0] in ["autojinja", "jinja2", "markupsafe"]:
+        return False
+    filepath = getattr(module, "__file__", None)
+    if filepath == None:
+        module_path = getattr(module, "__path__", None)
+        filepath = next(iter(module_path), None) if module_path != None else None
+    return not tracker.is_system_file(filepath)
+
+def exitcode(status: int) -> int:
+    """ Returns the exit code of the given wait status, negative if terminated by a signal.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def max_rss(rusage) -> int:
+    """ Returns the maximum resident set size of the given resource usage, in bytes.
+    """
+    return rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def warm_up():
+    """ Imports autojinja templates once, so that jinja2 and its compiled templates are shared by all python scripts executed in-process.
+    """
+    from . import templates
+    return templates
+
+class Runner:
+    """ Executes python scripts with a bounded pool of workers """
+    def __init__(self, env: Dict[str, str], silent: bool = False, jobs: int = 1, keep_going: bool = False, in_process: bool = False, track: bool = False,
+                 event_writer: Optional[events.EventWriter] = None):
+        self.env: Dict[str, str] = env
+        self.silent: bool = silent
+        self.jobs: int = jobs_count(jobs)
+        self.keep_going: bool = keep_going
+        self.in_process: bool = in_process
+        self.track: bool = track and tracker.is_supported()
+        self.event_writer: Optional[events.EventWriter] = event_writer
+        self.lock = threading.Lock()
+        self.skipped: Dict[path.Path, path.Path] = {} # Python scripts not executed on last execution, with the failed python script causing it
+        if self.in_process and self.jobs > 1:
+            raise Exception("Option '--in-process' executes python scripts sequentially and can't be combined with '--jobs'")
+
+    def run_script(self, script: path.Path, capture: bool, separate_stderr: bool = False) -> ScriptResult:
+        """ Executes the given python script in a new python process.
+            The script's current working directory is set to its directory.
+            stdout and stderr are captured together when requested, or separately with separate_stderr.
+            Accessed files are recorded when tracking is enabled.
+            Resource usage is measured where available (unix).
+        """
+        report = None
+        arguments = [sys.executable, "-u", script]
+        if self.track:
+            fd, report = tempfile.mkstemp(prefix="autojinja-", suffix=".json")
+            os.close(fd)
+            arguments = [sys.executable, "-u", tracker.__file__, report, script]
+        errfile = tempfile.TemporaryFile("w+") if capture and separate_stderr else None # Read after exit, can't fill up like a pipe
+        try:
+            start = time.perf_counter()
+            process = subprocess.Popen(arguments,
+                                       cwd=script.dirpath,
+                                       env=self.env,
+                                       stdout = subprocess.PIPE if capture else None,
+                                       stderr = (errfile or subprocess.STDOUT) if capture else None,
+                                       universal_newlines = True if capture else None)
+            rusage = None
+            if hasattr(os, "wait4"):
+                out = None
+                if capture:
+                    with process.stdout:
+                        out = process.stdout.read()
+                _, status, rusage = os.wait4(process.pid, 0)
+                process.returncode = exitcode(status)
+            else:
+                out, _ = process.communicate()
+            err = None
+            if errfile != None:
+                errfile.seek(0)
+                err = errfile.read()
+            result = ScriptResult(script, process.returncode, out, err)
+            result.wall_time = time.perf_counter() - start
+            if rusage != None:
+                result.cpu_time = rusage.ru_utime + rusage.ru_stime
+                result.max_rss = max_rss(rusage)
+            if report != None:
+                result.record = tracker.Recorder.load(report)
+        finally:
+            if errfile != None:
+                errfile.close()
+            if report != None:
+                os.remove(report)
+        return result
+
+    def run_script_in_process(self, script: path.Path, capture: bool) -> ScriptResult:
+        """ Executes the given python script inside the current python interpreter.
+            The current working directory, sys.path, sys.argv, sys.modules and os.environ are restored after execution.
+            The jinja2 environment and compiled templates remain loaded across python scripts.
+        """
+        templates = warm_up()
+        ### Snapshot interpreter state
+        old_cwd = os.getcwd()
+        old_path = sys.path[:]
+        old_argv = sys.argv[:]
+        old_environ = dict(os.environ)
+        old_modules: Set[str] = set(sys.modules)
+        old_environment = templates.RawTemplate.environment
+        old_dirpaths_used = set(templates.AutoLoader.all_dirpaths_used)
+        ### Prepare interpreter state
+        dirpath = os.path.dirname(script)
+        includes = [x for x in self.env.get("PYTHONPATH", "").split(os.pathsep) if x and x not in sys.path]
+        sys.path[:] = [dirpath, *includes, *old_path]
+        sys.argv[:] = [str(script)]
+        os.environ.clear()
+        os.environ.update(self.env)
+        if old_environment == None:
+            cache_dir = defaults.osenviron_cache_dir()
+            if cache_dir not in shared_environments:
+                shared_environments[cache_dir] = templates.RawTemplate.create_environment()
+            templates.RawTemplate.environment = shared_environments[cache_dir]
+        stringio = io.StringIO() if capture else None
+        recorder = tracker.Recorder() if self.track else None
+        errcode = 0
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            os.chdir(dirpath)
+            with contextlib.ExitStack() as stack:
+                if capture:
+                    stack.enter_context(contextlib.redirect_stdout(stringio))
+                    stack.enter_context(contextlib.redirect_stderr(stringio))
+                if recorder != None:
+                    recorder.start(script)
+                    stack.callback(recorder.stop)
+                try:
+                    runpy.run_path(str(script), run_name="__main__")
+                except SystemExit as e:
+                    if e.code == None:
+                        errcode = 0
+                    elif isinstance(e.code, int):
+                        errcode = e.code
+                    else:
+                        sys.stderr.write(f"{e.code}\n")
+                        errcode = 1
+                except Exception as e:
+                    traceback.print_exc()
+                    errcode = 1
+                    if recorder != None:
+                        recorder.set_error(e)
+                finally:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+        finally:
+            ### Restore interpreter state
+            os.chdir(old_cwd)
+            sys.path[:] = old_path
+            sys.argv[:] = old_argv
+            os.environ.clear()
+            os.environ.update(old_environ)
+            for name in [x for x in sys.modules if x not in old_modules]:
+                if is_local_module(name, sys.modules[name]):
+                    del sys.modules[name]
+            templates.RawTemplate.environment = old_environment
+            templates.AutoLoader.all_dirpaths_used.clear()
+            templates.AutoLoader.all_dirpaths_used.update(old_dirpaths_used)
+        result = ScriptResult(script, errcode, stringio.getvalue() if capture else None)
+        result.record = recorder
+        result.wall_time = time.perf_counter() - start
+        result.cpu_time = time.process_time() - cpu_start
+        return result
+
+    def execute_script(self, script: path.Path, concurrent: bool) -> ScriptResult:
+        if self.event_writer != None: # Output is written as part of the events
+            self.event_writer.script_started(script)
+            result = self.run_script_in_process(script, True) if self.in_process else self.run_script(script, True)
+            self.event_writer.script_finished(result, self.silent)
+            return result
+        if self.in_process:
+            return self.run_script_in_process(script, self.silent)
+        if not concurrent:
+            return self.run_script(script, self.silent)
+        result = self.run_script(script, True, not self.silent)
+        if not self.silent and (result.out or result.err):
+            with self.lock: # Writes output as one unit
+                sys.stdout.write(result.out or "")
+                sys.stdout.flush()
+                sys.stderr.write(result.err or "")
+                sys.stderr.flush()
+        return result
+
+    def execute(self, scripts: List[path.Path], graph: Optional[schedule.Graph] = None) -> List[ScriptResult]:
+        """ Executes the given python scripts and returns their results, in order of completion.
+            Python scripts are executed after the python scripts they depend on in the given graph,
+            and are skipped if one of them fails.
+            Stops at the first failure unless keep_going is enabled.
+            When several scripts are executed concurrently, each script's output is captured and written as one unit.
+        """
+        results: List[ScriptResult] = []
+        if graph != None and graph.has_edges:
+            scripts = graph.order(scripts)
+            prerequisites = graph.subset(scripts)
+        else:
+            prerequisites = { x: set() for x in scripts }
+        failed: Set[path.Path] = set()
+        self.skipped = {}
+        if self.jobs <= 1 or len(scripts) <= 1:
+            positions = { x: i for i, x in enumerate(scripts) }
+            for script in scripts:
+                causes = [x for x in prerequisites[script] if x in failed]
+                if causes:
+                    cause = min(causes, key=positions.__getitem__) # First failed in execution order
+                    failed.add(script)
+                    self.skipped[script] = self.skipped.get(cause, cause)
+                    continue
+                result = self.execute_script(script, False)
+                results.append(result)
+                if result.failed:
+                    failed.add(script)
+                    if not self.keep_going:
+                        break
+        else:
+            dependents: Dict[path.Path, List[path.Path]] = { x: [] for x in scripts }
+            for script, values in prerequisites.items():
+                for prerequisite in values:
+                    dependents[prerequisite].append(script)
+            remaining = { x: len(values) for x, values in prerequisites.items() }
+            def skip(script: path.Path, cause: path.Path):
+                if script not in failed:
+                    failed.add(script)
+                    self.skipped[script] = cause
+                    for dependent in dependents[script]:
+                        skip(dependent, cause)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = { executor.submit(self.execute_script, x, True): x for x in scripts if remaining[x] == 0 }
+                stopped = False
+                while futures:
+                    done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        script = futures.pop(future)
+                        if future.cancelled():
+                            continue
+                        result = future.result()
+                        results.append(result)
+                        if result.failed:
+                            failed.add(script)
+                            if not self.keep_going:
+                                stopped = True
+                                for x in futures:
+                                    x.cancel()
+                        for dependent in dependents[script]:
+                            remaining[dependent] -= 1
+                            if result.failed:
+                                skip(dependent, self.skipped.get(script, script))
+                            if remaining[dependent] == 0 and dependent not in failed and not stopped:
+                                futures[executor.submit(self.execute_script, dependent, True)] = dependent
+        return results
+
+    def skipped_messages(self, scripts: Optional[List[path.Path]] = None) -> List[str]:
+        """ Returns the messages reporting the python scripts skipped on last execution, in the order of the given python scripts if any.
+        """
+        skipped = [x for x in scripts if x in self.skipped] if scripts != None else list(self.skipped)
+        return [f"Skipped script at path \"{x}\" because script at path \"{self.skipped[x]}\" failed" for x in skipped]
+
+    def check(self, results: List[ScriptResult], scripts: Optional[List[path.Path]] = None):
+        """ Raises an error reporting all failed and skipped scripts.
+            Failures are reported in the order of the given python scripts if any, whatever the order of completion.
+        """
+        failures = [x for x in (in_order(results, scripts) if scripts != None else results) if x.failed]
+        messages = [x.error_message(self.silent) for x in failures] + self.skipped_messages(scripts)
+        if messages:
+            raise Exception("\n".join(messages))
+
+    def run(self, scripts: List[path.Path], graph: Optional[schedule.Graph] = None) -> List[ScriptResult]:
+        """ Executes the given python scripts, in the order of the given graph if any.
+            Raises an error if any script fails.
+        """
+        results = self.execute(scripts, graph)
+        self.check(results, scripts)
+        return results
@@ -0,0 +1,146 @@
+"""
+Orders python scripts so that python scripts generating files are executed before the python scripts reading them.
+Files read and generated by each python script are known from:
+    - header pragmas, '# autojinja-inputs: FILES' and '# autojinja-outputs: FILES'
+    - 'autojinja.declare(inputs, outputs)' calls recorded on a previous run
+    - files generated with 'autojinja.utils.generate_file' recorded on a previous run
+"""
+
+from . import path
+from . import tracker
+
+import heapq
+import os
+import shlex
+import sys
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+PRAGMA_INPUTS = "autojinja-inputs:"
+PRAGMA_OUTPUTS = "autojinja-outputs:"
+PRAGMA_MAX_LINES = 50
+
+def read_pragmas(script: str) -> Tuple[List[str], List[str]]:
+    """ Returns the inputs and outputs declared in the header comments of the given python script.
+        Paths are relative to the python script's directory, and separated by spaces (quotes allowed).
+    """
+    inputs: List[str] = []
+    outputs: List[str] = []
+    dirpath = os.path.dirname(os.path.abspath(script))
+    try:
+        with open(script, 'r', encoding = "utf-8") as file:
+            for _, line in zip(range(PRAGMA_MAX_LINES), file):
+                line = line.strip()
+                if not line:
+                    continue
+                if not line.startswith('#'):
+                    break # End of header
+                line = line.lstrip("#").strip()
+                for pragma, filepaths in [(PRAGMA_INPUTS, inputs), (PRAGMA_OUTPUTS, outputs)]:
+                    if line.startswith(pragma):
+                        filepaths += [tracker.normpath(os.path.join(dirpath, x)) for x in shlex.split(line[len(pragma):])]
+    except (OSError, UnicodeDecodeError, ValueError):
+        pass
+    return inputs, outputs
+
+class Graph:
+    """ Producer-consumer graph of python scripts """
+    def __init__(self, scripts: List[str], records: Optional[Iterable[Optional[tracker.Recorder]]] = None, pragmas: bool = True):
+        self.scripts: List[str] = list(scripts)
+        self.prerequisites: Dict[str, Set[str]] = { x: set() for x in self.scripts }
+        inputs: Dict[str, Set[str]] = { x: set() for x in self.scripts }
+        outputs: Dict[str, Set[str]] = { x: set() for x in self.scripts }
+        ### Declared files
+        if pragmas:
+            for script in self.scripts:
+                script_inputs, script_outputs = read_pragmas(script)
+                inputs[script].update(script_inputs)
+                outputs[script].update(script_outputs)
+        ### Previously recorded files
+        if records != None:
+            for script, record in zip(self.scripts, records):
+                if record != None:
+                    inputs[script].update(record.inputs)
+                    outputs[script].update(record.generated)
+        ### Producers
+        producers: Dict[str, Set[str]] = {}
+        for script in self.scripts:
+            for filepath in outputs[script]:
+                producers.setdefault(filepath, set()).add(script)
+        dirpath_producers: List[Tuple[str, str]] = [(x, script) for x, scripts in producers.items() for script in scripts]
+        for script in self.scripts:
+            for filepath in inputs[script]:
+                if filepath.endswith('/'): # Declared directory
+                    self.prerequisites[script].update([x for o, x in dirpath_producers if o.startswith(filepath)])
+                else:
+                    self.prerequisites[script].update(producers.get(filepath, ()))
+            self.prerequisites[script].discard(script)
+
+    @property
+    def has_edges(self) -> bool:
+        return any(self.prerequisites.values())
+
+    def subset(self, scripts: List[str]) -> Dict[str, Set[str]]:
+        """ Returns the prerequisites of the given python scripts, restricted to these python scripts.
+        """
+        included = set(scripts)
+        return { x: set([p for p in self.prerequisites.get(x, ()) if p in included]) for x in scripts }
+
+    def order(self, scripts: Optional[List[str]] = None) -> List[str]:
+        """ Returns the given python scripts in topological order, otherwise keeping their order.
+            Raises an error reporting the involved paths if python scripts depend on each other.
+        """
+        scripts = self.scripts if scripts == None else scripts
+        prerequisites = self.subset(scripts)
+        dependents: Dict[str, List[str]] = { x: [] for x in scripts }
+        for script, values in prerequisites.items():
+            for prerequisite in values:
+                dependents[prerequisite].append(script)
+        position = { x: i for i, x in enumerate(scripts) }
+        remaining = { x: len(values) for x, values in prerequisites.items() }
+        ready = [position[x] for x in scripts if remaining[x] == 0]
+        heapq.heapify(ready)
+        result: List[str] = []
+        while ready:
+            script = scripts[heapq.heappop(ready)]
+            result.append(script)
+            for dependent in dependents[script]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, position[dependent])
+        if len(result) != len(scripts):
+            cycle = find_cycle({ x: v for x, v in prerequisites.items() if remaining[x] > 0 })
+            raise Exception("Dependency cycle between python scripts:\n" + "\n".join([f"    {x}" for x in cycle]))
+        return result
+
+def recorded_graph(scripts: List[str], records: Iterable[Optional[tracker.Recorder]]) -> Graph:
+    """ Returns the graph of the given python scripts, including the files recorded on their previous runs.
+        Recorded files may be out of date, so they are ignored with a warning if they introduce a dependency cycle.
+    """
+    graph = Graph(scripts, records)
+    try:
+        graph.order()
+        return graph
+    except Exception as e:
+        message = str(e)
+    declared = Graph(scripts)
+    try:
+        declared.order()
+    except Exception:
+        return declared # Declared cycle, reported on execution
+    sys.stderr.write(f"[autojinja]  warning  ignoring files recorded on previous runs\n{message}\n")
+    sys.stderr.flush()
+    return declared
+
+def find_cycle(prerequisites: Dict[str, Set[str]]) -> List[str]:
+    """ Returns a cycle among the given python scripts, the first python script being repeated at the end.
+    """
+    script = next(iter(prerequisites))
+    visited: Dict[str, int] = {}
+    chain: List[str] = []
+    while script not in visited:
+        visited[script] = len(chain)
+        chain.append(script)
+        script = min([x for x in prerequisites[script] if x in prerequisites]) # Each remaining python script has a remaining prerequisite
+    cycle = chain[visited[script]:]
+    cycle.reverse() # Producers first
+    return [*cycle, cycle[0]]
@@ -0,0 +1,89 @@
+"""
+Splits python scripts into N shards, so that they can be executed on N machines.
+The partition only depends on the paths of the python scripts relatively to the current working directory,
+and optionally on their durations from a previous report, so that all machines compute the same partition.
+Python scripts depending on each other are kept in the same shard.
+"""
+
+from . import path
+from . import schedule
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+def parse(value: str) -> Tuple[int, int]:
+    """ Returns the (index, count) of the given 'I/N' value, index starting from 1.
+    """
+    try:
+        index, count = [int(x) for x in value.split('/')]
+    except ValueError:
+        index, count = 0, 0
+    if count < 1 or index < 1 or index > count:
+        raise Exception(f"Expected I/N with 1 <= I <= N for option '--shard', got '{value}'")
+    return index, count
+
+def relpath(script: str, cwd: Optional[str] = None) -> str:
+    """ Returns the path of the given python script relatively to the given directory, with slashes.
+    """
+    return path.no_antislash(os.path.relpath(script, cwd or os.getcwd()))
+
+def stable_hash(script: str, cwd: Optional[str] = None) -> int:
+    """ Returns a hash of the given python script's relative path, identical on all machines.
+    """
+    return int.from_bytes(hashlib.sha256(relpath(script, cwd).encode("utf-8")).digest()[:8], "big")
+
+def read_durations(filepaths: List[str]) -> Dict[str, float]:
+    """ Returns the durations of python scripts written to the given reports, by relative path.
+        Reports that don't exist or are invalid are ignored.
+    """
+    durations: Dict[str, float] = {}
+    for filepath in filepaths:
+        try:
+            with open(filepath, 'r', encoding = "utf-8") as file:
+                values = json.load(file)
+            durations.update({ relpath(x["script"], values.get("cwd")): x["wall_time"] for x in values["scripts"] if x.get("wall_time") != None })
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    return durations
+
+def groups(scripts: List[str], graph: Optional[schedule.Graph] = None) -> List[List[str]]:
+    """ Returns the given python scripts grouped by connected dependencies, each group keeping the given order.
+    """
+    parents = { x: x for x in scripts }
+    def find(script: str) -> str:
+        while parents[script] != script:
+            parents[script] = parents[parents[script]]
+            script = parents[script]
+        return script
+    if graph != None:
+        for script, prerequisites in graph.subset(scripts).items():
+            for prerequisite in prerequisites:
+                parents[find(prerequisite)] = find(script)
+    result: Dict[str, List[str]] = {}
+    for script in scripts:
+        result.setdefault(find(script), []).append(script)
+    return list(result.values())
+
+def select(scripts: List[str], index: int, count: int, graph: Optional[schedule.Graph] = None, durations: Optional[Dict[str, float]] = None, cwd: Optional[str] = None) -> List[str]:
+    """ Returns the python scripts of the given shard, keeping their order.
+        Without durations, each group of python scripts is assigned by hash of its first relative path.
+        With durations, groups are assigned from the longest to the least loaded shard,
+        python scripts without duration being assumed to last the average duration.
+    """
+    keys = { x: relpath(x, cwd) for x in scripts }
+    parts = sorted([sorted(x, key=lambda x: keys[x]) for x in groups(scripts, graph)], key=lambda x: keys[x[0]])
+    if not durations:
+        selected = set([x for part in parts if stable_hash(part[0], cwd) % count == index-1 for x in part])
+    else:
+        average = sum(durations.values()) / len(durations)
+        weights = [sum([durations.get(keys[x], average) for x in part]) for part in parts]
+        loads = [0.0] * count
+        selected = set()
+        for i in sorted(range(len(parts)), key=lambda i: (-weights[i], keys[parts[i][0]])):
+            shard = min(range(count), key=lambda x: (loads[x], x))
+            loads[shard] += weights[i]
+            if shard == index-1:
+                selected.update(parts[i])
+    return [x for x in scripts if x in selected]
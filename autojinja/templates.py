@@ -1,64 +1,45 @@
+from . import __version__
+from . import defaults
+from . import environment
 from . import exceptions
 from . import path
 from . import parser
+from . import tracker
 from . import utils
 
-from collections import OrderedDict
-import importlib.util
+from collections import ChainMap, OrderedDict, namedtuple
+import asyncio
+import concurrent.futures
+import hashlib
 import inspect
 import io
+import os
+import re
 import sys
+import tempfile
+import threading
+import weakref
 from types import CodeType, MethodType
-from typing import Any, Callable, Dict, Generic, List, MutableMapping, Optional, Set, Tuple, Type, TypeVar, Union
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Mapping, MutableMapping, Optional, Set, Tuple, Type, TypeVar, Union
 
 ###
 ### jinja2 API
 ###
 
-### Huge hack that modifies jinja2.environment.getattr and jinja2.environment.getitem methods to avoid UndefinedErrors with properties.
-### We can't simply replace the methods, as the stacktraces of the exceptions won't be located in jinja2 module and won't work.
-
-def modify_and_import(module_name: str, package: str, modification_func: Callable[[str], str]):
-    spec = importlib.util.find_spec(module_name, package)
-    source = spec.loader.get_source(module_name)
-    new_source = modification_func(source)
-    module = importlib.util.module_from_spec(spec)
-    codeobj = compile(new_source, module.__spec__.origin, "exec")
-    exec(codeobj, module.__dict__)
-    sys.modules[module_name] = module
-
-def modification_func(src: str) -> str:
-    src = src.replace("def getattr", """def getattr(self, obj, attribute):
-        try:
-            return getattr(obj, attribute)
-        except AttributeError as e:
-            try:
-                return obj[attribute]
-            except Exception:
-                pass
-            raise e
-    def oldgetattr""")
-    src = src.replace("def getitem", """def getitem(self, obj, argument):
-        try:
-            return obj[argument]
-        except (AttributeError, TypeError, LookupError):
-            if isinstance(argument, str):
-                try:
-                    attr = str(argument)
-                except Exception:
-                    pass
-                else:
-                    return getattr(obj, attr)
-            return self.undefined(obj=obj, name=argument)
-    def oldgetitem""")
-    return src
-
-modify_and_import("jinja2.environment", None, modification_func)
 import jinja2
-importlib.reload(jinja2)
+import jinja2.bccache
+import jinja2.defaults
+import jinja2.runtime
+import jinja2.utils
 from jinja2.nodes import Template as Jinja2TemplateNode
 
-class CustomEnvironment(jinja2.Environment):
+DEFAULT_CODE_CACHE_SIZE = 400
+DEFAULT_PARSE_CACHE_SIZE = 400
+DEFAULT_PARSE_CACHE_CHARS = 4 * 1024 * 1024 # Total length of cached bodies
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+class CustomEnvironment(environment.PropertyEnvironment):
     """ The core component of Jinja is the `Environment`. It contains
         important shared variables like configuration, filters, tests,
         globals and others. Instances of this class may be modified if
@@ -66,9 +47,14 @@ class CustomEnvironment(jinja2.Environment):
         Modifications on environments after the first template was loaded
         will lead to surprising effects and undefined behavior.
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, code_cache_size: int = DEFAULT_CODE_CACHE_SIZE, **kwargs):
         super().__init__(*args, **kwargs)
-                   
+        ### Compiled code objects, shared by templates with the same source
+        self.code_cache: Optional[jinja2.utils.LRUCache] = jinja2.utils.LRUCache(code_cache_size) if code_cache_size > 0 else None
+        self.code_cache_size: int = code_cache_size
+        self.code_cache_hits: int = 0
+        self.code_cache_misses: int = 0
+
     def from_string(self, source: Union[str, Jinja2TemplateNode], globals: Optional[MutableMapping[str, Any]] = None, template_class: Optional[Type[jinja2.Template]] = None, filename: Optional[str] = None, lineno: Optional[int] = None) -> jinja2.Template:
         """ Load a template from a source string without using
             :attr:`loader`.
@@ -82,7 +68,7 @@ class CustomEnvironment(jinja2.Environment):
         """
         gs = self.make_globals(globals)
         cls = template_class or self.template_class
-        template = cls.from_code(self, self.compile(source, None, filename, None, False, lineno), gs, None)
+        template = cls.from_code(self, self.compile_cached(source, filename, lineno), gs, None)
         ### Custom lineno method
         template.old_get_corresponding_lineno = template.get_corresponding_lineno
         parent_lineno = lineno or 1
@@ -91,6 +77,78 @@ class CustomEnvironment(jinja2.Environment):
         template.get_corresponding_lineno = MethodType(new_get_corresponding_lineno, template)
         return template
     
+    def compile_cached(self, source: Union[str, Jinja2TemplateNode], filename: Optional[str] = None, lineno: Optional[int] = None) -> CodeType:
+        """ Compiles the given source, reusing the code object previously compiled for the same source and filename.
+            The compiled code doesn't depend on the line offset nor on the globals, which are applied to each template,
+            but depends on the environment settings, which are part of the key.
+            Code objects are also loaded from and stored to the bytecode cache, if any.
+        """
+        if not isinstance(source, str):
+            return self.compile(source, None, filename, None, False, lineno)
+        key = (source, filename, environment_key(self))
+        if self.code_cache != None:
+            code = self.code_cache.get(key)
+            if code != None:
+                self.code_cache_hits += 1
+                return code
+            self.code_cache_misses += 1
+        bucket = None
+        code = None
+        if self.bytecode_cache != None:
+            bucket = self.bytecode_cache.get_bucket(self, string_template_name(source), filename, source)
+            code = bucket.code
+        if code == None:
+            code = self.compile(source, None, filename, None, False, lineno)
+            if bucket != None:
+                bucket.code = code
+                self.bytecode_cache.set_bucket(bucket)
+        if self.code_cache != None:
+            self.code_cache[key] = code
+        return code
+
+    def overlay(self, *args, **kwargs) -> "CustomEnvironment":
+        """ Create a new overlay environment that shares all the data with the
+            current environment except for cache and the overridden attributes.
+            The overlay compiles its own code objects, as its settings may produce different code.
+        """
+        rv: CustomEnvironment = super().overlay(*args, **kwargs)
+        rv.code_cache = jinja2.utils.LRUCache(self.code_cache_size) if self.code_cache_size > 0 else None
+        rv.code_cache_hits = 0
+        rv.code_cache_misses = 0
+        return rv
+
+    def _load_template(self, name: str, globals: Optional[MutableMapping[str, Any]]) -> jinja2.Template:
+        """ Loads a template like jinja2, except that templates of an AutoLoader are cached by resolved filepath,
+            as the same name resolves to different files depending on the directories used by each python script.
+            Templates reused from the cache are still recorded as read by the executing python script.
+        """
+        if not isinstance(self.loader, AutoLoader) or self.cache == None:
+            return super()._load_template(name, globals)
+        filepath = self.loader.resolve(name)
+        if filepath == None:
+            raise jinja2.TemplateNotFound(name)
+        cache_key = (weakref.ref(self.loader), filepath)
+        template = self.cache.get(cache_key)
+        if template != None and (not self.auto_reload or template.is_up_to_date):
+            if globals:
+                template.globals.update(globals)
+            tracker.declare(inputs=[filepath])
+            return template
+        template = self.loader.load(self, name, self.make_globals(globals))
+        self.cache[cache_key] = template
+        return template
+
+    def code_cache_info(self) -> "CacheInfo":
+        """ Returns the statistics of the compiled code cache, like functools.lru_cache.
+        """
+        return CacheInfo(self.code_cache_hits, self.code_cache_misses, self.code_cache_size, len(self.code_cache) if self.code_cache != None else 0)
+
+    def code_cache_clear(self):
+        if self.code_cache != None:
+            self.code_cache.clear()
+        self.code_cache_hits = 0
+        self.code_cache_misses = 0
+
     def compile(self, source: Union[str, Jinja2TemplateNode], name: Optional[str] = None, filename: Optional[str] = None, raw: bool = False, defer_init: bool = False, lineno: Optional[int] = None) -> Union[str, CodeType]:
         """ Compile a node or template source code. The `name` parameter is
             the load name of the template after it was joined using
@@ -127,6 +185,103 @@ class CustomEnvironment(jinja2.Environment):
                 e.lineno += lineno-1
             self.handle_exception(source=source_hint)
 
+# Environment settings affecting the lexer and the generated code
+ENVIRONMENT_KEY_SETTINGS = ["block_start_string", "block_end_string", "variable_start_string", "variable_end_string",
+                            "comment_start_string", "comment_end_string", "line_statement_prefix", "line_comment_prefix",
+                            "trim_blocks", "lstrip_blocks", "newline_sequence", "keep_trailing_newline",
+                            "optimized", "is_async", "autoescape", "finalize"]
+
+def environment_key(environment: jinja2.Environment) -> str:
+    """ Returns a hash of the settings of the given environment affecting compiled templates.
+        Callable settings are identified by their qualified name, so that the hash is the same across processes.
+    """
+    values = []
+    for name in ENVIRONMENT_KEY_SETTINGS:
+        value = getattr(environment, name, None)
+        if callable(value):
+            value = f"{getattr(value, '__module__', None)}.{getattr(value, '__qualname__', type(value).__qualname__)}"
+        values.append(value)
+    values.append(sorted(environment.extensions))
+    return hashlib.sha256(repr(values).encode('utf-8')).hexdigest()[:16]
+
+# Constructor options of jinja2 environments, sent to worker processes along with templates
+ENVIRONMENT_OPTIONS = ["block_start_string", "block_end_string", "variable_start_string", "variable_end_string",
+                       "comment_start_string", "comment_end_string", "line_statement_prefix", "line_comment_prefix",
+                       "trim_blocks", "lstrip_blocks", "newline_sequence", "keep_trailing_newline",
+                       "optimized", "undefined", "finalize", "autoescape", "auto_reload"]
+
+def environment_options(environment: Optional[jinja2.Environment]) -> Optional[Dict[str, Any]]:
+    """ Returns the options to create an environment like the given one in another process, None for the default environment.
+        Filters, tests and globals added to jinja2 defaults are included and must be picklable.
+        Loaders and bytecode caches aren't included, they are created again like for the default environment.
+    """
+    if environment == None:
+        return None
+    options = { x: getattr(environment, x) for x in ENVIRONMENT_OPTIONS }
+    options["extensions"] = [type(x) for x in environment.extensions.values()]
+    options["enable_async"] = environment.is_async
+    options["cache_size"] = getattr(environment.cache, "capacity", -1) if environment.cache != None else 0
+    options["code_cache_size"] = getattr(environment, "code_cache_size", DEFAULT_CODE_CACHE_SIZE)
+    options["filters"] = { k: v for k, v in environment.filters.items() if jinja2.defaults.DEFAULT_FILTERS.get(k) is not v }
+    options["tests"] = { k: v for k, v in environment.tests.items() if jinja2.defaults.DEFAULT_TESTS.get(k) is not v }
+    options["globals"] = { k: v for k, v in environment.globals.items() if jinja2.defaults.DEFAULT_NAMESPACE.get(k) is not v }
+    return options
+
+option_environments: List[Tuple[Dict[str, Any], CustomEnvironment]] = [] # Environments created from options, reused by templates unpickled with the same options
+
+def environment_from_options(options: Optional[Dict[str, Any]]) -> CustomEnvironment:
+    """ Returns the shared environment if it has the given options.
+        Otherwise returns an environment created from the given options, once per process.
+    """
+    if RawTemplate.environment == None:
+        RawTemplate.environment = RawTemplate.create_environment()
+    if options == None or environment_options(RawTemplate.environment) == options:
+        return RawTemplate.environment
+    for values, environment in option_environments:
+        if values == options:
+            return environment
+    environment = RawTemplate.create_environment(**{ k: v for k, v in options.items() if k not in ["filters", "tests", "globals"] })
+    environment.filters.update(options["filters"])
+    environment.tests.update(options["tests"])
+    environment.globals.update(options["globals"])
+    option_environments.append((options, environment))
+    return environment
+
+def string_template_name(source: str) -> str:
+    """ Returns the name of a template created from the given source, for bytecode caches.
+    """
+    return f"<string>:{hashlib.sha256(source.encode('utf-8')).hexdigest()}"
+
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+    """ Jinja2 bytecode cache storing compiled templates in a directory shared by python scripts and processes.
+        Cache keys include autojinja and jinja2 versions, so that compiled templates are invalidated on upgrades.
+    """
+    def __init__(self, directory: str):
+        super().__init__(directory, f"{tracker.BYTECODE_CACHE_PREFIX}%s.cache")
+
+    def get_cache_key(self, name: str, filename: Optional[str] = None) -> str:
+        return super().get_cache_key(f"{__version__}|{jinja2.__version__}|{name}", filename)
+
+    def get_bucket(self, environment: jinja2.Environment, name: str, filename: Optional[str], source: str) -> jinja2.bccache.Bucket:
+        name = f"{name}:{environment_key(environment)}" # Code differs with other delimiters, whitespace settings or async
+        return super().get_bucket(environment, name, filename, source)
+
+    def dump_bytecode(self, bucket: jinja2.bccache.Bucket):
+        """ Writes compiled templates to a temporary file renamed afterwards, so that concurrent processes never read partial files.
+            Compiled templates aren't cached if the directory isn't writable.
+        """
+        filename = self._get_cache_filename(bucket)
+        tmp = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(filename), suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, 'wb') as file:
+                bucket.write_bytecode(file)
+            os.replace(tmp, filename)
+        except OSError:
+            if tmp != None and os.path.exists(tmp):
+                os.remove(tmp)
+
 class AutoLoader(jinja2.BaseLoader):
     """ Jinja2 loader to find templates near already loaded templates """
     all_dirpaths_used: Set[path.Path] = set()
@@ -154,19 +309,123 @@ class AutoLoader(jinja2.BaseLoader):
             old state somewhere (for example in a closure). If it returns `False`
             the template will be reloaded.
         """
+        filepath = self.resolve(template)
+        if filepath == None:
+            raise jinja2.TemplateNotFound(template)
+        with open(filepath) as f:
+            source = f.read()
+        mtime = path.getmtime(filepath)
+        return source, filepath, lambda: mtime == path.getmtime(filepath)
+
+    def resolve(self, template: str) -> Optional[path.Path]:
+        """ Returns the filepath of the given template name, found in the directories of already loaded templates.
+        """
         for dirpath in AutoLoader.all_dirpaths_used:
             filepath = dirpath.join(template)
             if filepath.exists:
-                with open(filepath) as f:
-                    source = f.read()
-                mtime = path.getmtime(filepath)
-                return source, filepath, lambda: mtime == path.getmtime(filepath)
-        raise jinja2.TemplateNotFound(template)
+                return filepath.abspath # Relative directories depend on the current working directory
+        return None
 
 ###
 ### autojinja API
 ###
 
+### Variables layered by contexts, rendered without being copied
+
+def context_layers(kwargs: Mapping[str, Any]) -> List[Mapping[str, Any]]:
+    """ Returns the layers of the given variables, the first ones taking precedence.
+    """
+    return kwargs.maps if isinstance(kwargs, ChainMap) else [kwargs]
+
+def new_jinja2_context(template: jinja2.Template, args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> jinja2.runtime.Context:
+    """ Returns a jinja2 context viewing the given variables on top of the template's globals.
+        Positional variables are merged like jinja2.Template.render, keyword variables taking precedence.
+    """
+    layers = context_layers(kwargs)
+    if len(args) > 0:
+        layers = [*layers, dict(*args)]
+    return template.new_context(ChainMap(*layers, *context_layers(template.globals)), shared = True)
+
+def render_jinja2(template: jinja2.Template, args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> str:
+    """ Renders like jinja2.Template.render, without flattening the given variables into a new dictionary.
+    """
+    context = new_jinja2_context(template, args, kwargs)
+    try:
+        return template.environment.concat(template.root_render_func(context))
+    except Exception:
+        return template.environment.handle_exception()
+
+def generate_jinja2(template: jinja2.Template, args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> Iterator[str]:
+    """ Renders like jinja2.Template.generate, without flattening the given variables into a new dictionary.
+    """
+    context = new_jinja2_context(template, args, kwargs)
+    try:
+        yield from template.root_render_func(context)
+    except Exception:
+        yield template.environment.handle_exception()
+
+async def render_jinja2_async(template: jinja2.Template, args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> str:
+    """ Renders like jinja2.Template.render_async, without flattening the given variables into a new dictionary.
+    """
+    context = new_jinja2_context(template, args, kwargs)
+    try:
+        return template.environment.concat([x async for x in template.root_render_func(context)])
+    except Exception:
+        return template.environment.handle_exception()
+
+async def resolve_awaitables(args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> Tuple[Tuple[Any, ...], Mapping[str, Any]]:
+    """ Returns the given variables where awaitable values are replaced by their results, awaited concurrently.
+        Resolved keyword variables are layered on top of the given ones, which aren't copied.
+    """
+    names = list(kwargs)
+    values = [*args, *[kwargs[x] for x in names]]
+    indices = [i for i, x in enumerate(values) if inspect.isawaitable(x)]
+    if len(indices) == 0:
+        return args, kwargs
+    results = await asyncio.gather(*[values[i] for i in indices])
+    for i, result in zip(indices, results):
+        values[i] = result
+    resolved = { names[i-len(args)]: values[i] for i in indices if i >= len(args) }
+    return tuple(values[:len(args)]), ChainMap(resolved, *context_layers(kwargs))
+
+async def run_in_thread(function: Callable[..., Any], *args: Any) -> Any:
+    """ Calls the given function in the default thread pool of the running event loop.
+        Inside a coroutine, get_event_loop returns the running event loop, like get_running_loop from python 3.7.
+    """
+    return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+### Worker processes of Template.render_many
+
+render_worker_template: Optional["Template"] = None
+
+def init_render_worker(options: Optional[Dict[str, Any]], template: "Template"):
+    """ Initializes a worker process with the shared environment of the calling process, given by its options,
+        and with the given template, unpickled and compiled once per process.
+    """
+    global render_worker_template
+    RawTemplate.environment = environment_from_options(options)
+    render_worker_template = template
+    os.environ[defaults.AUTOJINJA_SUMMARY] = "0" # Printed by the calling process
+
+def render_worker(args: Tuple[Any, ...], kwargs: Mapping[str, Any], output: str, init_args: Optional[Tuple[Any, ...]] = None) -> Tuple[Optional[str], Dict[str, Any], Optional[Tuple[Exception, str]]]:
+    """ Renders the worker's template to the given output.
+        init_args are given with each output when worker processes can't be initialized, before python 3.7.
+        Returns the status of the output, the files recorded meanwhile for the calling process's trackers,
+        and the raised exception if any, with its message including the Jinja2 traceback which isn't picklable.
+    """
+    if init_args != None:
+        init_render_worker(*init_args)
+    recorder = tracker.Recorder()
+    recorder.start()
+    try:
+        status = render_worker_template.render_output(render_worker_template.context(*args, **kwargs), output)
+        return status, recorder.to_dict(), None
+    except Exception as e:
+        message = str(exceptions.clean_traceback(e))
+        return None, recorder.to_dict(), (e.with_traceback(None), message)
+    finally:
+        recorder.stop()
+
 class Template:
     @staticmethod
     def from_file(*args, **kwargs) -> "Template":
@@ -178,39 +437,117 @@ class Template:
     def context(__autojinja_self__, *args, **kwargs) -> "Context[Template]":
         raise NotImplementedError() # To override
 
+    def render_many(self, items: Iterable[Tuple[Any, Optional[str]]], executor: Optional[str] = None, max_workers: Optional[int] = None) -> Dict[str, str]:
+        """ Renders the template to many outputs, each with its own variables.
+            Variables are given as a context of this template or as a dictionary, the output defaults to the template's output.
+            Outputs are rendered in order by default. With the 'thread' executor, they are read, rendered and written from a thread pool.
+            With the 'process' executor, the template and the options of its environment are sent once to each worker process,
+            the variables, filters, tests and globals must then be picklable.
+            Returns the status of each output, either 'new', 'changed' or 'unchanged'.
+            Raises an error if an output is given more than once.
+        """
+        error: Optional[Tuple[Exception, str]] = None # Raised by a worker process
+        try:
+            contexts: List[Tuple[Context, str]] = []
+            outputs: Set[str] = set()
+            for variables, output in items:
+                output = output or self.output
+                assert output != None, "output filepath parameter can't be None"
+                if path.Path(output).abspath in outputs:
+                    raise Exception(f"Output at path \"{output}\" is rendered more than once")
+                outputs.add(path.Path(output).abspath)
+                if isinstance(variables, Context):
+                    contexts.append((variables, output))
+                elif isinstance(variables, dict):
+                    contexts.append((self.context(**variables), output))
+                else:
+                    raise TypeError(f"Expected a context or a dictionary of variables, got '{type(variables).__name__}'")
+            ### Render
+            if executor == None:
+                statuses = [self.render_output(context, output) for context, output in contexts]
+            elif executor == "thread":
+                with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+                    statuses = list(pool.map(lambda x: self.render_output(*x), contexts))
+            elif executor == "process":
+                init_args = (environment_options(RawTemplate.environment), self)
+                if sys.version_info >= (3, 7):
+                    pool = concurrent.futures.ProcessPoolExecutor(max_workers, initializer=init_render_worker, initargs=init_args)
+                    init_args = None
+                else:
+                    pool = concurrent.futures.ProcessPoolExecutor(max_workers)
+                with pool:
+                    results = list(pool.map(render_worker, [x.args for x, _ in contexts], [x.kwargs for x, _ in contexts], [x for _, x in contexts], [init_args] * len(contexts)))
+                statuses = []
+                for (_, output), (status, record, error) in zip(contexts, results):
+                    tracker.merge(record)
+                    if error != None:
+                        break
+                    utils.print_summary(path.Path(output).abspath, status == "new", status == "changed")
+                    statuses.append(status)
+            else:
+                raise Exception(f"Expected 'thread' or 'process' for executor parameter, got '{executor}'")
+            if error == None:
+                return dict(zip([x for _, x in contexts], statuses))
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+        raise exceptions.wrap_exception(*error) from None # Traceback already cleaned by the worker process
+
+    def render_output(self, context: "Context", output: str) -> str:
+        raise NotImplementedError() # To override
+
     def render_file(self, *args, **kwargs) -> str:
         raise NotImplementedError() # To override
     def render(self) -> str:
         raise NotImplementedError() # To override
+    def stream_file(self, *args, **kwargs) -> str:
+        raise NotImplementedError() # To override
+    def render_chunks(self, *args, **kwargs) -> Iterator[str]:
+        raise NotImplementedError() # To override
+    async def render_file_async(self, *args, **kwargs) -> str:
+        raise NotImplementedError() # To override
+    async def render_async(self, *args, **kwargs) -> str:
+        raise NotImplementedError() # To override
 
 _Template = TypeVar("_Template")
 
 class Context(Generic[_Template]):
-    def __init__(self, template: _Template, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def __init__(self, template: _Template, args: Tuple[Any, ...] = (), kwargs: Mapping[str, Any] = {}):
         self.template: _Template = template
         self.args: Tuple[Any, ...] = args
-        self.kwargs: Dict[str, Any] = kwargs
+        self.kwargs: Mapping[str, Any] = kwargs
 
     def context(__autojinja_self__, *args, **kwargs) -> "Context[_Template]":
         raise NotImplementedError() # To override
 
-    def update(__autojinja_self__, *args, **kwargs) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+    def update(__autojinja_self__, *args, **kwargs) -> Tuple[Tuple[Any, ...], Mapping[str, Any]]:
+        """ Returns the variables of this context extended with the given ones.
+            New keyword variables are layered on top of the previous ones, which are shared instead of copied.
+        """
         if "self" in kwargs:
             kwargs["this"] = kwargs["self"] # Avoid conflict with Jinja2
             del kwargs["self"]
         new_args = __autojinja_self__.args + args
-        new_kwargs = __autojinja_self__.kwargs.copy()
-        new_kwargs.update(kwargs)
+        new_kwargs = ChainMap(kwargs, *context_layers(__autojinja_self__.kwargs))
         return (new_args, new_kwargs)
 
     def render_file(self, *args, **kwargs) -> str:
         raise NotImplementedError() # To override
     def render(self, *args, **kwargs) -> str:
         raise NotImplementedError() # To override
+    def stream_file(self, *args, **kwargs) -> str:
+        raise NotImplementedError() # To override
+    def render_chunks(self, *args, **kwargs) -> Iterator[str]:
+        raise NotImplementedError() # To override
+    async def render_file_async(self, *args, **kwargs) -> str:
+        raise NotImplementedError() # To override
+    async def render_async(self, *args, **kwargs) -> str:
+        raise NotImplementedError() # To override
 
 class RawTemplate(Template):
     """ Shared Jinja2 environment """
     environment: CustomEnvironment = None
+    """ Overlay of the shared Jinja2 environment for async rendering """
+    async_environment: CustomEnvironment = None
 
     @staticmethod
     def create_loader(additional_dirpaths: Optional[List[str]] = None) -> AutoLoader:
@@ -228,20 +565,43 @@ class RawTemplate(Template):
             kwargs["trim_blocks"] = True
         if "undefined" not in kwargs:
             kwargs["undefined"] = jinja2.StrictUndefined
+        if "bytecode_cache" not in kwargs:
+            cache_dir = defaults.osenviron_cache_dir()
+            if cache_dir != None:
+                kwargs["bytecode_cache"] = BytecodeCache(cache_dir)
         return CustomEnvironment(*args, **kwargs)
 
-    def __init__(self, string: str, input: Optional[str] = None, output: Optional[str] = None, encoding: Optional[str] = None, newline: Optional[str] = None, globals: Optional[Dict[str, Any]] = None, lineno: Optional[int] = None):
+    @staticmethod
+    def get_async_environment() -> CustomEnvironment:
+        """ Returns the async overlay of the shared Jinja2 environment, created again if the shared environment changes.
+        """
         if RawTemplate.environment == None:
             RawTemplate.environment = RawTemplate.create_environment()
-        jinja2_template: jinja2.Template = RawTemplate.environment.from_string(string, globals, None, input or exceptions.format_text(string), lineno)
+        if RawTemplate.async_environment == None or RawTemplate.async_environment.linked_to is not RawTemplate.environment:
+            async_environment = RawTemplate.environment.overlay(enable_async=True)
+            async_environment.is_async = True # Not applied by overlay before jinja2 3.1.5
+            if async_environment.cache != None:
+                async_environment.cache.clear() # Sync templates loaded by the shared environment
+            RawTemplate.async_environment = async_environment
+        return RawTemplate.async_environment
+
+    def __init__(self, string: str, input: Optional[str] = None, output: Optional[str] = None, encoding: Optional[str] = None, newline: Optional[str] = None, globals: Optional[Dict[str, Any]] = None, lineno: Optional[int] = None, environment: Optional[CustomEnvironment] = None):
+        if environment == None:
+            if RawTemplate.environment == None:
+                RawTemplate.environment = RawTemplate.create_environment()
+            environment = RawTemplate.environment
+        jinja2_template: jinja2.Template = environment.from_string(string, globals, None, input or exceptions.format_text(string), lineno)
         if input != None:
             AutoLoader.all_dirpaths_used.add(path.Path(input).dirpath)
         self.jinja2_template: jinja2.Template = jinja2_template
+        self.async_jinja2_template: Optional[jinja2.Template] = None # Compiled on first async render
         self.string: str = string
         self.input: Optional[str] = input
         self.output: Optional[str] = output
         self.encoding: Optional[str] = encoding
         self.newline : Optional[str] = newline
+        self.lineno: Optional[int] = lineno
+        self.user_globals: Optional[Dict[str, Any]] = globals # Without the environment's globals
 
     def __getattribute__(self, attr: str):
         try:
@@ -283,9 +643,49 @@ class RawTemplate(Template):
             return self.context().render()
         except Exception as e:
             raise exceptions.clean_traceback(e) from None
+    def stream_file(self, output: Optional[str] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        try:
+            return self.context().stream_file(output, encoding, newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    def render_chunks(self) -> Iterator[str]:
+        return self.context().render_chunks()
+    async def render_file_async(self, output: Optional[str] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        try:
+            return await self.context().render_file_async(output, encoding, newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    async def render_async(self) -> str:
+        try:
+            return await self.context().render_async()
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+
+    def render_output(self, context: "RawTemplateContext", output: str) -> str:
+        """ Renders the given context to the given output, and returns the status of the output.
+        """
+        result = context.render()
+        return utils.generate_file(output, result, None, self.encoding, self.newline)
+
+    def __reduce__(self):
+        options = environment_options(self.jinja2_template.environment)
+        return (unpickle_raw_template, (options, self.string, self.input, self.output, self.encoding, self.newline, self.user_globals, self.lineno))
+
+    def async_template(self) -> jinja2.Template:
+        """ Returns the jinja2 template compiled with the async environment.
+        """
+        async_environment = RawTemplate.get_async_environment()
+        if self.async_jinja2_template == None or self.async_jinja2_template.environment is not async_environment:
+            self.async_jinja2_template = async_environment.from_string(self.string, self.jinja2_template.globals, None, self.input or exceptions.format_text(self.string), self.lineno)
+        return self.async_jinja2_template
+
+def unpickle_raw_template(options: Optional[Dict[str, Any]], *args: Any) -> RawTemplate:
+    """ Returns the pickled raw template, compiled with an environment having the pickled options.
+    """
+    return RawTemplate(*args, environment = environment_from_options(options))
 
 class RawTemplateContext(Context[RawTemplate]):
-    def __init__(self, template: RawTemplate, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def __init__(self, template: RawTemplate, args: Tuple[Any, ...] = (), kwargs: Mapping[str, Any] = {}):
         super().__init__(template, args, kwargs)
 
     def context(__autojinja_self__, *args, **kwargs) -> "RawTemplateContext":
@@ -296,26 +696,172 @@ class RawTemplateContext(Context[RawTemplate]):
         try:
             output = output or self.template.output
             assert output != None, "output filepath parameter can't be None"
-            args, kwargs = self.args, self.kwargs
-            result = self.template.jinja2_template.render(*args, **kwargs)
+            result = render_jinja2(self.template.jinja2_template, self.args, self.kwargs)
             utils.generate_file(output, result, None, encoding or self.template.encoding, newline or self.template.newline)
             return result
         except Exception as e:
             raise exceptions.clean_traceback(e) from None
     def render(self) -> str:
         try:
-            args, kwargs = self.args, self.kwargs
-            return self.template.jinja2_template.render(*args, **kwargs)
+            return render_jinja2(self.template.jinja2_template, self.args, self.kwargs)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    def stream_file(self, output: str = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        """ Renders to the output file chunk by chunk, without building the whole result in memory.
+            Returns the sha256 hash of the encoded content.
+        """
+        try:
+            output = output or self.template.output
+            assert output != None, "output filepath parameter can't be None"
+            return utils.generate_chunks(output, self.render_chunks(), encoding or self.template.encoding, newline or self.template.newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    def render_chunks(self) -> Iterator[str]:
+        """ Yields the rendered result chunk by chunk, as generated by jinja2.
+        """
+        try:
+            yield from generate_jinja2(self.template.jinja2_template, self.args, self.kwargs)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    async def render_file_async(self, output: str = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        """ Renders like render_async, then writes the output file from a worker thread.
+        """
+        try:
+            output = output or self.template.output
+            assert output != None, "output filepath parameter can't be None"
+            result = await self.render_async()
+            await run_in_thread(utils.generate_file, output, result, None, encoding or self.template.encoding, newline or self.template.newline)
+            return result
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    async def render_async(self) -> str:
+        """ Renders with the async environment, so that the template can call async functions.
+            Awaitable variables are awaited concurrently beforehand.
+        """
+        try:
+            args, kwargs = await resolve_awaitables(self.args, self.kwargs)
+            return await render_jinja2_async(self.template.async_template(), args, kwargs)
         except Exception as e:
             raise exceptions.clean_traceback(e) from None
 
 ### Generators
 
+SEGMENT_LITERAL = 0 # Text written as is
+SEGMENT_HEADER  = 1 # Marker header, written unless markers are removed
+SEGMENT_MARKER  = 2 # Open marker whose body is generated
+
+class ParseCache:
+    """ Least recently used cache of parsed marker bodies, by body digest, location and parser settings.
+        The cache is bounded by its number of bodies and by their total length, longer bodies aren't cached.
+        Generators share the parsed markers and render plan of the cached body, with their own generation state.
+    """
+    def __init__(self, maxsize: int = DEFAULT_PARSE_CACHE_SIZE, maxchars: int = DEFAULT_PARSE_CACHE_CHARS):
+        self.entries: OrderedDict = OrderedDict()
+        self.maxsize: int = maxsize
+        self.maxchars: int = maxchars
+        self.chars: int = 0 # Total length of cached bodies
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+
+    def generator(self, string: str, settings: parser.ParserSettings, lineno: Optional[int] = None, column: Optional[int] = None, cached: bool = True) -> "CogGenerator":
+        """ Returns a new cog generator of the given string, parsed on first use.
+            Strings aren't looked up when cached is disabled, and aren't stored when longer than the cache allows.
+            Parsing errors aren't cached, and are raised again on next uses.
+        """
+        parsed: Optional[CogGenerator] = None
+        key: Optional[Tuple[Any, ...]] = None
+        if cached and self.maxsize > 0 and len(string) <= self.maxchars:
+            key = (hashlib.sha256(string.encode("utf-8", "surrogatepass")).digest(), lineno, column, settings.parsing_key())
+        if cached:
+            with self.lock:
+                if key != None and key in self.entries:
+                    parsed = self.entries[key]
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        if parsed == None:
+            parsed = CogGenerator(string, settings, lineno, column)
+            parsed.parse()
+            parsed.render_plan()
+            if key != None:
+                self.add(key, parsed)
+        generator = CogGenerator(string, settings, lineno, column)
+        generator.markers = parsed.markers
+        generator.blocks = parsed.blocks
+        generator.cog_blocks = parsed.cog_blocks
+        generator.edit_blocks = parsed.edit_blocks
+        generator.plan = parsed.plan
+        generator.plan_markers = parsed.plan_markers
+        return generator
+
+    def add(self, key: Tuple[Any, ...], parsed: "CogGenerator"):
+        """ Caches the given parsed body, evicting least recently used bodies beyond the cache's bounds.
+        """
+        with self.lock:
+            if key in self.entries:
+                return # Parsed meanwhile by another thread
+            self.entries[key] = parsed
+            self.chars += len(parsed.string)
+            while len(self.entries) > self.maxsize or self.chars > self.maxchars:
+                _, evicted = self.entries.popitem(last=False)
+                self.chars -= len(evicted.string)
+
+    def info(self) -> CacheInfo:
+        """ Returns the statistics of the cache, like functools.lru_cache.
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.chars = 0
+            self.hits = 0
+            self.misses = 0
+
 class BaseGenerator(parser.Parser):
+    """ Parsed bodies of generated markers, shared by all generators """
+    parse_cache: ParseCache = ParseCache()
+
     def __init__(self, string: str, settings: parser.ParserSettings, lineno: Optional[int] = None, column: Optional[int] = None):
         super().__init__(string, settings, lineno, column)
+        self.plan: Optional[Tuple[Any, ...]] = None # Computed once from parsed markers
+        self.plan_markers: Optional[List[parser.Marker]] = None
+        self.compiled_templates: Dict[Any, RawTemplate] = {}
+        self.compiled_for: Tuple[Optional[CustomEnvironment], Optional[Dict[str, Any]]] = (None, None)
+
+    def render_plan(self) -> Tuple[Any, ...]:
+        """ Returns the render plan of the parsed markers, computed on first render and reused by next renders.
+        """
+        if self.plan == None or self.plan_markers is not self.markers:
+            self.plan = self.compile_plan() # To inherit
+            self.plan_markers = self.markers
+        return self.plan
+
+    def compile_plan(self) -> Tuple[Any, ...]:
+        raise NotImplementedError() # To override
+
+    def compiled_template(self, key: Any, string: str, input: Optional[str] = None, lineno: Optional[int] = None) -> RawTemplate:
+        """ Returns the template of the given string, compiled on first use.
+            Compiled templates are reused as long as the jinja2 environment and the globals don't change.
+        """
+        if self.compiled_for[0] is not RawTemplate.environment or self.compiled_for[1] is not self.globals:
+            self.compiled_templates = {}
+        template = self.compiled_templates.get(key)
+        if template == None:
+            template = RawTemplate(string, input, globals = self.globals, lineno = lineno)
+            self.compiled_templates[key] = template
+        self.compiled_for = (RawTemplate.environment, self.globals)
+        return template
 
-    def generate(self, edit_blocks_to_generate: Dict[str, parser.EditBlock], overriden_edits: Optional[Dict[str, str]], remove_markers: Optional[bool], globals: Optional[Dict[str, Any]], args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    def generate(self, edit_blocks_to_generate: Dict[str, parser.EditBlock], overriden_edits: Optional[Dict[str, str]], remove_markers: Optional[bool], globals: Optional[Dict[str, Any]], args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> str:
+        return "".join(self.generate_chunks(edit_blocks_to_generate, overriden_edits, remove_markers, globals, args, kwargs))
+
+    def generate_chunks(self, edit_blocks_to_generate: Dict[str, parser.EditBlock], overriden_edits: Optional[Dict[str, str]], remove_markers: Optional[bool], globals: Optional[Dict[str, Any]], args: Tuple[Any, ...], kwargs: Mapping[str, Any]) -> Iterator[str]:
+        """ Yields the output chunk by chunk.
+            Unused edits are checked once the last chunk has been generated.
+        """
         ### Save settings
         old_remove_markers = self.settings.remove_markers
         if self.settings.remove_markers != remove_markers:
@@ -327,8 +873,8 @@ class BaseGenerator(parser.Parser):
             self.edit_blocks_generated: Set[str] = set()
             self.globals: Optional[Dict[str, Any]] = globals
             self.args: Tuple[Any, ...] = args
-            self.kwargs: Dict[str, Any] = kwargs
-            output = self.generate_output(edit_blocks_to_generate) # To inherit
+            self.kwargs: Mapping[str, Any] = kwargs
+            yield from self.generate_output_chunks(edit_blocks_to_generate) # To inherit
             ### Check unused edits
             diff = set(self.edit_blocks_to_generate) - self.edit_blocks_generated
             for name in diff:
@@ -339,14 +885,25 @@ class BaseGenerator(parser.Parser):
             ### Restore settings
             if self.settings.remove_markers != old_remove_markers:
                 self.settings.remove_markers = old_remove_markers
-        return output
 
     def generate_output(self, edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> str:
+        return "".join(self.generate_output_chunks(edit_blocks_to_generate))
+
+    def may_contain_markers(self, string: str) -> bool:
+        """ Returns True if the given string contains the opening token of a cog or edit marker.
+            Markers are only found from these tokens, so other strings are generated as is without being parsed.
+        """
+        return self.settings.cog_open in string or self.settings.edit_open in string
+
+    def generate_output_chunks(self, edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> Iterator[str]:
         raise NotImplementedError() # To override
 
-    def evaluate(self, string: str, lineno: int, column: int) -> str:
-        generator = CogGenerator(string, self.settings, lineno, column)
-        generator.parse()
+    def evaluate(self, string: str, lineno: int, column: int, cached: bool = True) -> str:
+        """ Generates the markers of the given string, parsed with the parse cache unless cached is disabled.
+        """
+        if not self.may_contain_markers(string):
+            return string # Nothing to generate
+        generator = self.parse_cache.generator(string, self.settings, lineno, column, cached)
         generator.edit_blocks_to_generate = generator.edit_blocks.copy()
         generator.edit_blocks_to_generate.update(self.edit_blocks_to_generate)
         generator.overriden_edits = self.overriden_edits
@@ -360,9 +917,10 @@ class CogGenerator(BaseGenerator):
     def __init__(self, string: str, settings: parser.ParserSettings, lineno: Optional[int] = None, column: Optional[int] = None):
         super().__init__(string, settings, lineno, column)
 
-    def generate_output(self, edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> str:
-        self.edit_blocks_to_generate.update(edit_blocks_to_generate) # Update for generation
-        stringio = io.StringIO()
+    def compile_plan(self) -> Tuple[Tuple[int, Any], ...]:
+        """ Returns the literal segments, marker headers and open markers to generate, in order.
+        """
+        segments: List[Tuple[int, Any]] = []
         idx = 0
         depth = 0
         for marker in self.markers:
@@ -370,46 +928,54 @@ class CogGenerator(BaseGenerator):
             if marker.is_end:
                 depth -= 1
                 if depth == 0:
-                    if not self.settings.remove_markers:
-                        ### Write header
-                        stringio.write(self.string[marker.header_start:marker.header_end])
+                    segments.append((SEGMENT_HEADER, self.string[marker.header_start:marker.header_end]))
                     idx = marker.header_end
             ### Open marker
             else:
                 depth += 1
                 if depth == 1:
-                    stringio.write(self.string[idx:marker.header_start])
-                    if not self.settings.remove_markers:
-                        ### Write header
-                        stringio.write(self.string[marker.header_start:marker.header_end])
-                    ### Generate
-                    output = self.generate_marker(marker)
-                    ### Same line
-                    if marker.body_inline:
-                        if output == None:
-                            output = ""
-                        elif '\n' in output:
-                            raise exceptions.RequireBodyInlineException.from_marker(marker)
-                        if not self.settings.remove_markers:
-                            stringio.write(f" {output} ")
-                        else:
-                            stringio.write(output)
-                    ### Different lines
-                    elif output != None:
-                        bodyIndent = marker.header_indent[:marker.body_column]
-                        output = output.replace('\n', f"\n{bodyIndent}")
-                        stringio.write(f"{bodyIndent}{output}\n")
+                    segments.append((SEGMENT_LITERAL, self.string[idx:marker.header_start]))
+                    segments.append((SEGMENT_HEADER, self.string[marker.header_start:marker.header_end]))
+                    segments.append((SEGMENT_MARKER, marker))
         ### End of file
-        stringio.write(self.string[idx:])
-        return stringio.getvalue()
+        segments.append((SEGMENT_LITERAL, self.string[idx:]))
+        return tuple(segments)
+
+    def generate_output_chunks(self, edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> Iterator[str]:
+        self.edit_blocks_to_generate.update(edit_blocks_to_generate) # Update for generation
+        for kind, value in self.render_plan():
+            if kind == SEGMENT_LITERAL:
+                yield value
+            elif kind == SEGMENT_HEADER:
+                if not self.settings.remove_markers:
+                    yield value
+            else:
+                marker: parser.Marker = value
+                ### Generate
+                output = self.generate_marker(marker)
+                ### Same line
+                if marker.body_inline:
+                    if output == None:
+                        output = ""
+                    elif '\n' in output:
+                        raise exceptions.RequireBodyInlineException.from_marker(marker)
+                    if not self.settings.remove_markers:
+                        yield f" {output} "
+                    else:
+                        yield output
+                ### Different lines
+                elif output != None:
+                    bodyIndent = marker.header_indent[:marker.body_column]
+                    output = output.replace('\n', f"\n{bodyIndent}")
+                    yield f"{bodyIndent}{output}\n"
 
     def generate_marker(self, marker: parser.Marker) -> str:
         if not marker.is_edit:
             if marker.header_empty:
                 return None
             ### Generate raw template
-            template = RawTemplate(marker.header, globals = self.globals, lineno = marker.parent_lineno + marker.header_start_lineno-1)
-            output = template.context(*self.args, **self.kwargs).render()
+            template = self.compiled_template(marker.header_start, marker.header, None, marker.parent_lineno + marker.header_start_lineno-1)
+            output = RawTemplateContext(template, self.args, self.kwargs).render()
         else:
             ### Check if edit already used
             key = marker.header_stripped
@@ -441,19 +1007,28 @@ class JinjaGenerator(BaseGenerator):
     def __init__(self, string: str, settings: parser.ParserSettings, lineno: Optional[int] = None, column: Optional[int] = None):
         super().__init__(string, settings, lineno, column)
 
-    def generate_output(self, edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> str:
-        to_reinsert: Dict[str, Tuple[parser.Marker, parser.Marker]] = OrderedDict()
+    """ Sentinel replacing a cog region in the jinja2 source: its index, and as many newlines as the region """
+    SENTINEL_PATTERN = re.compile("\x07([0-9]+)[\r\n]*\x07")
+
+    def compile_plan(self) -> Tuple[str, List[str], List[str]]:
+        """ Returns the jinja2 source where cog regions are replaced with sentinels, the cog regions to reinsert by index,
+            and the names of the template's own edit markers.
+        """
+        to_reinsert: List[str] = []
+        edit_names: List[str] = []
         stringio = io.StringIO()
         idx = 0
         depth = 0
-        prev_list = None
+        marker_start = None
         for marker in self.markers:
             ### End marker
             if marker.is_end:
                 if not marker.is_edit:
                     depth -= 1
                     if depth == 0:
-                        prev_list[1] = marker # Update previous reinsert
+                        region = self.string[marker_start.header_start:marker.header_close]
+                        stringio.write(self.sentinel(len(to_reinsert), region)) # Write sentinel for later reinsertion
+                        to_reinsert.append(region)
                         idx = marker.header_close
                 else:
                     if depth == 0:
@@ -464,51 +1039,38 @@ class JinjaGenerator(BaseGenerator):
                 if not marker.is_edit:
                     depth += 1
                     if depth == 1:
-                        prev_list = [marker, None]
-                        id = self.unique_id(marker)
-                        to_reinsert[id] = prev_list # Update reinserts
+                        marker_start = marker
                         stringio.write(self.string[idx:marker.header_start])
-                        stringio.write(id) # Write id for later reinsertion
                 else:
                     if depth == 0:
-                        del self.edit_blocks_to_generate[marker.header_stripped] # Update for generation
+                        edit_names.append(marker.header_stripped)
         ### End of file
         stringio.write(self.string[idx:])
-        return self.generate_reinsert(stringio.getvalue(), to_reinsert, edit_blocks_to_generate)
+        return stringio.getvalue(), to_reinsert, edit_names
 
-    def generate_reinsert(self, string: str, to_reinsert: Dict[str, Tuple[parser.Marker, parser.Marker]], edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> str:
+    def generate_output_chunks(self, edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> Iterator[str]:
+        source, to_reinsert, edit_names = self.render_plan()
+        for name in edit_names:
+            del self.edit_blocks_to_generate[name] # Update for generation
+        yield self.generate_reinsert(source, to_reinsert, edit_blocks_to_generate) # Cog markers are reinserted in the whole output
+
+    def generate_reinsert(self, string: str, to_reinsert: List[str], edit_blocks_to_generate: Dict[str, parser.EditBlock]) -> str:
         ### Generate raw template
-        template = RawTemplate(string, exceptions.format_text(self.string), globals = self.globals)
-        output = template.context(*self.args, **self.kwargs).render()
-        ### Reinsert cog markers
-        for id, (marker_start, marker_end) in to_reinsert.items():
-            if not marker_start.is_edit:
-                content = self.string[marker_start.header_start:marker_end.header_close]
-                output = output.replace(id, content)
+        template = self.compiled_template(None, string, exceptions.format_text(self.string))
+        output = RawTemplateContext(template, self.args, self.kwargs).render()
+        ### Reinsert cog regions
+        if len(to_reinsert) > 0:
+            output = self.SENTINEL_PATTERN.sub(lambda match: to_reinsert[int(match.group(1))], output)
         ### Parse and generate again
         self.edit_blocks_to_generate.update(edit_blocks_to_generate) # Update for generation
         if len(output) > 0:
-            output = self.evaluate(output, 1, 0)
+            output = self.evaluate(output, 1, 0, False) # Whole outputs aren't kept in the parse cache
         return output
 
-    def unique_id(self, marker: parser.Marker) -> str:
-        stringio = io.StringIO()
-        startidx = marker.header_start
-        idx = startidx
-        id = f"\x07{marker.header_start}"
-        while True:
-            idx = self.string.find('\n', startidx, marker.dual.header_close)
-            if idx < 0:
-                idx = marker.dual.header_close
-                break
-            stringio.write(self.repeat_to_length(id, idx-startidx))
-            stringio.write('\n')
-            startidx = idx + 1
-        stringio.write(self.repeat_to_length(id, idx-startidx))
-        return stringio.getvalue()
-    
-    def repeat_to_length(self, string_to_expand, length):
-        return (string_to_expand * (int(length/len(string_to_expand))+1))[:length]
+    def sentinel(self, index: int, region: str) -> str:
+        """ Returns the sentinel of the given cog region, spanning as many lines so that jinja2 reports the template's line numbers.
+        """
+        return f"\x07{index}{chr(10) * region.count(chr(10))}\x07"
 
 _Generator = TypeVar("_Generator", bound=BaseGenerator, covariant=True)
 
@@ -527,6 +1089,7 @@ class BaseTemplate(Generic[_Generator], Template):
         self.overriden_edits: Optional[Dict[str, str]] = None
         self.parser: _Generator = generator(self.string, self.settings)
         self.parser.parse()
+        self.lock: threading.Lock = threading.Lock() # Generation state is held by the parser
 
     @property
     def remove_markers(self) -> Optional[bool]:
@@ -591,11 +1154,41 @@ class BaseTemplate(Generic[_Generator], Template):
             return self.context().render(output, remove_markers)
         except Exception as e:
             raise exceptions.clean_traceback(e) from None
+    def stream_file(self, output: Optional[str] = None, remove_markers: Optional[bool] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        try:
+            return self.context().stream_file(output, remove_markers, encoding, newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    def render_chunks(self, output: Optional[str] = None, remove_markers: Optional[bool] = None) -> Iterator[str]:
+        return self.context().render_chunks(output, remove_markers)
+    async def render_file_async(self, output: Optional[str] = None, remove_markers: Optional[bool] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        try:
+            return await self.context().render_file_async(output, remove_markers, encoding, newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    async def render_async(self, output: Optional[str] = None, remove_markers: Optional[bool] = None) -> str:
+        try:
+            return await self.context().render_async(output, remove_markers)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+
+    def render_output(self, context: "BaseTemplateContext", output: str) -> str:
+        """ Renders the given context to the given output, and returns the status of the output.
+            The output is read and written outside of the template's lock, so that threads only wait for each other while generating.
+        """
+        old_content, edit_blocks_to_generate = context.output_edit_blocks(output)
+        with self.lock:
+            result = self.parser.generate(edit_blocks_to_generate, self.overriden_edits, self.remove_markers, self.globals, context.args, context.kwargs)
+        return utils.generate_file(output, result, old_content, self.encoding, self.newline)
+
+    def __reduce__(self):
+        args = (self.string, self.input, self.output, self.settings, self._remove_markers, self._encoding, self._newline, self.globals)
+        return (type(self), args, { "overriden_edits": self.overriden_edits })
 
 _BaseTemplate = TypeVar("_BaseTemplate", bound=BaseTemplate, covariant=True)
 
 class BaseTemplateContext(Generic[_BaseTemplate], Context[_BaseTemplate]):
-    def __init__(self, template: _BaseTemplate, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def __init__(self, template: _BaseTemplate, args: Tuple[Any, ...] = (), kwargs: Mapping[str, Any] = {}):
         super().__init__(template, args, kwargs)
 
     def context(__autojinja_self__, *args, **kwargs) -> "BaseTemplateContext[_BaseTemplate]":
@@ -605,17 +1198,7 @@ class BaseTemplateContext(Generic[_BaseTemplate], Context[_BaseTemplate]):
         try:
             output = output or self.template.output
             assert output != None, "output filepath parameter can't be None"
-            ### Retrieve output edits
-            edit_blocks_to_generate: Dict[str, parser.EditBlock] = {} # For generation
-            if not path.isfile(output): # File doesn't exist
-                old_content = None
-            elif self.template.input and path.samefile(self.template.input, output): # Same file
-                old_content = self.template.string
-            else: # Not same file
-                with open(output, 'r', encoding = encoding or self.template.encoding or "utf-8") as file:
-                    old_content = file.read()
-                    edit_blocks = utils.edit_blocks_from_string(old_content, self.template.settings)
-                    edit_blocks_to_generate.update(edit_blocks)
+            old_content, edit_blocks_to_generate = self.output_edit_blocks(output, encoding)
             ### Render
             result = self.template.parser.generate(edit_blocks_to_generate, self.template.overriden_edits, remove_markers or self.template.remove_markers, self.template.globals, self.args, self.kwargs)
             utils.generate_file(output, result, old_content, encoding or self.template.encoding, newline or self.template.newline)
@@ -633,6 +1216,74 @@ class BaseTemplateContext(Generic[_BaseTemplate], Context[_BaseTemplate]):
             return self.template.parser.generate(edit_blocks_to_generate, self.template.overriden_edits, remove_markers or self.template.remove_markers, self.template.globals, self.args, self.kwargs)
         except Exception as e:
             raise exceptions.clean_traceback(e) from None
+    def stream_file(self, output: Optional[str] = None, remove_markers: Optional[bool] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        """ Renders to the output file chunk by chunk, without building the whole result in memory.
+            Returns the sha256 hash of the encoded content.
+        """
+        try:
+            output = output or self.template.output
+            assert output != None, "output filepath parameter can't be None"
+            _, edit_blocks_to_generate = self.output_edit_blocks(output, encoding)
+            ### Render
+            chunks = self.template.parser.generate_chunks(edit_blocks_to_generate, self.template.overriden_edits, remove_markers or self.template.remove_markers, self.template.globals, self.args, self.kwargs)
+            return utils.generate_chunks(output, chunks, encoding or self.template.encoding, newline or self.template.newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    def render_chunks(self, output: Optional[str] = None, remove_markers: Optional[bool] = None) -> Iterator[str]:
+        """ Yields the rendered result chunk by chunk.
+            Cog templates yield each text segment and generated body separately, Jinja templates yield their whole result.
+        """
+        try:
+            ### Retrieve output edits
+            edit_blocks_to_generate: Dict[str, parser.EditBlock] = {} # For generation
+            if output != None:
+                edit_blocks = utils.edit_blocks_from_string(output, self.template.settings)
+                edit_blocks_to_generate.update(edit_blocks)
+            ### Render
+            yield from self.template.parser.generate_chunks(edit_blocks_to_generate, self.template.overriden_edits, remove_markers or self.template.remove_markers, self.template.globals, self.args, self.kwargs)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+
+    async def render_file_async(self, output: Optional[str] = None, remove_markers: Optional[bool] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+        """ Renders like render_async, including the output file's read and write.
+        """
+        try:
+            args, kwargs = await resolve_awaitables(self.args, self.kwargs)
+            context = type(self)(self.template, args, kwargs)
+            return await run_in_thread(self.run_locked, context.render_file, output, remove_markers, encoding, newline)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+    async def render_async(self, output: Optional[str] = None, remove_markers: Optional[bool] = None) -> str:
+        """ Awaits awaitable variables concurrently, then renders from a worker thread.
+            Generated bodies are parsed and rendered again synchronously, so the whole generation runs outside of the event loop.
+            Generations of the same template are serialized, as they share the parser's state.
+        """
+        try:
+            args, kwargs = await resolve_awaitables(self.args, self.kwargs)
+            context = type(self)(self.template, args, kwargs)
+            return await run_in_thread(self.run_locked, context.render, output, remove_markers)
+        except Exception as e:
+            raise exceptions.clean_traceback(e) from None
+
+    def run_locked(self, function: Callable[..., str], *args: Any) -> str:
+        with self.template.lock:
+            return function(*args)
+
+    def output_edit_blocks(self, output: str, encoding: Optional[str] = None) -> Tuple[Optional[str], Dict[str, parser.EditBlock]]:
+        """ Returns the content of the given output file, and its edit blocks to generate.
+            The content is None if the file doesn't exist.
+        """
+        edit_blocks_to_generate: Dict[str, parser.EditBlock] = {} # For generation
+        if not path.isfile(output): # File doesn't exist
+            old_content = None
+        elif self.template.input and path.samefile(self.template.input, output): # Same file
+            old_content = self.template.string
+        else: # Not same file
+            with open(output, 'r', encoding = encoding or self.template.encoding or "utf-8") as file:
+                old_content = file.read()
+                edit_blocks = utils.edit_blocks_from_string(old_content, self.template.settings)
+                edit_blocks_to_generate.update(edit_blocks)
+        return old_content, edit_blocks_to_generate
 
 class CogTemplate(BaseTemplate[CogGenerator]):
     def __init__(self, string: str, input: Optional[str] = None, output: Optional[str] = None, settings: Optional[parser.ParserSettings] = None, remove_markers: Optional[bool] = None, encoding: Optional[str] = None, newline: Optional[str] = None, globals: Optional[Dict[str, Any]] = None):
@@ -659,7 +1310,7 @@ class CogTemplate(BaseTemplate[CogGenerator]):
         return CogTemplateContext(__autojinja_self__, args, kwargs)
 
 class CogTemplateContext(BaseTemplateContext[CogTemplate]):
-    def __init__(self, template: CogTemplate, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def __init__(self, template: CogTemplate, args: Tuple[Any, ...] = (), kwargs: Mapping[str, Any] = {}):
         super().__init__(template, args, kwargs)
 
     def context(__autojinja_self__, *args, **kwargs) -> "CogTemplateContext":
@@ -691,7 +1342,7 @@ class JinjaTemplate(BaseTemplate[JinjaGenerator]):
         return JinjaTemplateContext(__autojinja_self__, args, kwargs)
 
 class JinjaTemplateContext(BaseTemplateContext[JinjaTemplate]):
-    def __init__(self, template: JinjaTemplate, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def __init__(self, template: JinjaTemplate, args: Tuple[Any, ...] = (), kwargs: Mapping[str, Any] = {}):
         super().__init__(template, args, kwargs)
 
     def context(__autojinja_self__, *args, **kwargs) -> "JinjaTemplateContext":
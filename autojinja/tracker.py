@@ -0,0 +1,259 @@
+"""
+Records files read and written by python scripts thanks to audit hooks, as well as listed directories.
+Files generated through autojinja are notified with the 'autojinja.generate_file' audit event.
+
+Only depends on the standard library, as it can be executed as a bootstrap for python scripts:
+
+    python tracker.py REPORT_FILE PYTHON_SCRIPT
+
+The python script is executed with the appropriate sys.argv and sys.path,
+and the files it accessed are written to the report file as JSON.
+"""
+
+import hashlib
+import json
+import os
+import runpy
+import sys
+import sysconfig
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+BYTECODE_CACHE_PREFIX = "__autojinja_" # Compiled templates, never dependencies
+TEMPORARY_FILE_PREFIX = ".__autojinja_tmp_" # Streamed outputs before replacing the generated file
+GENERATE_FILE_EVENT = "autojinja.generate_file"
+DECLARE_EVENT = "autojinja.declare"
+LISTDIR_EVENTS = ("os.listdir", "os.scandir")
+IMPORT_SYSTEM_FILENAME = "<frozen importlib" # Directories listed by the import system to cache their content
+
+_recorders: List["Recorder"] = []
+_hook_installed: bool = False
+_system_dirpaths: Optional[Tuple[str, ...]] = None
+
+def is_supported() -> bool:
+    """ Returns True if audit hooks are supported (python 3.8+).
+    """
+    return hasattr(sys, "addaudithook")
+
+def fingerprint(filepath: str) -> Optional[Tuple[int, int]]:
+    """ Returns the (mtime, size) of the given file, or None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(filepath)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+def listing(dirpath: str) -> Optional[str]:
+    """ Returns a hash of the entry names of the given directory, or None if it can't be listed.
+    """
+    try:
+        names = sorted([x for x in os.listdir(dirpath) if not x.startswith((BYTECODE_CACHE_PREFIX, TEMPORARY_FILE_PREFIX))])
+    except OSError:
+        return None
+    return hashlib.sha256("\n".join(names).encode("utf-8", "surrogateescape")).hexdigest()
+
+def normpath(filepath: str) -> str:
+    return os.path.abspath(filepath).replace('\\', '/')
+
+def is_system_file(filepath: Optional[str]) -> bool:
+    """ Returns True if the given file belongs to the python installation (standard library or site-packages).
+    """
+    global _system_dirpaths
+    if _system_dirpaths == None:
+        paths = sysconfig.get_paths()
+        dirpaths = [paths.get(x) for x in ["stdlib", "platstdlib", "purelib", "platlib"]]
+        _system_dirpaths = tuple(dict.fromkeys([os.path.normcase(os.path.join(os.path.abspath(x), "")) for x in dirpaths if x]))
+    if not filepath:
+        return True
+    return os.path.normcase(os.path.abspath(filepath)).startswith(_system_dirpaths)
+
+def is_ignored_file(filepath: str) -> bool:
+    """ Returns True if the given file isn't relevant as a dependency.
+    """
+    if filepath.startswith(("/dev/", "/proc/", "/sys/")):
+        return True
+    if "/__pycache__/" in filepath:
+        return True
+    if os.path.basename(filepath).startswith((BYTECODE_CACHE_PREFIX, TEMPORARY_FILE_PREFIX)):
+        return True
+    return is_system_file(filepath)
+
+def _audit_hook(event: str, args: Tuple[Any, ...]):
+    if _recorders and (event == "open" or event in LISTDIR_EVENTS or event == GENERATE_FILE_EVENT or event == DECLARE_EVENT):
+        if event in LISTDIR_EVENTS and sys._getframe(1).f_code.co_filename.startswith(IMPORT_SYSTEM_FILENAME):
+            return
+        for recorder in _recorders:
+            recorder.on_event(event, args)
+
+def generate_file(filepath: str, status: str, size: int, diff: Optional[str] = None):
+    """ Notifies recorders that the given file has been generated.
+        status is either 'new', 'changed' or 'unchanged'.
+        diff is the unified diff printed in check mode, if any.
+    """
+    if hasattr(sys, "audit"):
+        sys.audit(GENERATE_FILE_EVENT, filepath, status, size, diff)
+
+def merge(values: Dict[str, Any]):
+    """ Notifies recorders of the files recorded by another process, as returned by Recorder.to_dict.
+    """
+    for recorder in _recorders:
+        for filepath in values.get("inputs", []):
+            recorder.add_input(filepath)
+        for filepath in values.get("outputs", []):
+            recorder.add_output(filepath)
+        for dirpath in values.get("listed", []):
+            recorder.add_listed(dirpath)
+        recorder.generated.update(values.get("generated", {}))
+
+def declare(inputs: Iterable[str] = (), outputs: Iterable[str] = ()):
+    """ Declares files read and generated by the executing python script, relatively to the current working directory.
+        Declared files are recorded even if not accessed, so that python scripts generating
+        files read by other python scripts are executed first on the next run.
+    """
+    inputs = [os.path.abspath(x) for x in ([inputs] if isinstance(inputs, str) else inputs)]
+    outputs = [os.path.abspath(x) for x in ([outputs] if isinstance(outputs, str) else outputs)]
+    if hasattr(sys, "audit"):
+        sys.audit(DECLARE_EVENT, inputs, outputs)
+
+class Recorder:
+    """ Records files read and written while started """
+    def __init__(self):
+        self.inputs: Dict[str, None] = {} # Ordered set
+        self.outputs: Dict[str, None] = {} # Ordered set
+        self.listed: Dict[str, None] = {} # Ordered set of directories whose content has been listed
+        self.generated: Dict[str, Dict[str, Any]] = {}
+        self.script: Optional[str] = None
+        self.modules: Dict[str, None] = {}
+        self.error: Optional[Dict[str, Any]] = None # Uncaught exception, if any
+
+    def start(self, script: Optional[str] = None):
+        global _hook_installed
+        if not is_supported():
+            return
+        if not _hook_installed:
+            sys.addaudithook(_audit_hook)
+            _hook_installed = True
+        if script != None:
+            self.script = normpath(script)
+            self.inputs[self.script] = None
+        self.modules = dict.fromkeys(sys.modules)
+        _recorders.append(self)
+
+    def stop(self):
+        if self in _recorders:
+            _recorders.remove(self)
+            ### Imported modules are loaded from cached bytecode
+            for name, module in list(sys.modules.items()):
+                if name in self.modules:
+                    continue
+                filepath = getattr(module, "__file__", None)
+                if filepath and filepath.endswith(".py"):
+                    self.add_input(filepath)
+
+    def add_input(self, filepath: str):
+        filepath = normpath(filepath)
+        if filepath not in self.inputs and not is_ignored_file(filepath):
+            self.inputs[filepath] = None
+
+    def add_output(self, filepath: str):
+        filepath = normpath(filepath)
+        if filepath not in self.outputs and not is_ignored_file(filepath):
+            self.outputs[filepath] = None
+
+    def add_listed(self, dirpath: str):
+        dirpath = normpath(dirpath)
+        if dirpath not in self.listed and not is_ignored_file(dirpath):
+            self.listed[dirpath] = None
+
+    def on_event(self, event: str, args: Tuple[Any, ...]):
+        if event == "open":
+            filepath, mode, flags = args
+            if filepath == None or isinstance(filepath, int):
+                return # File descriptor
+            filepath = os.fsdecode(filepath)
+            if mode != None:
+                is_write = any(x in mode for x in "wax+")
+            else:
+                is_write = bool(flags & (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT))
+            if is_write:
+                self.add_output(filepath)
+            else:
+                self.add_input(filepath)
+        elif event in LISTDIR_EVENTS:
+            dirpath = args[0]
+            if isinstance(dirpath, int):
+                return # File descriptor
+            self.add_listed(os.fsdecode(dirpath) if dirpath != None else ".")
+        elif event == GENERATE_FILE_EVENT:
+            filepath, status, size, diff = args
+            self.generated[normpath(filepath)] = { "status": status, "size": size }
+            if diff:
+                self.generated[normpath(filepath)]["diff"] = diff
+        elif event == DECLARE_EVENT:
+            inputs, outputs = args
+            for filepath in inputs:
+                self.add_input(filepath)
+            for filepath in outputs:
+                self.generated.setdefault(normpath(filepath), { "status": "declared", "size": None })
+
+    def set_error(self, exception: BaseException):
+        """ Records the given uncaught exception, with its line and column when raised from a marker.
+        """
+        self.error = { "type": type(exception).__name__,
+                       "message": str(exception).strip('\n'),
+                       "line": getattr(exception, "lineno", None),
+                       "column": getattr(exception, "column", None) }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return { "script": self.script,
+                 "inputs": list(self.inputs),
+                 "outputs": list(self.outputs),
+                 "listed": list(self.listed),
+                 "generated": self.generated,
+                 "error": self.error }
+
+    @staticmethod
+    def from_dict(values: Dict[str, Any]) -> "Recorder":
+        recorder = Recorder()
+        recorder.script = values.get("script")
+        recorder.inputs = dict.fromkeys(values.get("inputs", []))
+        recorder.outputs = dict.fromkeys(values.get("outputs", []))
+        recorder.listed = dict.fromkeys(values.get("listed", []))
+        recorder.generated = values.get("generated", {})
+        recorder.error = values.get("error")
+        return recorder
+
+    def dump(self, filepath: str):
+        with open(filepath, 'w', encoding = "utf-8") as file:
+            json.dump(self.to_dict(), file)
+
+    @staticmethod
+    def load(filepath: str) -> Optional["Recorder"]:
+        """ Loads the report written by the bootstrap.
+            Returns None if the report doesn't exist or is invalid.
+        """
+        try:
+            with open(filepath, 'r', encoding = "utf-8") as file:
+                return Recorder.from_dict(json.load(file))
+        except (OSError, ValueError):
+            return None
+
+def bootstrap(report: str, script: str):
+    """ Executes the given python script as '__main__' while recording accessed files to the given report.
+    """
+    sys.argv[:] = [script]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    recorder = Recorder()
+    recorder.start(script)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except Exception as e:
+        recorder.set_error(e)
+        raise
+    finally:
+        recorder.stop()
+        _recorders.clear()
+        recorder.dump(report)
+
+if __name__ == "__main__":
+    bootstrap(sys.argv[1], sys.argv[2])
@@ -1,10 +1,15 @@
 from . import defaults
 from . import parser
 from . import path
+from . import tracker
 
+import difflib
+import hashlib
 import os
+import shutil
 import sys
-from typing import Dict, List, Optional
+import tempfile
+from typing import Dict, Iterable, List, Optional, Set
 
 def is_file_tagged(filepath: str, tag = defaults.AUTOJINJA_DEFAULT_TAG, encoding: Optional[str] = None) -> bool:
     """ Returns True if the file at the given filepath is tagged with the given tag.
@@ -14,10 +19,22 @@ def is_file_tagged(filepath: str, tag = defaults.AUTOJINJA_DEFAULT_TAG, encoding
     with open(filepath, 'r', encoding = encoding or "utf-8") as file:
         return tag in file.readline()
 
-def generate_file(filepath: str, new_content: str, old_content: Optional[str] = None, encoding: Optional[str] = None, newline: Optional[str] = None):
+def unified_diff(filepath: str, old_content: str, new_content: str, context: int = 1) -> str:
+    """ Returns a compact unified diff between the given contents.
+    """
+    old_lines = old_content.splitlines(keepends=True)
+    new_lines = new_content.splitlines(keepends=True)
+    lines = []
+    for line in difflib.unified_diff(old_lines, new_lines, f"a/{filepath}", f"b/{filepath}", n=context):
+        lines.append(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n")
+    return "".join(lines)
+
+def generate_file(filepath: str, new_content: str, old_content: Optional[str] = None, encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
     """ Generates the given content to the given filepath.
         Only writes the content to the file if the content is new.
         The previous content can be directly provided to avoid reading the file.
+        In check mode, the content isn't written and differences are printed instead.
+        Returns the status of the file, either 'new', 'changed' or 'unchanged'.
         Raises an error if the file can't be read/write.
     """
     assert filepath != None, "output filepath parameter can't be None"
@@ -29,10 +46,93 @@ def generate_file(filepath: str, new_content: str, old_content: Optional[str] =
             old_content = file.read()
     ### Save new generation
     changed = new_content != old_content
-    if created or changed:
+    diff: Optional[str] = None
+    if defaults.osenviron_check():
+        if created or changed:
+            diff = unified_diff(filepath.relpath(defaults.osenviron_cwd()), old_content or "", new_content)
+            sys.stdout.write(diff)
+    elif created or changed:
         with open(filepath, 'w', encoding = encoding or "utf-8", newline = newline) as file:
             file.write(new_content)
-    ### Print summary
+    ### Notify trackers
+    if defaults.osenviron_check(): # Size of the file as it would be written
+        linesep = os.linesep if newline == None else newline or '\n'
+        size = len(new_content.replace('\n', linesep).encode(encoding or "utf-8"))
+    else:
+        size = os.stat(filepath).st_size
+    return notify_generated(filepath, created, changed, size, diff)
+
+def generate_chunks(filepath: str, chunks: Iterable[str], encoding: Optional[str] = None, newline: Optional[str] = None) -> str:
+    """ Generates the given chunks of content to the given filepath, without joining them in memory.
+        Chunks are written to a temporary file next to the filepath, and compared to the existing file as they come.
+        The existing file is only replaced if the content is new, and is left untouched if an error is raised.
+        In check mode, the chunks are joined and generated with generate_file.
+        Returns the sha256 hash of the encoded content, with newlines translated as when written.
+        Raises an error if the file can't be read/write.
+    """
+    assert filepath != None, "output filepath parameter can't be None"
+    filepath: path.Path = path.Path(filepath).abspath
+    encoding = encoding or "utf-8"
+    linesep = os.linesep if newline == None else newline or '\n'
+    if defaults.osenviron_check():
+        new_content = "".join(chunks)
+        generate_file(filepath, new_content, None, encoding, newline)
+        return hashlib.sha256(new_content.replace('\n', linesep).encode(encoding)).hexdigest()
+    ### Write and compare chunks
+    created = not filepath.isfile
+    changed = created
+    sha = hashlib.sha256()
+    size = 0
+    if created: # Written in place, with default permissions
+        tmppath = filepath
+        file = open(filepath, 'wb')
+    else:
+        fd, tmppath = tempfile.mkstemp(prefix=tracker.TEMPORARY_FILE_PREFIX, dir=filepath.dirpath)
+        file = open(fd, 'wb')
+    try:
+        old_file = open(filepath, 'r', encoding = encoding) if not created else None
+        try:
+            with file:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    data = (chunk if linesep == '\n' else chunk.replace('\n', linesep)).encode(encoding)
+                    file.write(data)
+                    sha.update(data)
+                    size += len(data)
+                    if not changed and old_file.read(len(chunk)) != chunk:
+                        changed = True
+            if not changed and old_file.read(1) != "": # Old content is longer
+                changed = True
+        finally:
+            if old_file != None:
+                old_file.close()
+    except BaseException:
+        file.close()
+        os.remove(tmppath)
+        raise
+    ### Replace generated file
+    if not created:
+        if changed:
+            shutil.copymode(filepath, tmppath)
+            os.replace(tmppath, filepath)
+        else:
+            os.remove(tmppath)
+    notify_generated(filepath, created, changed, size)
+    return sha.hexdigest()
+
+def notify_generated(filepath: "path.Path", created: bool, changed: bool, size: int, diff: Optional[str] = None) -> str:
+    """ Notifies trackers that the given file has been generated, and prints the summary line.
+        Returns the status of the file.
+    """
+    status = "new" if created else "changed" if changed else "unchanged"
+    tracker.generate_file(filepath, status, size, diff)
+    print_summary(filepath, created, changed)
+    return status
+
+def print_summary(filepath: "path.Path", created: bool, changed: bool):
+    """ Prints the summary line of the given generated file, depending on the summary setting.
+    """
     message: str = None
     summary = defaults.osenviron_summary()
     if summary == "0":
@@ -71,20 +171,24 @@ def parse_string(string: str, settings: Optional[parser.ParserSettings] = None)
     except Exception as e:
         raise e.with_traceback(None)
 
-def parse_envvars(env: os._Environ, values: List[str]):
+def parse_envvars(env: os._Environ, values: List[str], names: Optional[Set[str]] = None):
     """ Loads the given environment variables to the given environment dictionary.
         Variable format must be 'name=value', otherwise considered as an environment file.
+        The names of loaded variables are added to the given names, if any.
     """
     for arg in values:
         if '=' in arg: # Environment variable
             splits = arg.split('=', 1)
             env[splits[0].strip()] = evaluate_env(env, splits[1].strip())
+            if names != None:
+                names.add(splits[0].strip())
         else: # Environment file
-            parse_envfile(env, arg)
+            parse_envfile(env, arg, names)
 
-def parse_envfile(env: os._Environ, envfile: str):
+def parse_envfile(env: os._Environ, envfile: str, names: Optional[Set[str]] = None):
     """ Loads the given environment file and appends all environment variables to the given environment dictionary.
         The special environment variable ${THIS_DIRPATH} can be used to refer to the environment file location.
+        The names of loaded variables are added to the given names, if any.
     """
     with open(envfile, encoding = "utf-8") as file:
         lines = [line.split('#', 1)[0].strip() for line in file.readlines()] # Remove comments
@@ -92,6 +196,8 @@ def parse_envfile(env: os._Environ, envfile: str):
         for line in lines:
             splits = line.split('=', 1)
             name = splits[0].strip()
+            if names != None:
+                names.add(name)
             if len(splits) == 1:
                 env[name] = "" # No value defined
             else:
@@ -0,0 +1,182 @@
+"""
+Watches files accessed by python scripts, and re-executes the python scripts depending on changed files.
+Uses inotify where available, otherwise falls back to polling.
+"""
+
+from . import path
+from . import runner
+from . import schedule
+from . import tracker
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_POLL_INTERVAL = 0.5
+DEBOUNCE_DELAY = 0.05
+
+Fingerprint = Optional[Tuple[int, int]]
+
+class PollingWatcher:
+    """ Wakes up periodically """
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval: float = interval
+
+    def add(self, filepaths: Iterable[str]):
+        pass
+
+    def wait(self):
+        time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+class InotifyWatcher(PollingWatcher):
+    """ Wakes up when the directories of watched files change """
+    IN_MODIFY      = 0x00000002
+    IN_ATTRIB      = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, libc: ctypes.CDLL):
+        super().__init__()
+        self.libc: ctypes.CDLL = libc
+        self.fd: int = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirpaths: Set[str] = set()
+
+    @staticmethod
+    def create() -> Optional["InotifyWatcher"]:
+        """ Returns an inotify watcher, or None if inotify isn't available.
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+            libc.inotify_init1
+            return InotifyWatcher(libc)
+        except (AttributeError, OSError):
+            return None
+
+    def add(self, filepaths: Iterable[str]):
+        # Directories are watched, as files are often replaced rather than modified
+        for dirpath in set([os.path.dirname(x) for x in filepaths]):
+            if dirpath not in self.dirpaths and os.path.isdir(dirpath):
+                if self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.MASK) >= 0:
+                    self.dirpaths.add(dirpath)
+
+    def drain(self):
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+
+    def wait(self):
+        select.select([self.fd], [], [])
+        time.sleep(DEBOUNCE_DELAY) # Gather simultaneous changes
+        self.drain()
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(polling: bool = False) -> PollingWatcher:
+    """ Returns an inotify watcher if available, otherwise a polling watcher.
+    """
+    if not polling:
+        watcher = InotifyWatcher.create()
+        if watcher != None:
+            return watcher
+    return PollingWatcher()
+
+class Dependencies:
+    """ Maps files to the python scripts depending on them """
+    def __init__(self, scripts: List[path.Path], common_files: List[str]):
+        self.scripts: List[path.Path] = scripts
+        self.common_files: List[str] = [path.Path(x).abspath for x in common_files]
+        self.files: Dict[str, Set[path.Path]] = {}
+        self.dirpaths: Dict[str, Set[path.Path]] = {} # Listed directories
+        self.fingerprints: Dict[str, Fingerprint] = {}
+        self.listings: Dict[str, Optional[str]] = {}
+        for script in scripts:
+            self.set(script, [script])
+
+    def set(self, script: path.Path, filepaths: Iterable[str], dirpaths: Iterable[str] = ()):
+        """ Sets the files the given python script depends on, and the directories whose entries it depends on.
+        """
+        for scripts in [*self.files.values(), *self.dirpaths.values()]:
+            scripts.discard(script)
+        for filepath in [*filepaths, *self.common_files, script]:
+            self.files.setdefault(path.Path(filepath).abspath, set()).add(script)
+        for dirpath in dirpaths:
+            self.dirpaths.setdefault(tracker.normpath(dirpath), set()).add(script)
+
+    def update(self, results: List[runner.ScriptResult]):
+        """ Updates dependencies with the files accessed by executed python scripts.
+        """
+        for result in results:
+            if result.record != None:
+                # Files written by the script itself can't trigger it
+                self.set(result.script, [x for x in result.record.inputs if x not in result.record.outputs and x not in result.record.generated], result.record.listed)
+
+    def changed_scripts(self) -> List[path.Path]:
+        """ Returns the python scripts depending on files changed since last call, in execution order.
+        """
+        scripts: Set[path.Path] = set()
+        fingerprints = { x: tracker.fingerprint(x) for x in self.files }
+        for filepath, old_fingerprint in self.fingerprints.items():
+            if filepath in self.files and fingerprints[filepath] != old_fingerprint:
+                scripts.update(self.files[filepath])
+        listings = { x: tracker.listing(x) for x in self.dirpaths }
+        for dirpath, old_listing in self.listings.items():
+            if dirpath in self.dirpaths and listings[dirpath] != old_listing:
+                scripts.update(self.dirpaths[dirpath])
+        self.fingerprints = fingerprints
+        self.listings = listings
+        return [x for x in self.scripts if x in scripts]
+
+def watch(scripts: List[path.Path], script_runner: runner.Runner, common_files: List[str], polling: bool = False, graph: Optional[schedule.Graph] = None):
+    """ Executes the given python scripts, then re-executes them whenever the files they accessed change.
+        Python scripts are executed in the order of the given graph if any.
+        Failures are reported without stopping.
+        Stops on keyboard interrupt.
+    """
+    script_runner.track = tracker.is_supported()
+    script_runner.keep_going = True
+    dependencies = Dependencies(scripts, common_files)
+    watcher = create_watcher(polling)
+    try:
+        to_execute = scripts
+        while True:
+            if to_execute:
+                results = script_runner.execute(to_execute, graph)
+                try:
+                    script_runner.check(results, to_execute)
+                except Exception as e:
+                    sys.stderr.write(f"{e}\n")
+                dependencies.update(results)
+                to_execute = dependencies.changed_scripts() # Files generated for other python scripts
+                if to_execute:
+                    continue
+                watcher.add([*dependencies.files, *[os.path.join(x, "") for x in dependencies.dirpaths]]) # Trailing separator to watch listed directories themselves
+                if script_runner.event_writer != None:
+                    script_runner.event_writer.watching(len(dependencies.files)) # Keeps stdout a stream of events
+                else:
+                    print(f"[autojinja]  watching  {len(dependencies.files)} files")
+                    sys.stdout.flush()
+            watcher.wait()
+            to_execute = dependencies.changed_scripts()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
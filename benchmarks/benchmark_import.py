@@ -0,0 +1,59 @@
+"""
+Benchmarks of the import time, executed with 'python benchmarks/benchmark_import.py [MODULES ...]'.
+Each benchmark prints the best wall time of a new python interpreter importing the given module,
+then the heaviest modules reported by 'python -X importtime' for that import.
+"""
+
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPEAT = 5
+HEAVIEST = 10 # Number of modules reported with -X importtime
+
+def python(args: List[str]) -> subprocess.CompletedProcess:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, *[x for x in [env.get("PYTHONPATH")] if x]])
+    return subprocess.run([sys.executable, *args], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+def wall_time(module: str) -> float:
+    """ Returns the best wall time of a new python interpreter importing the given module, in seconds.
+    """
+    durations: List[float] = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        python(["-c", f"import {module}"])
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+def import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """ Returns the (self, cumulative) import times in microseconds of each module imported with the given module.
+    """
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in python(["-X", "importtime", "-c", f"import {module}"]).stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        values = line[len("import time:"):].split("|")
+        try:
+            times[values[2].strip()] = (int(values[0]), int(values[1]))
+        except ValueError:
+            continue # Header
+    return times
+
+def benchmark(module: str):
+    print(f"import {module:<24} {wall_time(module)*1000:>10.2f} ms")
+    times = import_times(module)
+    print(f"    jinja2 imported: {'yes' if 'jinja2' in times else 'no'}")
+    for name, (self_time, cumulative) in sorted(times.items(), key=lambda x: -x[1][0])[:HEAVIEST]:
+        print(f"    {name:<36} {self_time/1000:>8.2f} ms  (cumulative {cumulative/1000:.2f} ms)")
+
+def main(args: List[str]):
+    for module in args or ["autojinja", "autojinja.__main__"]: # Library, then CLI
+        benchmark(module)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,67 @@
+"""
+Benchmarks of template rendering, executed with 'python benchmarks/benchmark_templates.py [REGIONS ...]'.
+Each benchmark prints its best duration over a few repetitions, for a generated template with the given number of cog regions.
+"""
+
+import os
+import sys
+import timeit
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import autojinja
+
+REPEAT = 5
+
+def jinja_template_string(regions: int) -> str:
+    """ Returns a Jinja template with the given number of multi-line cog regions, separated by jinja2 expressions.
+        Cog headers are identical, so that they are compiled once.
+    """
+    lines: List[str] = []
+    for i in range(regions):
+        lines.append(f"value_{i} = {{{{ values[{i % 10}] }}}}")
+        lines.append("// [[[")
+        lines.append("//   {{ values[0] }}")
+        lines.append("// ]]]")
+        lines.append("// 0")
+        lines.append("// [[[ end ]]]")
+    return "\n".join(lines) + "\n"
+
+def cog_template_string(regions: int) -> str:
+    """ Returns a Cog template with the given number of cog regions, separated by text.
+        Cog headers are identical, so that they are compiled once.
+    """
+    lines: List[str] = []
+    for i in range(regions):
+        lines.append(f"value_{i}")
+        lines.append("// [[[ {{ values[0] }} ]]]")
+        lines.append(f"// [[[ end ]]]")
+    return "\n".join(lines) + "\n"
+
+def large_body_template_string(regions: int) -> str:
+    """ Returns a Cog template with the given number of cog regions, each generating the 'body' variable.
+    """
+    lines: List[str] = []
+    for i in range(regions):
+        lines.append("// [[[ {{ body }} ]]]")
+        lines.append("// [[[ end ]]]")
+    return "\n".join(lines) + "\n"
+
+def benchmark(name: str, regions: int, function: Callable[[], None]):
+    duration = min(timeit.repeat(function, number=1, repeat=REPEAT))
+    print(f"{name:<28} {regions:>6} regions  {duration*1000:>10.2f} ms")
+
+def main(args: List[str]):
+    values = list(range(10))
+    body = "\n".join([f"int value_{i} = {i};" for i in range(100)]) # Without markers
+    for regions in [int(x) for x in args] or [100, 1000, 5000]:
+        template = autojinja.JinjaTemplate.from_string(jinja_template_string(regions))
+        benchmark("JinjaTemplate.render", regions, lambda: template.context(values = values).render())
+        template = autojinja.CogTemplate.from_string(cog_template_string(regions))
+        benchmark("CogTemplate.render", regions, lambda: template.context(values = values).render())
+        template = autojinja.CogTemplate.from_string(large_body_template_string(regions // 10))
+        benchmark("CogTemplate.render (bodies)", regions // 10, lambda: template.context(body = body).render())
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -24,6 +24,8 @@
 ###
 ###     DEPENDS:
 ###         Dependencies for this target, CMake re-executes the autojinja command when such dependencies change.
+###         With CMake 3.20 or later, files read by executed python scripts (templates, imported local modules,
+###         data files) are recorded in a depfile and don't need to be listed.
 ###         Additional dependencies can be provided in parent scopes with the 'autojinja_dependencies'
 ###         function or by directly using the ${AUTOJINJA_DEPENDENCIES} CMake variable.
 ###
@@ -119,13 +121,22 @@ function(autojinja)
             file(TOUCH ${abs_path})
         endif()
     endforeach()
+    # Record dependencies in a depfile
+    set(depfile_options "")
+    set(depfile_arguments "")
+    if(CMAKE_VERSION VERSION_GREATER_EQUAL 3.20)
+        set(depfile "${CMAKE_CURRENT_BINARY_DIR}/${ARG_TARGET}.d")
+        set(depfile_options --depfile ${depfile} --depfile-target "${CMAKE_CURRENT_BINARY_DIR}/${ARG_TARGET}")
+        set(depfile_arguments DEPFILE ${depfile})
+    endif()
     # Create autojinja command
     add_custom_command(
       OUTPUT ${ARG_TARGET}
       WORKING_DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR}
       DEPENDS ${ARG_ARGUMENTS} ${ARG_GENERATES} ${AUTOJINJA_DEPENDENCIES}
-      COMMAND autojinja ${ARG_ARGUMENTS} ${AUTOJINJA_ENVIRONMENT} ${AUTOJINJA_INCLUDES} ${AUTOJINJA_OPTIONS}
+      COMMAND autojinja ${ARG_ARGUMENTS} ${AUTOJINJA_ENVIRONMENT} ${AUTOJINJA_INCLUDES} ${AUTOJINJA_OPTIONS} ${depfile_options}
       COMMAND echo "${ARG_TARGET}" > "${CMAKE_CURRENT_BINARY_DIR}/${ARG_TARGET}"
+      ${depfile_arguments}
     )
     set(${ARG_TARGET} ${ARG_TARGET} ${ARG_GENERATES} PARENT_SCOPE)
 endfunction(autojinja)
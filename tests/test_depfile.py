@@ -0,0 +1,77 @@
+import autojinja
+import os
+import tempfile
+from typing import List
+
+tmp = tempfile.TemporaryDirectory()
+root = autojinja.path.DirPath(tmp.name)
+
+data = root.join("data file.txt")
+generated = root.join("generated.txt")
+script1 = root.join("script1.py")
+script2 = root.join("script2.py")
+envfile = root.join("file.env")
+depfile = root.join("build/autojinja.d")
+outputs_file = root.join("build/outputs.txt")
+includes = os.path.dirname(os.path.dirname(autojinja.__file__))
+with open(data, 'w') as f:
+    f.write("data\n")
+with open(envfile, 'w') as f:
+    f.write("VAR1=1\n")
+with open(script1, 'w') as f:
+    f.write("import autojinja\n" \
+            "with open('data file.txt') as f:\n" \
+            "    content = f.read()\n" \
+            "autojinja.utils.generate_file('generated.txt', content)\n")
+with open(script2, 'w') as f:
+    f.write("with open('generated.txt') as f:\n" \
+            "    f.read()\n")
+
+def read(filepath: str) -> str:
+    with open(filepath, 'r') as f:
+        return f.read()
+
+def read_depfile() -> List[str]:
+    """ Returns the depfile lines without autojinja's own modules, imported from the includes directory.
+    """
+    content = read(depfile)
+    assert content.endswith("\n") and not content.endswith("\\\n")
+    lines = [x.rstrip(" \\") for x in content.splitlines()]
+    return [x for x in lines if not x.startswith(f"  {autojinja.path.no_antislash(includes)}/autojinja/")]
+
+class TestDepfile:
+    def test_1(self):
+        assert autojinja.depfile.escape("dir/file.txt") == "dir/file.txt"
+        assert autojinja.depfile.escape("dir\\my file#1$.txt") == "dir/my\\ file\\#1$$.txt"
+
+    def test_2(self):
+        record1 = autojinja.tracker.Recorder.from_dict({ "inputs": [script1, data, generated], "outputs": [generated], "generated": { generated: {} } })
+        record2 = autojinja.tracker.Recorder.from_dict({ "inputs": [script2, generated, data] })
+        inputs, outputs = autojinja.depfile.collect([record1, None, record2], [envfile])
+        assert inputs == [script1, data, script2, envfile]
+        assert outputs == [generated]
+
+    def test_3(self):
+        autojinja.main("--summary=0", "-i", includes, "-e", envfile, "--depfile", depfile, "--outputs-file", outputs_file, script1, script2)
+        assert read_depfile() == [f"{generated}:",
+                                  f"  {script1}",
+                                  f"  {autojinja.depfile.escape(data)}",
+                                  f"  {script2}",
+                                  f"  {envfile}"]
+        assert read(outputs_file) == f"{generated}\n"
+
+    def test_4(self):
+        autojinja.main("--summary=0", "-i", includes, "--depfile", depfile, "--depfile-target", "stamp", script2)
+        assert read_depfile() == ["stamp:",
+                                  f"  {script2}",
+                                  f"  {generated}"]
+
+    def test_5(self):
+        cache_dir = root.join(".autojinja-cache/")
+        autojinja.main("--summary=0", "-i", includes, "--cache", "--cache-dir", cache_dir, "--outputs-file", outputs_file, script1)
+        os.remove(outputs_file)
+        autojinja.main("--summary=0", "-i", includes, "--cache", "--cache-dir", cache_dir, "--depfile", depfile, "--outputs-file", outputs_file, script1)
+        assert read(outputs_file) == f"{generated}\n"
+        assert read_depfile() == [f"{generated}:",
+                                  f"  {script1}",
+                                  f"  {autojinja.depfile.escape(data)}"]
@@ -0,0 +1,123 @@
+import autojinja
+import os
+import tempfile
+import time
+
+tmp = tempfile.TemporaryDirectory()
+root = autojinja.path.DirPath(tmp.name)
+
+def write(filepath: str, content: str = ""):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'w') as f:
+        f.write(content)
+
+for filepath in ["b.py", "a.py", "__jinja__.py",
+                 "sub/__jinja__.py", "sub/c.py", "sub/generated/d.py", "sub/keep/e.py",
+                 "node_modules/f.py", "build/g.py", ".git/h.py", "env/i.py", "z/j.py"]:
+    write(root.join(filepath), "# autojinja\n")
+write(root.join("env/pyvenv.cfg"))
+write(root.join("untagged.py"), "# nothing\n")
+write(root.join(".autojinjaignore"), "# comment\n" \
+                                     "/z/\n" \
+                                     "!build/\n")
+write(root.join("sub/.autojinjaignore"), "generated/\n" \
+                                         "c.py\n")
+
+def relpaths(scripts):
+    return [autojinja.path.Path(x).abspath[len(root.abspath):] for x in scripts]
+
+class TestIgnoreRules:
+    def test_1(self):
+        assert autojinja.discovery.IgnoreRule("*.py").match("dir/file.py", "file.py", False) == True
+        assert autojinja.discovery.IgnoreRule("*.py").match("dir/file.pyc", "file.pyc", False) == False
+        assert autojinja.discovery.IgnoreRule("dir/").match("dir", "dir", False) == False
+        assert autojinja.discovery.IgnoreRule("dir/").match("a/dir", "dir", True) == True
+        assert autojinja.discovery.IgnoreRule("/dir").match("a/dir", "dir", True) == False
+        assert autojinja.discovery.IgnoreRule("a/*.py").match("a/b/c.py", "c.py", False) == False
+        assert autojinja.discovery.IgnoreRule("a/**/c.py").match("a/b/c.py", "c.py", False) == True
+        assert autojinja.discovery.IgnoreRule("a/**/c.py").match("a/c.py", "c.py", False) == True
+        assert autojinja.discovery.IgnoreRule("file[0-9].py").match("file1.py", "file1.py", False) == True
+        assert autojinja.discovery.IgnoreRule("file[!0-9].py").match("file1.py", "file1.py", False) == False
+
+    def test_2(self):
+        rules = autojinja.discovery.IgnoreRules(autojinja.discovery.IgnoreRules.parse(["*.py", "!keep.py", "# keep.py", "\\#file"], "/root"))
+        assert rules.is_ignored("/root/a.py", False) == True
+        assert rules.is_ignored("/root/dir/keep.py", False) == False
+        assert rules.is_ignored("/root/#file", False) == True
+        assert rules.is_ignored("/root/file", False) == False
+
+class TestDiscover:
+    def test_1(self):
+        scripts = autojinja.discovery.discover(root)
+        assert relpaths(scripts) == ["__jinja__.py", "a.py", "b.py", "build/g.py", "sub/__jinja__.py", "sub/keep/e.py"]
+
+    def test_2(self):
+        scripts = autojinja.discovery.discover(root, ignore=False)
+        assert relpaths(scripts) == ["__jinja__.py", "a.py", "b.py", ".git/h.py", "build/g.py", "env/i.py", "node_modules/f.py",
+                                     "sub/__jinja__.py", "sub/c.py", "sub/generated/d.py", "sub/keep/e.py", "z/j.py"]
+
+    def test_3(self):
+        scripts = autojinja.discovery.discover(root, search_tag=False)
+        assert relpaths(scripts) == ["__jinja__.py", "sub/__jinja__.py"]
+        scripts = autojinja.discovery.discover(root, search_filename=False, recursive=False)
+        assert relpaths(scripts) == ["__jinja__.py", "a.py", "b.py"]
+
+    def test_4(self):
+        scripts = autojinja.discovery.discover(root, filename="b.py", tag="nothing")
+        assert relpaths(scripts) == ["b.py", "untagged.py"]
+
+    def test_5(self):
+        scripts = autojinja.discovery.discover([root.join("sub/"), root.join("env/")], search_tag=False, filename="i.py")
+        assert relpaths(scripts) == ["env/i.py"]
+
+class TestDiscoveryIndex:
+    def setup_method(self):
+        self.calls = []
+        self.scan = autojinja.discovery.scan
+        self.is_file_tagged = autojinja.discovery.is_file_tagged
+        autojinja.discovery.scan = lambda x: self.calls.append(x) or self.scan(x)
+        autojinja.discovery.is_file_tagged = lambda x, tag: self.calls.append(x) or self.is_file_tagged(x, tag)
+
+    def teardown_method(self):
+        autojinja.discovery.scan = self.scan
+        autojinja.discovery.is_file_tagged = self.is_file_tagged
+
+    def test_1(self):
+        dirpath = root.join("indexed/")
+        index_filepath = root.join(".autojinja-cache/discovery.json")
+        for filepath in ["__jinja__.py", "a.py", "sub/b.py", "sub/c.py"]:
+            write(dirpath.join(filepath), "# autojinja\n")
+        mtime = int(time.time() * 1e9) - 10_000_000_000
+        for filepath in ["", "__jinja__.py", "a.py", "sub/", "sub/b.py", "sub/c.py"]:
+            os.utime(dirpath.join(filepath), ns=(mtime, mtime))
+        expected = ["indexed/__jinja__.py", "indexed/a.py", "indexed/sub/b.py", "indexed/sub/c.py"]
+        ### First run
+        index = autojinja.discovery.DiscoveryIndex(index_filepath)
+        assert relpaths(autojinja.discovery.discover(dirpath, index=index)) == expected
+        assert len(self.calls) == 5
+        index.save()
+        ### Unchanged
+        self.calls.clear()
+        index = autojinja.discovery.DiscoveryIndex(index_filepath)
+        assert relpaths(autojinja.discovery.discover(dirpath, index=index)) == expected
+        assert self.calls == []
+        ### Changed file
+        with open(dirpath.join("sub/b.py"), 'w') as f:
+            f.write("# untagged\n")
+        os.utime(dirpath.join("sub/b.py"), ns=(mtime, mtime))
+        assert relpaths(autojinja.discovery.discover(dirpath, index=index)) == ["indexed/__jinja__.py", "indexed/a.py", "indexed/sub/c.py"]
+        assert self.calls == [dirpath.join("sub/b.py")]
+        index.save()
+        ### Removed file
+        self.calls.clear()
+        os.remove(dirpath.join("sub/c.py"))
+        index = autojinja.discovery.DiscoveryIndex(index_filepath)
+        assert relpaths(autojinja.discovery.discover(dirpath, index=index)) == ["indexed/__jinja__.py", "indexed/a.py"]
+        assert self.calls == [dirpath.join("sub")]
+        index.save()
+        index = autojinja.discovery.DiscoveryIndex(index_filepath)
+        assert dirpath.join("sub/c.py") not in index.files
+        assert dirpath.join("sub/b.py") in index.files
+        ### Other tag
+        index = autojinja.discovery.DiscoveryIndex(index_filepath, tag="tag")
+        assert index.dirs == {} and index.files == {}
@@ -1285,6 +1285,47 @@ class Test_Jinja2Exceptions:
                 autojinja.RawTemplate.environment = None
 
 class Test:
+    def test_coordinates(self):
+        try:
+            autojinja.CogTemplate.from_string("abc\n  [[[end]]]").context().render()
+        except autojinja.exceptions.OpenMarkerNotFoundException as e:
+            assert (e.lineno, e.column) == (2, 3)
+        else:
+            assert False
+        try:
+            autojinja.CogTemplate.from_string("\n [[[<<[end]>>]]]  [[[end]]]").context().render()
+        except autojinja.exceptions.OpenMarkerNotFoundException as e:
+            assert (e.lineno, e.column) == (2, 2) # Outermost marker
+        else:
+            assert False
+    def test_marker_lines(self):
+        ### Lines counted from the previous section
+        template = autojinja.CogTemplate.from_string("<<[ a ]>>\n[[[ {{ 2 }} ]]][[[ end ]]]\n<<[ end ]>>")
+        assert [x.header_open_lineno for x in template.markers] == [1, 2, 2, 3]
+        input = "<<[ a ]>>\n" \
+                "[[[ {{ 2 }} ]]][[[ end ]]]\n" \
+                "[[[ {{ 2 +* }} ]]][[[ end ]]]\n" \
+                "<<[ end ]>>\n"
+        msg = "\n  During reinsertion of \"<<[ a ]>>\" at line 1, column 1\n" \
+                "  File \"{{ 2 +* }}\", line 3, in template\n" \
+                "unexpected '*'"
+        invalid_marker_CogTemplate(input, None, jinja2.exceptions.TemplateSyntaxError, msg)
+        input = "<<[ a ]>>\n" \
+                "[[[ {{ 2 }} ]]][[[ end ]]]\n" \
+                "<<[ end ]>>\n" \
+                "[[[ {{ 2 +* }} ]]][[[ end ]]]\n"
+        msg = "\n  File \"{{ 2 +* }}\", line 4, in template\n" \
+                "unexpected '*'"
+        invalid_marker_CogTemplate(input, None, jinja2.exceptions.TemplateSyntaxError, msg)
+        input = "<<[ a ]>>\n" \
+                "[[[ {{ 2 }} ]]][[[ end ]]]\n" \
+                "<<[ end ]>>\n" \
+                "<<[ a ]>><<[ end ]>>\n"
+        msg = "Duplicate edit marker \"<<[ a ]>>\", consider reusing/removing duplicates:\n" \
+                "<<[ a ]>><<[ end ]>>\\n\n" \
+                "^^^ line 4, column 1"
+        invalid_marker(input, None, autojinja.exceptions.DuplicateEditException, msg)
+
     def test_index_to_coordinates(self):
         input = "abcdef\n" \
                 "ghijklmnopqrst\n" \
@@ -0,0 +1,49 @@
+import autojinja
+import os
+import subprocess
+import sys
+
+env = os.environ.copy()
+env["PYTHONPATH"] = os.path.dirname(os.path.dirname(autojinja.__file__))
+
+def import_times(code: str):
+    """ Returns the cumulative import time of each module imported by the given code, in microseconds.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("| imported package"):
+            _, cumulative, name = line[len("import time:"):].split('|')
+            times[name.strip()] = int(cumulative)
+    return times
+
+class TestLazyImport:
+    def test_1(self):
+        times = import_times("import autojinja")
+        assert "autojinja" in times
+        assert "jinja2" not in times
+        assert "autojinja.runner" not in times
+
+    def test_2(self):
+        times = import_times("import autojinja; autojinja.utils.edits_from_string(''); autojinja.Path('file.txt'); autojinja.main")
+        assert "autojinja.utils" in times
+        assert "autojinja.main" in times
+        assert "jinja2" not in times
+
+    def test_3(self):
+        times = import_times("import autojinja; autojinja.Template")
+        assert "autojinja.templates" in times
+        assert "jinja2" in times
+        times = import_times("from autojinja import *")
+        assert "jinja2" in times
+
+    def test_4(self):
+        assert autojinja.DirPath is autojinja.path.DirPath
+        assert autojinja.declare is autojinja.tracker.declare
+        assert "Template" in dir(autojinja)
+        try:
+            autojinja.missing
+        except AttributeError as e:
+            assert str(e) == "module 'autojinja' has no attribute 'missing'"
+        else:
+            assert False
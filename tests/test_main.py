@@ -1,8 +1,16 @@
 from . import assert_exception
 
 import autojinja
+import contextlib
+import io
+import json
 import os
+import socket
+import sys
 import tempfile
+import threading
+import time
+from typing import List
 
 def invalid_autojinja(exception_type: type, message: str, *args: str, **kwargs: str):
     def function(*args: str, **kwargs: str):
@@ -108,6 +116,126 @@ with open(file13, 'w') as f:
             f"sys.stdout.write(\"print2\\n\")\n" \
             f"raise Exception(\"Error\")\n")
 
+# TestInProcess
+dir3 = root.join("dir3/")
+dir4 = root.join("dir4/")
+os.mkdir(dir3)
+os.mkdir(dir4)
+file16 = dir3.join("script_in_process.py")
+file17 = dir4.join("script_in_process.py")
+for dir, value in [(dir3, "module3"), (dir4, "module4")]:
+    with open(dir.join("local_module.py"), 'w') as f:
+        f.write(f"value = '{value}'\n")
+for file in [file16, file17]:
+    with open(file, 'w') as f:
+        f.write(f"import os\n" \
+                f"import sys\n" \
+                f"import local_module\n" \
+                f"os.environ['VAR3'] = 'modified'\n" \
+                f"sys.path.append('modified')\n" \
+                f"with open('{output}', 'a') as f:\n" \
+                f"    f.write(local_module.value + ' ' + os.path.basename(os.getcwd()) + ' ' + os.path.basename(sys.argv[0]) + ' ' + os.environ.get('VAR1', '') + '\\n')\n")
+file16b = dir3.join("script_include.py")
+file17b = dir4.join("script_include.py")
+for dir, value in [(dir3, "include3"), (dir4, "include4")]:
+    with open(dir.join("main.txt"), 'w') as f:
+        f.write("{% include 'include.txt' %}")
+    with open(dir.join("include.txt"), 'w') as f:
+        f.write(value)
+for file in [file16b, file17b]:
+    with open(file, 'w') as f:
+        f.write(f"import os\n" \
+                f"import autojinja\n" \
+                f"with open('{output}', 'a') as f:\n" \
+                f"    f.write(autojinja.RawTemplate.from_file('main.txt').render() + '\\n')\n")
+file18 = root.join("script_exit.py")
+with open(file18, 'w') as f:
+    f.write("import sys\n" \
+            "print('exiting')\n" \
+            "sys.exit(3)\n")
+
+# TestCache
+dir5 = root.join("dir5/")
+os.mkdir(dir5)
+file19 = dir5.join("script_cache.py")
+data = dir5.join("data.txt")
+counter = dir5.join("counter.txt")
+cache_dir = root.join(".autojinja-cache/")
+with open(data, 'w') as f:
+    f.write("data")
+with open(file19, 'w') as f:
+    f.write(f"import os\n" \
+            f"with open('data.txt', 'r') as f:\n" \
+            f"    f.read()\n" \
+            f"count = 0\n" \
+            f"if os.path.exists('counter.txt'):\n" \
+            f"    with open('counter.txt', 'r') as f:\n" \
+            f"        count = int(f.read())\n" \
+            f"with open('counter.txt', 'w') as f:\n" \
+            f"    f.write(str(count + 1))\n")
+def read_counter():
+    with open(counter, 'r') as f:
+        return f.read()
+dir6 = root.join("dir6/")
+os.mkdir(dir6)
+file19a = dir6.join("script_copy.py")
+file19b = dir6.join("script_upper.py")
+src = dir6.join("src.txt")
+out = dir6.join("out.txt")
+with open(src, 'w') as f:
+    f.write("one")
+with open(file19a, 'w') as f:
+    f.write("import os\n" \
+            "with open('src.txt', 'r') as f:\n" \
+            "    content = f.read()\n" \
+            "with open('mid.txt', 'w') as f:\n" \
+            "    f.write(content)\n")
+with open(file19b, 'w') as f:
+    f.write("import os\n" \
+            "with open('mid.txt', 'r') as f:\n" \
+            "    content = f.read()\n" \
+            "with open('out.txt', 'w') as f:\n" \
+            "    f.write(content.upper())\n")
+dir7 = root.join("dir7/")
+os.mkdir(dir7)
+file19c = dir7.join("script_glob.py")
+listing = dir7.join("listing.txt")
+os.mkdir(dir7.join("templates/"))
+with open(dir7.join("templates/a.txt"), 'w') as f:
+    f.write("a")
+with open(file19c, 'w') as f:
+    f.write("import glob\n" \
+            "import os\n" \
+            "names = sorted([os.path.basename(x) for x in glob.glob('templates/*.txt')])\n" \
+            "with open('listing.txt', 'w') as f:\n" \
+            "    f.write(','.join(names))\n")
+
+# TestReport
+file20 = dir5.join("script_report.py")
+report = root.join("report.json")
+with open(file20, 'w') as f:
+    f.write("import os\n" \
+            "import autojinja\n" \
+            "autojinja.utils.generate_file('report1.txt', 'content')\n" \
+            "autojinja.utils.generate_file('report2.txt', 'content')\n")
+
+# TestCheck
+file21 = dir5.join("script_check.py")
+checked = dir5.join("checked.txt")
+with open(file21, 'w') as f:
+    f.write("import os\n" \
+            "import autojinja\n" \
+            "autojinja.utils.generate_file('checked.txt', os.environ['VAR1'] + '\\n')\n")
+
+# TestEvents
+file22 = dir5.join("script_events.py")
+with open(file22, 'w') as f:
+    f.write("import os\n" \
+            "import autojinja\n" \
+            "autojinja.utils.generate_file('events.txt', 'events')\n" \
+            "print('output')\n" \
+            "autojinja.CogTemplate.from_string('\\n  [[[end]]]').context().render()\n")
+
 # TestSummary
 file15 = root.join("script_summary.py")
 with open(file15, 'w') as f:
@@ -203,6 +331,14 @@ class TestSearch:
         message = f"Error 1 while executing script at path \"{file7.abspath}\""
         invalid_autojinja(Exception, message, file7)
 
+    # Index
+    def test_18(self):
+        for _ in range(2):
+            clear_output()
+            autojinja.main("-a", "--index", "--cache-dir", cache_dir, "--filename", "script.py", "--tag", "tag", root)
+            assert read_output() == "file1\nfile2\nfile3\nfile4\nfile5\nfile6\n"
+        assert cache_dir.join("discovery.json").exists
+
 class TestEnv:
     def test_1(self):
         clear_output()
@@ -413,6 +549,339 @@ class TestSilent:
         assert str(exception).endswith(message_end) == True
         del os.environ[autojinja.defaults.AUTOJINJA_SILENT]
 
+class TestJobs:
+    def test_1(self):
+        clear_output()
+        autojinja.main("-j", "4", file1, file2, file3, file4, file5, file6)
+        assert sorted(read_output().splitlines()) == ["file1", "file2", "file3", "file4", "file5", "file6"]
+
+    def test_2(self):
+        clear_output()
+        autojinja.main("--jobs=0", "-a", "--filename", "script.py", "--tag", "tag", root)
+        assert sorted(read_output().splitlines()) == ["file1", "file2", "file3", "file4", "file5", "file6"]
+
+    def test_3(self):
+        message = f"Error 1 while executing script at path \"{file7.abspath}\""
+        invalid_autojinja(Exception, message, "-j", "2", file7)
+
+    def test_4(self):
+        message = "Expected a positive number of jobs, got -1"
+        invalid_autojinja(Exception, message, "-j", "-1", file1)
+
+class TestKeepGoing:
+    def test_1(self):
+        clear_output()
+        message = f"Error 1 while executing script at path \"{file7.abspath}\""
+        invalid_autojinja(Exception, message, "--keep-going", file7, file1)
+        assert read_output() == "file1\n"
+
+    def test_2(self):
+        clear_output()
+        message = f"Error 1 while executing script at path \"{file7.abspath}\"\n" \
+                  f"Error 1 while executing script at path \"{file13.abspath}\""
+        invalid_autojinja(Exception, message, "-k", file7, file1, file13)
+        assert read_output() == "file1\n"
+
+    def test_3(self):
+        clear_output()
+        message = f"Error 1 while executing script at path \"{file7.abspath}\""
+        invalid_autojinja(Exception, message, file7, file1)
+        assert not output.exists
+
+    def test_4(self):
+        clear_output()
+        try:
+            autojinja.main("-k", "-j", "2", "--silent", file13, file1, file7)
+        except Exception as e:
+            exception = e
+        else:
+            exception = None
+        assert str(exception).startswith("error1\nprint1\nerror2\nprint2\n") == True
+        assert str(exception).count("Error 1 while executing script at path") == 2
+        assert read_output() == "file1\n"
+
+    def test_5(self):
+        message = f"Error 1 while executing script at path \"{file13.abspath}\"\n" \
+                  f"Error 1 while executing script at path \"{file7.abspath}\""
+        for i in range(3): # Failures are reported in order of python scripts, whatever the order of completion
+            clear_output()
+            stdout = io.StringIO()
+            stderr = io.StringIO()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                invalid_autojinja(Exception, message, "-k", "-j", "3", file13, file7, file1)
+            assert read_output() == "file1\n"
+            assert "print1\nprint2\n" in stdout.getvalue() and "error" not in stdout.getvalue()
+            assert "error1\nerror2\n" in stderr.getvalue() and "print" not in stderr.getvalue()
+            assert "Exception: faulty" in stderr.getvalue()
+
+class TestInProcess:
+    def test_1(self):
+        clear_output()
+        autojinja.main("--in-process", file1, file2, file3, file4, file5, file6)
+        assert read_output() == "file1\nfile2\nfile3\nfile4\nfile5\nfile6\n"
+
+    def test_2(self):
+        clear_output()
+        cwd = os.getcwd()
+        sys_path = sys.path[:]
+        autojinja.main("--in-process", "-e", "VAR1=1", file16, file17)
+        assert read_output() == "module3 dir3 script_in_process.py 1\nmodule4 dir4 script_in_process.py 1\n"
+        assert os.getcwd() == cwd
+        assert sys.path == sys_path
+        assert "VAR1" not in os.environ
+        assert "VAR3" not in os.environ
+        assert "local_module" not in sys.modules
+
+    def test_3(self):
+        clear_output()
+        autojinja.main("--in-process", "--env", "VAR1=1", file8)
+        assert read_output() == "1\n"
+
+    def test_4(self):
+        message = f"Error 1 while executing script at path \"{file7.abspath}\""
+        invalid_autojinja(Exception, message, "--in-process", file7)
+
+    def test_5(self):
+        message = f"exiting\nError 3 while executing script at path \"{file18.abspath}\""
+        invalid_autojinja(Exception, message, "--in-process", "--silent", file18)
+
+    def test_6(self):
+        message = "Option '--in-process' executes python scripts sequentially and can't be combined with '--jobs'"
+        invalid_autojinja(Exception, message, "--in-process", "-j", "2", file1)
+
+    def test_7(self):
+        ### Included templates are cached by filepath across python scripts
+        clear_output()
+        autojinja.main("--in-process", file16b, file17b)
+        assert read_output() == "include3\ninclude4\n"
+        environment = autojinja.RawTemplate.environment or autojinja.runner.shared_environments[None]
+        filepaths = [x[1] for x in environment.cache.keys()]
+        assert dir3.join("include.txt") in filepaths and dir4.join("include.txt") in filepaths
+        ### Modified templates are reloaded
+        include = dir3.join("include.txt")
+        with open(include, 'w') as f:
+            f.write("modified3")
+        mtime = os.path.getmtime(include) + 10
+        os.utime(include, (mtime, mtime))
+        clear_output()
+        autojinja.main("--in-process", file16b, file17b)
+        assert read_output() == "modified3\ninclude4\n"
+
+class TestDaemon:
+    def test_1(self):
+        clear_output()
+        socket_path = root.join("autojinja.sock")
+        autojinja.main("--daemon", "--socket", socket_path, "--idle-timeout", "5", file1, file2)
+        assert read_output() == "file1\nfile2\n"
+        clear_output()
+        autojinja.main("--daemon", "--socket", socket_path, "--idle-timeout", "5", "-e", "VAR1=1", file8)
+        assert read_output() == "1\n"
+        message = f"Error 1 while executing script at path \"{file7.abspath}\""
+        invalid_autojinja(Exception, message, "--daemon", "--socket", socket_path, "--idle-timeout", "5", file7)
+
+    def test_2(self):
+        ### Default socket in the runtime directory, or in a private temporary directory
+        old_runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+        try:
+            os.environ["XDG_RUNTIME_DIR"] = root
+            assert autojinja.daemon.default_socket_path() == os.path.join(root, "autojinja.sock")
+            del os.environ["XDG_RUNTIME_DIR"]
+            assert autojinja.daemon.default_socket_path() == os.path.join(tempfile.gettempdir(), f"autojinja-{os.getuid()}", "autojinja.sock")
+        finally:
+            if old_runtime_dir != None:
+                os.environ["XDG_RUNTIME_DIR"] = old_runtime_dir
+        ### Private directories
+        dirpath = root.join("private/")
+        autojinja.daemon.private_dirpath(dirpath)
+        assert os.stat(dirpath).st_mode & 0o777 == 0o700
+        autojinja.daemon.private_dirpath(dirpath)
+        os.chmod(dirpath, 0o755)
+        message = f"Directory at path \"{dirpath}\" must be a directory accessible only by the current user"
+        assert_exception(lambda: autojinja.daemon.private_dirpath(dirpath), Exception, message)
+        ### Peer credentials
+        socket_path = root.join("peer.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen()
+        try:
+            client = autojinja.daemon._connect(socket_path)
+            assert client != None
+            client.close()
+            assert autojinja.daemon.peer_uid(server.accept()[0], socket_path) == os.getuid()
+        finally:
+            server.close()
+            os.remove(socket_path)
+
+    def test_3(self):
+        ### Invalid requests and disconnected clients don't stop the server
+        clear_output()
+        socket_path = root.join("robust.sock")
+        server = threading.Thread(target=autojinja.daemon.serve, args=(socket_path, 2))
+        server.start()
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+            def request(line: str, wait: bool = True) -> List[dict]:
+                client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                client.connect(socket_path)
+                with client:
+                    client.sendall(line.encode("utf-8"))
+                    if not wait:
+                        return []
+                    with client.makefile('r', encoding="utf-8") as file:
+                        return [json.loads(x) for x in file]
+            assert request("invalid\n") == []
+            assert request("{}\n") == []
+            valid = json.dumps({ "arguments": [file1], "env": dict(os.environ), "cwd": os.getcwd() }) + "\n"
+            request(valid, False)
+            assert request(valid)[-1] == { "exit": 0, "error": None }
+            assert read_output().endswith("file1\n")
+        finally:
+            server.join()
+        assert not os.path.exists(socket_path)
+
+class TestCache:
+    def test_1(self):
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19)
+        assert read_counter() == "1"
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19)
+        assert read_counter() == "1"
+        assert cache_dir.join("manifest.json").exists
+        with open(data, 'w') as f:
+            f.write("modified")
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19)
+        assert read_counter() == "2"
+        autojinja.main("--cache", "--cache-dir", cache_dir, "--force", file19)
+        assert read_counter() == "3"
+        autojinja.main("--cache", "--cache-dir", cache_dir, "-e", "VAR1=1", file19)
+        assert read_counter() == "4"
+        autojinja.main("--cache", "--cache-dir", cache_dir, "-e", "VAR1=1", file19)
+        assert read_counter() == "4"
+        os.remove(counter)
+        autojinja.main("--cache", "--cache-dir", cache_dir, "-e", "VAR1=1", file19)
+        assert read_counter() == "1"
+        autojinja.main(file19)
+        assert read_counter() == "2"
+    def test_3(self):
+        autojinja.main("--cache", "--cache-dir", cache_dir, "--force", file19)
+        count = int(read_counter())
+        ### Unrelated environment variables
+        os.environ["TERM_SESSION_ID"] = "session"
+        try:
+            autojinja.main("--cache", "--cache-dir", cache_dir, file19)
+        finally:
+            del os.environ["TERM_SESSION_ID"]
+        assert read_counter() == str(count)
+        ### Modified in the same modification time tick as the recording
+        stat = os.stat(data)
+        with open(data, 'w') as f:
+            f.write("x" * stat.st_size)
+        os.utime(data, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19)
+        assert read_counter() == str(count + 1)
+
+    def test_2(self):
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19a, file19b)
+        with open(out, 'r') as f:
+            assert f.read() == "ONE"
+        with open(src, 'w') as f:
+            f.write("two")
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19a, file19b)
+        with open(out, 'r') as f:
+            assert f.read() == "TWO"
+
+    def test_4(self):
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19c)
+        with open(listing, 'r') as f:
+            assert f.read() == "a.txt"
+        with open(dir7.join("templates/b.txt"), 'w') as f:
+            f.write("b")
+        autojinja.main("--cache", "--cache-dir", cache_dir, file19c)
+        with open(listing, 'r') as f:
+            assert f.read() == "a.txt,b.txt"
+
+class TestReport:
+    def test_1(self):
+        includes = os.path.dirname(os.path.dirname(autojinja.__file__))
+        message = f"Error 1 while executing script at path \"{file7.abspath}\""
+        invalid_autojinja(Exception, message, "--summary=0", "-k", "-i", includes, "--report", report, file20, file7)
+        with open(report, 'r') as f:
+            values = json.load(f)
+        assert [x["script"] for x in values["scripts"]] == [file20, file7]
+        assert [x["exit_code"] for x in values["scripts"]] == [0, 1]
+        assert values["scripts"][0]["files_written"] == 2
+        assert values["scripts"][0]["files_changed"] == 2
+        assert values["scripts"][0]["bytes_written"] == 14
+        assert values["scripts"][0]["wall_time"] > 0
+        autojinja.main("--summary=0", "-i", includes, "--report", report, file20)
+        with open(report, 'r') as f:
+            values = json.load(f)
+        assert values["scripts"][0]["files_written"] == 2
+        assert values["scripts"][0]["files_changed"] == 0
+        assert values["scripts"][0]["bytes_written"] == 0
+
+class TestShard:
+    def test_1(self):
+        lines = []
+        for i in range(1, 4):
+            clear_output()
+            autojinja.main("--shard", f"{i}/3", file1, file2, file3, file4, file5, file6)
+            lines += read_output().splitlines() if output.exists else []
+        assert sorted(lines) == ["file1", "file2", "file3", "file4", "file5", "file6"]
+        invalid_autojinja(Exception, "Expected I/N with 1 <= I <= N for option '--shard', got '4/3'", "--shard", "4/3", file1)
+
+class TestCheck:
+    def test_1(self):
+        includes = os.path.dirname(os.path.dirname(autojinja.__file__))
+        autojinja.main("--summary=0", "-i", includes, "-e", "VAR1=1", file21)
+        mtime = os.stat(checked).st_mtime_ns
+        autojinja.main("--check", "--summary=0", "-i", includes, "-e", "VAR1=1", file21)
+        message = f"Generated file at path \"{checked}\" is out of date (from \"{file21}\")"
+        invalid_autojinja(Exception, message, "--check", "--summary=0", "-i", includes, "-e", "VAR1=2", file21)
+        message = f"Error 1 while executing script at path \"{file7.abspath}\"\n" + message
+        invalid_autojinja(Exception, message, "--check", "--summary=0", "-i", includes, "-e", "VAR1=2", file7, file21)
+        with open(checked, 'r') as f:
+            assert f.read() == "1\n"
+        assert os.stat(checked).st_mtime_ns == mtime
+        stream = io.StringIO()
+        with contextlib.redirect_stdout(stream):
+            message = f"Generated file at path \"{checked}\" is out of date (from \"{file21}\")"
+            invalid_autojinja(Exception, message, "--check", "--silent", "--summary=0", "-i", includes, "-e", "VAR1=2", file21)
+        assert stream.getvalue().endswith("-1\n+2\n")
+
+class TestEvents:
+    def test_1(self):
+        includes = os.path.dirname(os.path.dirname(autojinja.__file__))
+        for arguments in [[], ["--in-process"], ["-j", "2"]]:
+            stream = io.StringIO()
+            with contextlib.redirect_stdout(stream):
+                try:
+                    autojinja.main("--events=jsonl", "-i", includes, *arguments, file22)
+                except Exception:
+                    pass
+                else:
+                    assert False
+            values = [json.loads(x) for x in stream.getvalue().splitlines()]
+            assert [x["event"] for x in values] == ["script_started", "file_generated", "error", "script_finished", "error"]
+            assert values[1]["path"] == dir5.join("events.txt")
+            assert values[1]["bytes"] == 6
+            assert values[2]["script"] == file22
+            assert values[2]["type"] == "OpenMarkerNotFoundException"
+            assert (values[2]["line"], values[2]["column"]) == (2, 3)
+            assert values[3]["exit_code"] == 1
+            assert values[3]["duration"] > 0
+            assert "output\n" in values[3]["output"]
+            assert values[4]["script"] == None
+            assert values[4]["message"].startswith("Error 1 while executing script")
+
+    def test_2(self):
+        stream = io.StringIO()
+        writer = autojinja.events.EventWriter(stream)
+        writer.emit("script_started", script="script.py")
+        writer.error("message")
+        assert stream.getvalue() == '{"event": "script_started", "script": "script.py"}\n' \
+                                    '{"event": "error", "script": null, "message": "message", "type": null, "line": null, "column": null}\n'
+
 class TestSummary:
     def test_1(self):
         clear_output()
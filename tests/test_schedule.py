@@ -0,0 +1,123 @@
+import autojinja
+import os
+import tempfile
+
+tmp = tempfile.TemporaryDirectory()
+root = autojinja.path.DirPath(tmp.name)
+
+generated = root.join("generated.txt")
+consumer = root.join("consumer.py")
+producer = root.join("producer.py")
+faulty = root.join("faulty.py")
+cycle1 = root.join("cycle1.py")
+cycle2 = root.join("cycle2.py")
+with open(consumer, 'w') as f:
+    f.write("#!/usr/bin/env python\n" \
+            "# autojinja-inputs: generated.txt\n" \
+            "\n" \
+            "with open('generated.txt') as f:\n" \
+            "    assert f.read() == 'generated'\n")
+with open(producer, 'w') as f:
+    f.write("# autojinja-outputs: generated.txt 'other file.txt'\n" \
+            "import time\n" \
+            "time.sleep(0.2)\n" \
+            "with open('generated.txt', 'w') as f:\n" \
+            "    f.write('generated')\n")
+with open(faulty, 'w') as f:
+    f.write("# autojinja-outputs: generated.txt\n" \
+            "raise Exception('faulty')\n")
+with open(cycle1, 'w') as f:
+    f.write("# autojinja-inputs: file2.txt\n" \
+            "# autojinja-outputs: file1.txt\n")
+with open(cycle2, 'w') as f:
+    f.write("# autojinja-inputs: file1.txt\n" \
+            "# autojinja-outputs: file2.txt\n")
+
+env = os.environ.copy()
+env["PYTHONPATH"] = os.path.dirname(os.path.dirname(autojinja.__file__))
+
+def clear_generated():
+    if generated.exists:
+        os.remove(generated)
+
+class TestPragmas:
+    def test_1(self):
+        assert autojinja.schedule.read_pragmas(consumer) == ([generated], [])
+        assert autojinja.schedule.read_pragmas(producer) == ([], [generated, root.join("other file.txt")])
+
+class TestGraph:
+    def test_1(self):
+        graph = autojinja.schedule.Graph([consumer, producer])
+        assert graph.prerequisites == { consumer: set([producer]), producer: set() }
+        assert graph.order() == [producer, consumer]
+        assert graph.order([consumer]) == [consumer]
+
+    def test_2(self):
+        record = autojinja.tracker.Recorder.from_dict({ "inputs": [generated] })
+        graph = autojinja.schedule.Graph([cycle1, cycle2], [record, None], pragmas=False)
+        assert graph.has_edges == False
+
+    def test_3(self):
+        graph = autojinja.schedule.Graph([consumer, cycle1, cycle2])
+        try:
+            graph.order()
+        except Exception as e:
+            assert str(e) == f"Dependency cycle between python scripts:\n    {cycle2}\n    {cycle1}\n    {cycle2}"
+        else:
+            assert False
+
+    def test_4(self, capsys):
+        recorded = root.join("recorded.txt")
+        records = [autojinja.tracker.Recorder.from_dict({ "generated": { recorded: {} } }),
+                   autojinja.tracker.Recorder.from_dict({ "inputs": [recorded] })]
+        graph = autojinja.schedule.recorded_graph([consumer, producer], records)
+        assert graph.order() == [producer, consumer]
+        assert "warning  ignoring files recorded on previous runs" in capsys.readouterr().err
+        graph = autojinja.schedule.recorded_graph([consumer, producer], [None, None])
+        assert graph.order() == [producer, consumer]
+        assert capsys.readouterr().err == ""
+
+class TestDeclare:
+    def test_1(self):
+        recorder = autojinja.tracker.Recorder()
+        recorder.start()
+        try:
+            autojinja.declare(inputs=[consumer], outputs=generated)
+        finally:
+            recorder.stop()
+        assert consumer in recorder.inputs
+        assert recorder.generated[generated]["status"] == "declared"
+        record = autojinja.tracker.Recorder.from_dict({ "inputs": [generated] })
+        graph = autojinja.schedule.Graph([consumer, producer], [record, recorder], pragmas=False)
+        assert graph.order() == [producer, consumer]
+
+class TestRunner:
+    def test_1(self):
+        for jobs in [1, 2]:
+            clear_generated()
+            runner = autojinja.runner.Runner(env, silent=True, jobs=jobs)
+            graph = autojinja.schedule.Graph([consumer, producer])
+            results = runner.run([consumer, producer], graph)
+            assert [x.script for x in results] == [producer, consumer]
+
+    def test_2(self):
+        for jobs in [1, 2]:
+            clear_generated()
+            runner = autojinja.runner.Runner(env, silent=True, jobs=jobs, keep_going=True)
+            graph = autojinja.schedule.Graph([consumer, faulty])
+            results = runner.execute([consumer, faulty], graph)
+            assert [x.script for x in results] == [faulty]
+            assert results[0].failed
+            assert runner.skipped == { consumer: faulty }
+            try:
+                runner.check(results, [consumer, faulty])
+            except Exception as e:
+                assert str(e).endswith(f"Error 1 while executing script at path \"{faulty}\"\n" \
+                                 f"Skipped script at path \"{consumer}\" because script at path \"{faulty}\" failed")
+            else:
+                assert False
+
+    def test_3(self):
+        clear_generated()
+        autojinja.main("-j", "2", consumer, producer)
+        assert generated.exists
@@ -0,0 +1,66 @@
+import autojinja
+import json
+import os
+import tempfile
+
+tmp = tempfile.TemporaryDirectory()
+root = autojinja.path.DirPath(tmp.name)
+
+scripts = [root.join(f"dir{i // 10}/script{i}.py") for i in range(40)]
+for script in scripts:
+    os.makedirs(script.dirpath, exist_ok=True)
+    with open(script, 'w') as f:
+        f.write("import os\n")
+producer = root.join("producer.py")
+consumer = root.join("consumer.py")
+with open(producer, 'w') as f:
+    f.write("# autojinja-outputs: generated.txt\n")
+with open(consumer, 'w') as f:
+    f.write("# autojinja-inputs: generated.txt\n")
+
+def shards(scripts, count, graph = None, durations = None, cwd = root):
+    return [autojinja.shard.select(scripts, i, count, graph, durations, cwd) for i in range(1, count+1)]
+
+class TestParse:
+    def test_1(self):
+        assert autojinja.shard.parse("3/8") == (3, 8)
+        for value in ["0/8", "9/8", "1/0", "3", "a/b"]:
+            try:
+                autojinja.shard.parse(value)
+            except Exception as e:
+                assert str(e) == f"Expected I/N with 1 <= I <= N for option '--shard', got '{value}'"
+            else:
+                assert False
+
+class TestSelect:
+    def test_1(self):
+        result = shards(scripts, 4)
+        assert sorted([x for shard in result for x in shard]) == sorted(scripts)
+        assert all([shard == [x for x in scripts if x in shard] for shard in result]) # Order kept
+        assert all([len(shard) > 0 for shard in result])
+        ### Stable across machines
+        other = autojinja.path.DirPath("/other/checkout/")
+        moved = [other.join(autojinja.shard.relpath(x, root)) for x in scripts]
+        assert [[autojinja.shard.relpath(x, other) for x in shard] for shard in shards(moved, 4, cwd=other)] == \
+               [[autojinja.shard.relpath(x, root) for x in shard] for shard in result]
+
+    def test_2(self):
+        graph = autojinja.schedule.Graph([consumer, *scripts, producer])
+        for shard in shards([consumer, *scripts, producer], 8, graph):
+            assert (consumer in shard) == (producer in shard)
+
+    def test_3(self):
+        durations = { autojinja.shard.relpath(x, root): 1.0 for x in scripts }
+        durations[autojinja.shard.relpath(scripts[0], root)] = 20.0
+        result = shards(scripts, 3, durations=durations)
+        assert [len(x) for x in sorted(result, key=len)] == [1, 19, 20]
+        assert [scripts[0]] in result
+
+class TestDurations:
+    def test_1(self):
+        report = root.join("report.json")
+        with open(report, 'w') as f:
+            json.dump({ "cwd": "/other/checkout",
+                        "scripts": [{ "script": "/other/checkout/dir0/script0.py", "wall_time": 1.5 },
+                                    { "script": "/other/checkout/dir0/script1.py", "wall_time": None }] }, f)
+        assert autojinja.shard.read_durations([report, root.join("missing.json")]) == { "dir0/script0.py": 1.5 }
@@ -1,7 +1,10 @@
 from . import assert_exception, assert_clean_exception, Class1, Class2, Class3, DiffException
 
+import asyncio
 import autojinja
+import hashlib
 import os
+import pickle
 import sys
 import tempfile
 from typing import Dict, Optional, Tuple, Type, Union
@@ -14,6 +17,16 @@ root = autojinja.path.DirPath(tmp.name)
 input_file = root.join("input.txt")
 output_file = root.join("output.txt")
 
+def double(value): # Filter of a custom environment, picklable
+    return value * 2
+
+def run_async(coroutine): # Same as asyncio.run, also available on python 3.6
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
 def invalid_autojinja(input: str, exception_type: type, message: str, *args: str, **kwargs: str):
     def function(*args: str, **kwargs: str):
         template = autojinja.JinjaTemplate.from_string(input)
@@ -27,6 +40,12 @@ class Generator_RawTemplate:
         result = template.context(*args, **kwargs).render()
         if result != expected:
             raise DiffException(result, expected)
+        result = "".join(template.context(*args, **kwargs).render_chunks())
+        if result != expected:
+            raise DiffException(result, expected)
+        result = run_async(template.context(*args, **kwargs).render_async())
+        if result != expected:
+            raise DiffException(result, expected)
 
     def render_file(template: autojinja.templates.BaseTemplate, expected: str, output: Optional[str], encoding: Optional[str], newline: Optional[str], args: Tuple[str, ...], kwargs: Dict[str, str]):
         result = template.context(*args, **kwargs).render_file(output, encoding, newline)
@@ -41,6 +60,16 @@ class Generator_RawTemplate:
             if content != result:
                 raise DiffException(content, result)
 
+    def stream_file(template: autojinja.templates.BaseTemplate, expected: str, output: Optional[str], encoding: Optional[str], newline: Optional[str], args: Tuple[str, ...], kwargs: Dict[str, str]):
+        sha = template.context(*args, **kwargs).stream_file(output, encoding, newline)
+        encoding = encoding or template.encoding
+        newline = newline or template.newline
+        with open(output_file, 'r', encoding = encoding) as f:
+            content = f.read()
+            if content != expected:
+                raise DiffException(content, expected)
+        assert sha == hashlib.sha256(expected.replace('\n', newline or os.linesep).encode(encoding or "utf-8")).hexdigest()
+
     def check(input: str, expected: str, *args: str, **kwargs: str):
         with open(input_file, 'w') as f:
             f.write(input)
@@ -49,11 +78,13 @@ class Generator_RawTemplate:
         Generator_RawTemplate.render(template, expected, args, kwargs)
         template = autojinja.RawTemplate.from_string(input, None, None, None, None)
         Generator_RawTemplate.render_file(template, expected, output_file, None, None, args, kwargs)
+        Generator_RawTemplate.stream_file(template, expected, output_file, None, None, args, kwargs)
         ### Encoding / Newline
         template = autojinja.RawTemplate.from_file(input_file, output_file, "ascii", "\r\n", None)
         Generator_RawTemplate.render(template, expected, args, kwargs)
         template = autojinja.RawTemplate.from_string(input, output_file, None, None, None)
         Generator_RawTemplate.render_file(template, expected, None, "ascii", "\r\n", args, kwargs)
+        Generator_RawTemplate.stream_file(template, expected, None, "ascii", "\r\n", args, kwargs)
         ### Globals
         template = autojinja.RawTemplate.from_file(input_file, output_file, None, None, kwargs)
         Generator_RawTemplate.render(template, expected, (), {})
@@ -67,6 +98,12 @@ class Generator:
         result = template.context(*args, **kwargs).render(output, remove_markers)
         if result != expected:
             raise DiffException(result, expected)
+        result = "".join(template.context(*args, **kwargs).render_chunks(output, remove_markers))
+        if result != expected:
+            raise DiffException(result, expected)
+        result = run_async(template.context(*args, **kwargs).render_async(output, remove_markers))
+        if result != expected:
+            raise DiffException(result, expected)
 
     def render_file(template: autojinja.templates.BaseTemplate, output: str, expected, remove_markers: Optional[bool], encoding: Optional[str], newline: Optional[str], args: Tuple[str, ...], kwargs: Dict[str, str]):
         result = template.context(*args, **kwargs).render_file(output, remove_markers, encoding, newline)
@@ -80,6 +117,16 @@ class Generator:
             if content != result:
                 raise DiffException(content, result)
 
+    def stream_file(template: autojinja.templates.BaseTemplate, output: str, expected, remove_markers: Optional[bool], encoding: Optional[str], newline: Optional[str], args: Tuple[str, ...], kwargs: Dict[str, str]):
+        sha = template.context(*args, **kwargs).stream_file(output, remove_markers, encoding, newline)
+        encoding = encoding or template.encoding
+        newline = newline or template.newline
+        with open(output_file, 'r', encoding = encoding) as f:
+            content = f.read()
+            if content != expected:
+                raise DiffException(content, expected)
+        assert sha == hashlib.sha256(expected.replace('\n', newline or os.linesep).encode(encoding or "utf-8")).hexdigest()
+
     def check(class_type: Union[Type[autojinja.CogTemplate], Type[autojinja.JinjaTemplate]], input: str, output: Optional[str], expected: str, remove_markers: Optional[bool], *args: str, **kwargs: str):
         def prepare():
             if output_file.exists:
@@ -94,6 +141,7 @@ class Generator:
         prepare(); Generator.render(template, output, expected, None, args, kwargs)
         template = class_type.from_string(input, None, None, remove_markers, None, None, None)
         prepare(); Generator.render_file(template, output_file, expected, None, None, None, args, kwargs)
+        prepare(); Generator.stream_file(template, output_file, expected, None, None, None, args, kwargs)
         ### Settings
         template = class_type.from_file(input_file, None, autojinja.ParserSettings(), remove_markers, None, None, None)
         prepare(); Generator.render(template, output, expected, None, args, kwargs)
@@ -109,6 +157,7 @@ class Generator:
         prepare(); Generator.render(template, output, expected, None, args, kwargs)
         template = class_type.from_string(input, output_file, None, remove_markers, None, None, None)
         prepare(); Generator.render_file(template, None, expected, None, "ascii", "\r\n", args, kwargs)
+        prepare(); Generator.stream_file(template, None, expected, None, "ascii", "\r\n", args, kwargs)
         ### Globals
         template = class_type.from_file(input_file, None, None, remove_markers, None, None, kwargs)
         prepare(); Generator.render(template, output, expected, None, (), {})
@@ -1345,6 +1394,311 @@ class Test_Miscellaneous:
                     raise DiffException(result, expected)
         test().generate()
 
+    def test_jinja2_environment(self):
+        import jinja2
+        assert isinstance(autojinja.RawTemplate.create_environment(), autojinja.environment.PropertyEnvironment)
+        result = jinja2.Environment().from_string("{{ class1.x }}").render(class1 = Class1())
+        assert result == "" # jinja2 itself isn't modified
+
+    def test_code_cache(self):
+        env = autojinja.RawTemplate.create_environment(code_cache_size = 2)
+        old_env = autojinja.RawTemplate.environment
+        autojinja.RawTemplate.environment = env
+        try:
+            template = autojinja.CogTemplate.from_string("[[[ {{ a }} ]]]\n[[[ end ]]]\n  [[[ {{ a }} ]]]\n  [[[ end ]]]\n")
+            assert template.context(a = 1).render() == "[[[ {{ a }} ]]]\n1\n[[[ end ]]]\n  [[[ {{ a }} ]]]\n  1\n  [[[ end ]]]\n"
+            assert template.context(a = 2).render() == "[[[ {{ a }} ]]]\n2\n[[[ end ]]]\n  [[[ {{ a }} ]]]\n  2\n  [[[ end ]]]\n"
+            assert env.code_cache_info() == (1, 1, 2, 1) # Second render reuses compiled headers
+            autojinja.RawTemplate.from_string("{{ b }}", globals = { "b": 1 }).render()
+            assert autojinja.RawTemplate.from_string("{{ b }}", globals = { "b": 2 }).render() == "2"
+            autojinja.RawTemplate.from_string("{{ c }}", globals = { "c": 3 }).render()
+            assert env.code_cache_info() == (2, 3, 2, 2) # Least recently used evicted
+            env.code_cache_clear()
+            assert env.code_cache_info() == (0, 0, 2, 0)
+            template.context(a = 3).render()
+            assert env.code_cache_info() == (0, 0, 2, 0) # Render plan reused
+            env = autojinja.RawTemplate.create_environment(code_cache_size = 0)
+            autojinja.RawTemplate.environment = env
+            autojinja.RawTemplate.from_string("{{ b }}", globals = { "b": 1 }).render()
+            assert env.code_cache_info() == (0, 0, 0, 0)
+        finally:
+            autojinja.RawTemplate.environment = old_env
+
+    def test_async(self):
+        async def value(x):
+            await asyncio.sleep(0.01)
+            return x
+        async def render():
+            raw_template = autojinja.RawTemplate.from_string("{{ a }} {{ b }} {{ value(3) }}")
+            cog_template = autojinja.CogTemplate.from_string("[[[ {{ a }} ]]] [[[ end ]]]")
+            jinja_template = autojinja.JinjaTemplate.from_string("{{ a }} [[[ {{ a }} ]]] [[[ end ]]]")
+            return await asyncio.gather(raw_template.context(a = value(1), b = 2, value = value).render_async(),
+                                        cog_template.context(a = value(1)).render_async(),
+                                        cog_template.context(a = value(2)).render_async(),
+                                        jinja_template.context(a = value(1)).render_async(),
+                                        raw_template.context(a = 1, b = 2, value = value).render_file_async(output_file))
+        assert run_async(render()) == ["1 2 3", "[[[ {{ a }} ]]] 1 [[[ end ]]]", "[[[ {{ a }} ]]] 2 [[[ end ]]]", "1 [[[ {{ a }} ]]] 1 [[[ end ]]]", "1 2 3"]
+        with open(output_file, 'r') as f:
+            assert f.read() == "1 2 3"
+        ### Exceptions
+        template = autojinja.RawTemplate.from_string("{{ a.b }}")
+        assert_clean_exception(lambda: run_async(template.context(a = value({})).render_async()), AttributeError, "\n'dict' object has no attribute 'b'")
+        template = autojinja.CogTemplate.from_string("[[[ {{ a.b }} ]]] [[[ end ]]]")
+        assert_clean_exception(lambda: run_async(template.context(a = value({})).render_async()), AttributeError, "\n'dict' object has no attribute 'b'")
+        ### Environment
+        env = autojinja.RawTemplate.get_async_environment()
+        assert env.is_async and env.linked_to is autojinja.RawTemplate.environment
+        assert autojinja.RawTemplate.get_async_environment() is env
+        assert env.code_cache is not autojinja.RawTemplate.environment.code_cache
+
+    def test_context_layers(self):
+        values = { f"v{i}": i for i in range(100) }
+        template = autojinja.RawTemplate.from_string("{{ a }} {{ v5 }} {{ g }}{% set a = 0 %}", globals = { "g": "g", "v5": -1 })
+        context1 = template.context(a = 1, **values)
+        context2 = context1.context(a = 2)
+        context3 = context2.context({ "a": 3, "g": "d" }, v5 = 6)
+        ### Previous layers are shared
+        assert context2.kwargs.maps[1] is context1.kwargs
+        assert context3.kwargs.maps[1:] == context2.kwargs.maps
+        ### Most recent layers take precedence, then positional variables, then globals
+        assert context1.render() == "1 5 g"
+        assert context2.render() == "2 5 g"
+        assert context3.render() == "2 6 d"
+        assert context1.kwargs == { "a": 1, **values } # Not modified by renders
+        assert list(context3.kwargs.keys()) == list(dict(context3.kwargs).keys())
+        ### Generators
+        template = autojinja.CogTemplate.from_string("[[[ {{ a }}{{ this }} ]]] [[[ end ]]]")
+        assert template.context(a = 1).context(self = 2).render() == "[[[ {{ a }}{{ this }} ]]] 12 [[[ end ]]]"
+        template = autojinja.JinjaTemplate.from_string("{{ a }} [[[ {{ a }} ]]] [[[ end ]]]")
+        context = template.context(a = 1)
+        assert context.context(a = 2).render() == "2 [[[ {{ a }} ]]] 2 [[[ end ]]]"
+        assert context.render() == "1 [[[ {{ a }} ]]] 1 [[[ end ]]]"
+        ### Resolved awaitables don't modify previous layers
+        async def value(x):
+            return x
+        context = autojinja.RawTemplate.from_string("{{ a }} {{ b }}").context(a = 1, b = value(2))
+        assert run_async(context.context(a = value(3)).render_async()) == "3 2"
+        assert context.kwargs["a"] == 1
+
+    def test_render_many(self):
+        outputs = [root.join(f"many{i}.txt") for i in range(3)]
+        for output in outputs:
+            if output.exists:
+                os.remove(output)
+        with open(outputs[1], 'w') as f:
+            f.write("<<[ e ]>> kept <<[ end ]>>\n")
+        template = autojinja.CogTemplate.from_string("[[[ {{ x }} ]]] [[[ end ]]]\n<<[ e ]>> <<[ end ]>>\n")
+        for executor in [None, "thread", "process"]:
+            recorder = autojinja.tracker.Recorder()
+            recorder.start()
+            try:
+                statuses = template.render_many([({ "x": 0 }, outputs[0]), (template.context(x = 1), outputs[1]), ({ "x": 2 }, outputs[2])], executor, 2)
+            finally:
+                recorder.stop()
+            if executor == None:
+                assert statuses == { outputs[0]: "new", outputs[1]: "changed", outputs[2]: "new" }
+            else:
+                assert statuses == { outputs[0]: "unchanged", outputs[1]: "unchanged", outputs[2]: "unchanged" }
+            if autojinja.tracker.is_supported():
+                assert [recorder.generated[autojinja.tracker.normpath(x)]["status"] for x in outputs] == list(statuses.values())
+        for i, output in enumerate(outputs):
+            with open(output, 'r') as f:
+                assert f.read() == f"[[[ {{{{ x }}}} ]]] {i} [[[ end ]]]\n<<[ e ]>> {'kept' if i == 1 else ''} <<[ end ]>>\n"
+        template = autojinja.RawTemplate.from_string("{{ x }}")
+        assert template.render_many([({ "x": 3 }, outputs[0])], "process") == { outputs[0]: "changed" }
+        with open(outputs[0], 'r') as f:
+            assert f.read() == "3"
+        ### Exceptions
+        assert_exception(lambda: template.render_many([({ "x": 3 }, outputs[0])], "fibers"), Exception, "Expected 'thread' or 'process' for executor parameter, got 'fibers'")
+        assert_exception(lambda: template.render_many([(3, outputs[0])]), TypeError, "Expected a context or a dictionary of variables, got 'int'")
+        template = autojinja.CogTemplate.from_string("[[[ {{ x.y }} ]]] [[[ end ]]]")
+        for executor in [None, "thread", "process"]:
+            assert_clean_exception(lambda: template.render_many([({ "x": {} }, outputs[0])], executor), AttributeError, "\n'dict' object has no attribute 'y'")
+        assert_exception(lambda: template.render_many([({ "x": 1 }, outputs[0]), ({ "x": 2 }, outputs[0])]), Exception, f"Output at path \"{outputs[0]}\" is rendered more than once")
+
+    def test_render_many_environment(self):
+        outputs = [root.join(f"many_env{i}.txt") for i in range(2)]
+        old_env = autojinja.RawTemplate.environment
+        try:
+            env = autojinja.RawTemplate.create_environment(variable_start_string = "<<", variable_end_string = ">>")
+            env.filters["double"] = double
+            autojinja.RawTemplate.environment = env
+            template = autojinja.RawTemplate.from_string("<< x|double >> << g >> {{ x }}", globals = { "g": "global" })
+            assert template.user_globals == { "g": "global" }
+            copy = pickle.loads(pickle.dumps(template))
+            assert copy.user_globals == { "g": "global" } and copy.jinja2_template.environment is env
+            autojinja.RawTemplate.environment = old_env
+            copy = pickle.loads(pickle.dumps(template)) # Environment created again from its options
+            assert copy.context(x = 1).render() == "2 global {{ x }}"
+            assert pickle.loads(pickle.dumps(template)).jinja2_template.environment is copy.jinja2_template.environment
+            for environment in [env, old_env]:
+                autojinja.RawTemplate.environment = environment
+                assert template.render_many([({ "x": 1 }, outputs[0]), ({ "x": 2 }, outputs[1])], "process") != None
+                for i, output in enumerate(outputs):
+                    with open(output, 'r') as f:
+                        assert f.read() == f"{2 * (i + 1)} global {{{{ x }}}}"
+            autojinja.RawTemplate.environment = env
+            template = autojinja.CogTemplate.from_string("[[[ << x|double >> ]]] [[[ end ]]]") # Compiled by workers with the shared environment
+            template.render_many([({ "x": 1 }, outputs[0])], "process")
+            with open(outputs[0], 'r') as f:
+                assert f.read() == "[[[ << x|double >> ]]] 2 [[[ end ]]]"
+        finally:
+            autojinja.RawTemplate.environment = old_env
+
+    def test_reinsert(self):
+        ### Cog regions repeated by jinja2
+        template = autojinja.JinjaTemplate.from_string("{% for i in range(2) %}\n{{ i }} [[[ {{ 5 }} ]]] [[[ end ]]]\n{% endfor %}\n")
+        assert template.render() == "0 [[[ {{ 5 }} ]]] 5 [[[ end ]]]\n1 [[[ {{ 5 }} ]]] 5 [[[ end ]]]\n"
+        ### Line numbers after multi-line cog regions
+        template = autojinja.JinjaTemplate.from_string("a\n// [[[\n//   x\n// ]]]\n// [[[ end ]]]\n{{ missing }}\n")
+        try:
+            template.render()
+            assert False
+        except Exception as e:
+            assert "line 6, in top-level template code" in str(e)
+        ### Newline sequence
+        old_env = autojinja.RawTemplate.environment
+        try:
+            autojinja.RawTemplate.environment = autojinja.RawTemplate.create_environment(newline_sequence = "\r\n")
+            template = autojinja.JinjaTemplate.from_string("{{ 1 }}\n// [[[\n//   {{ 2 }}\n// ]]]\n// [[[ end ]]]\n")
+            assert template.render() == "1\r\n// [[[\n//   {{ 2 }}\n// ]]]\n  2\n// [[[ end ]]]\r\n"
+        finally:
+            autojinja.RawTemplate.environment = old_env
+
+    def test_evaluate(self):
+        parsed = []
+        old_parse = autojinja.templates.CogGenerator.parse
+        def parse(self):
+            parsed.append(self.string)
+            return old_parse(self)
+        autojinja.templates.CogGenerator.parse = parse
+        autojinja.templates.BaseGenerator.parse_cache.clear()
+        try:
+            ### Outputs without markers aren't parsed
+            template = autojinja.CogTemplate.from_string("a [[[ {{ x }} ]]] [[[ end ]]] b")
+            parsed.clear()
+            assert template.context(x = 1).render() == "a [[[ {{ x }} ]]] 1 [[[ end ]]] b"
+            assert parsed == [] # Template parsed once on construction
+            ### Outputs with markers are still generated
+            parsed.clear()
+            assert template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]").render() == "a [[[ {{ x }} ]]] [[[ {{ 1 }} ]]] 1 [[[ end ]]] [[[ end ]]] b"
+            assert parsed == ["[[[ {{ 1 }} ]]] [[[ end ]]]"]
+            ### Unterminated markers still raise
+            try:
+                template.context(x = "<<[ e ]>>").render()
+                assert False
+            except autojinja.exceptions.ParsingException:
+                pass
+        finally:
+            autojinja.templates.CogGenerator.parse = old_parse
+
+    def test_parse_cache(self):
+        old_cache = autojinja.templates.BaseGenerator.parse_cache
+        try:
+            cache = autojinja.templates.ParseCache(2)
+            autojinja.templates.BaseGenerator.parse_cache = cache
+            template = autojinja.CogTemplate.from_string("a [[[ {{ x }} ]]] [[[ end ]]] b")
+            assert template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]").render() == "a [[[ {{ x }} ]]] [[[ {{ 1 }} ]]] 1 [[[ end ]]] [[[ end ]]] b"
+            assert cache.info() == (0, 1, 2, 1)
+            assert template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]").render() == "a [[[ {{ x }} ]]] [[[ {{ 1 }} ]]] 1 [[[ end ]]] [[[ end ]]] b"
+            assert cache.info() == (1, 1, 2, 1) # Second render reuses parsed body
+            assert template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]").render(remove_markers = True) == "a 1 b"
+            assert cache.info() == (2, 1, 2, 1) # Removed markers don't affect parsing
+            ### Other settings
+            template = autojinja.CogTemplate.from_string("a [[[ {{ x }} ]]] [[[ end ]]] b", settings = autojinja.ParserSettings(edit_open = "<<<"))
+            assert template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]").render() == "a [[[ {{ x }} ]]] [[[ {{ 1 }} ]]] 1 [[[ end ]]] [[[ end ]]] b"
+            assert cache.info() == (2, 2, 2, 2)
+            ### Parsing errors aren't cached
+            for i in range(2):
+                try:
+                    template.context(x = "[[[ {{ 1 }} ]]]").render()
+                    assert False
+                except autojinja.exceptions.ParsingException:
+                    pass
+            assert cache.info() == (2, 4, 2, 2)
+            cache.clear()
+            assert cache.info() == (0, 0, 2, 0)
+            ### Eviction
+            template = autojinja.CogTemplate.from_string("a [[[ {{ x }} ]]] [[[ end ]]] b")
+            for i in [1, 2, 3, 1]:
+                assert template.context(x = f"[[[ {{{{ {i} }}}} ]]] [[[ end ]]]").render() == f"a [[[ {{{{ x }}}} ]]] [[[ {{{{ {i} }}}} ]]] {i} [[[ end ]]] [[[ end ]]] b"
+            assert cache.info() == (0, 4, 2, 2) # Least recently used body evicted
+            cache = autojinja.templates.ParseCache(10, maxchars = 60)
+            autojinja.templates.BaseGenerator.parse_cache = cache
+            for i in [1, 2, 3, 2, 1]:
+                template.context(x = f"[[[ {{{{ {i} }}}} ]]] [[[ end ]]]").render()
+            assert cache.info() == (1, 4, 10, 2) and cache.chars == 54 # Total length of 27 characters bodies
+            template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]" + " " * 60).render()
+            assert cache.info() == (1, 5, 10, 2) and cache.chars == 54 # Longer than the cache allows
+            ### Whole outputs of jinja templates aren't cached
+            cache.clear()
+            jinja_template = autojinja.JinjaTemplate.from_string("{{ 1 }} [[[ {{ 2 }} ]]] [[[ end ]]]")
+            assert jinja_template.render() == "1 [[[ {{ 2 }} ]]] 2 [[[ end ]]]"
+            assert cache.info() == (0, 0, 10, 0)
+            ### Disabled
+            cache = autojinja.templates.ParseCache(0)
+            autojinja.templates.BaseGenerator.parse_cache = cache
+            assert template.context(x = "[[[ {{ 1 }} ]]] [[[ end ]]]").render() == "a [[[ {{ x }} ]]] [[[ {{ 1 }} ]]] 1 [[[ end ]]] [[[ end ]]] b"
+            assert cache.info() == (0, 1, 0, 0)
+        finally:
+            autojinja.templates.BaseGenerator.parse_cache = old_cache
+
+    def test_render_plan(self):
+        template = autojinja.CogTemplate.from_string("a [[[ {{ g }}{{ x }} ]]] [[[ end ]]] b <<[ e ]>>  <<[ end ]>>", globals = { "g": 1 })
+        assert template.context(x = 1).render() == "a [[[ {{ g }}{{ x }} ]]] 11 [[[ end ]]] b <<[ e ]>>  <<[ end ]>>"
+        plan = template.parser.plan
+        compiled = template.parser.compiled_templates[template.markers[0].header_start]
+        assert template.context(x = 2).render() == "a [[[ {{ g }}{{ x }} ]]] 12 [[[ end ]]] b <<[ e ]>>  <<[ end ]>>"
+        assert template.parser.plan is plan
+        assert template.parser.compiled_templates[template.markers[0].header_start] is compiled
+        template.globals = { "g": 2 } # Recompiled with new globals
+        assert template.context(x = 3).render() == "a [[[ {{ g }}{{ x }} ]]] 23 [[[ end ]]] b <<[ e ]>>  <<[ end ]>>"
+        template = autojinja.JinjaTemplate.from_string("{{ x }} [[[ {{ x }} ]]] [[[ end ]]] <<[ e ]>>  <<[ end ]>>")
+        for x in range(3):
+            assert template.context(x = x).render() == f"{x} [[[ {{{{ x }}}} ]]] {x} [[[ end ]]] <<[ e ]>>  <<[ end ]>>"
+        old_env = autojinja.RawTemplate.environment
+        try:
+            autojinja.RawTemplate.environment = autojinja.RawTemplate.create_environment(variable_start_string = "${", variable_end_string = "}")
+            assert template.context(x = 3).render() == "{{ x }} [[[ {{ x }} ]]] {{ x }} [[[ end ]]] <<[ e ]>>  <<[ end ]>>" # Recompiled with new environment
+        finally:
+            autojinja.RawTemplate.environment = old_env
+
+    def test_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            old_env = autojinja.RawTemplate.environment
+            os.environ[autojinja.defaults.AUTOJINJA_CACHE_DIR] = cache_dir
+            try:
+                for i in range(2): # Second environment loads compiled templates from disk
+                    env = autojinja.RawTemplate.create_environment()
+                    assert isinstance(env.bytecode_cache, autojinja.templates.BytecodeCache)
+                    if i == 1:
+                        def compile(*args, **kwargs):
+                            raise Exception("compiled")
+                        env.compile = compile
+                    autojinja.RawTemplate.environment = env
+                    template = autojinja.CogTemplate.from_string("[[[ {{ a }} ]]]\n[[[ end ]]]\n")
+                    assert template.context(a = i).render() == f"[[[ {{{{ a }}}} ]]]\n{i}\n[[[ end ]]]\n"
+                filenames = os.listdir(cache_dir)
+                assert len(filenames) == 1 and filenames[0].startswith("__autojinja_") and filenames[0].endswith(".cache")
+                assert autojinja.tracker.is_ignored_file(os.path.join(cache_dir, filenames[0]).replace('\\', '/'))
+                ### Versions are part of the key
+                key = env.bytecode_cache.get_cache_key("name")
+                autojinja.templates.__version__ = "0.0.0"
+                assert env.bytecode_cache.get_cache_key("name") != key
+                ### Environment settings are part of the keys
+                for env in [autojinja.RawTemplate.create_environment(), autojinja.RawTemplate.create_environment(variable_start_string = "<<", variable_end_string = ">>")]:
+                    env.variable_start_string = "<<" # Changed after creation
+                    env.variable_end_string = ">>"
+                    autojinja.RawTemplate.environment = env
+                    assert autojinja.RawTemplate.from_string("{{ 1 }}<<x>>").context(x = 2).render() == "{{ 1 }}2"
+                    env.variable_start_string = "{{"
+                    env.variable_end_string = "}}"
+                    assert autojinja.RawTemplate.from_string("{{ 1 }}<<x>>").context(x = 2).render() == "1<<x>>"
+            finally:
+                autojinja.templates.__version__ = autojinja.__version__
+                autojinja.RawTemplate.environment = old_env
+                del os.environ[autojinja.defaults.AUTOJINJA_CACHE_DIR]
+
     def test_nested_objects_stacktrace(self):
         class1 = Class1()
         class2 = Class2()
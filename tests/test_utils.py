@@ -1,6 +1,7 @@
 from . import assert_clean_exception, Class1, Class2, Class3
 
 import autojinja
+import hashlib
 import io
 import os
 import sys
@@ -237,6 +238,102 @@ class Test:
         finally:
             sys.stdout = sys.__stdout__
 
+    def test_generate_file_6(self):
+        os.environ[autojinja.defaults.AUTOJINJA_SUMMARY] = "0"
+        os.environ[autojinja.defaults.AUTOJINJA_CHECK] = "1"
+        os.environ[autojinja.defaults.AUTOJINJA_CWD] = root
+        with open(file2, 'w', encoding="ascii") as f:
+            f.write("Test1\nTest2")
+        recorder = autojinja.tracker.Recorder()
+        recorder.start()
+        try:
+            sys.stdout = io.StringIO()
+            autojinja.utils.generate_file(file2, "Test1\nTest2", encoding="ascii")
+            assert sys.stdout.getvalue() == ""
+            autojinja.utils.generate_file(file2, "Test1\nTest3", encoding="ascii")
+            with open(file2, 'r', encoding="ascii") as f:
+                assert f.read() == "Test1\nTest2"
+            if autojinja.tracker.is_supported():
+                assert recorder.generated[autojinja.tracker.normpath(file2)]["diff"] == sys.stdout.getvalue()
+            assert sys.stdout.getvalue() == "--- a/file2.txt\n" \
+                                            "+++ b/file2.txt\n" \
+                                            "@@ -1,2 +1,2 @@\n" \
+                                            " Test1\n" \
+                                            "-Test2\n" \
+                                            "\\ No newline at end of file\n" \
+                                            "+Test3\n" \
+                                            "\\ No newline at end of file\n"
+        finally:
+            sys.stdout = sys.__stdout__
+            recorder.stop()
+            del os.environ[autojinja.defaults.AUTOJINJA_CHECK]
+            del os.environ[autojinja.defaults.AUTOJINJA_CWD]
+
+    def test_generate_file_size(self):
+        os.environ[autojinja.defaults.AUTOJINJA_SUMMARY] = "0"
+        if file2.exists:
+            os.remove(file2)
+        recorder = autojinja.tracker.Recorder()
+        recorder.start()
+        try:
+            autojinja.utils.generate_file(file2, "é\nb\n", newline="\r\n")
+            autojinja.utils.generate_file(file2, "é\nb\n", newline="\r\n")
+            os.environ[autojinja.defaults.AUTOJINJA_CHECK] = "1"
+            sys.stdout = io.StringIO()
+            autojinja.utils.generate_file(root.join("checked.txt"), "é\n", newline="\r\n")
+        finally:
+            sys.stdout = sys.__stdout__
+            del os.environ[autojinja.defaults.AUTOJINJA_CHECK]
+            recorder.stop()
+        if autojinja.tracker.is_supported():
+            assert recorder.generated[autojinja.tracker.normpath(file2)] == { "status": "unchanged", "size": 7 } # Encoded, with translated newlines
+            values = recorder.generated[autojinja.tracker.normpath(root.join("checked.txt"))]
+            assert (values["status"], values["size"]) == ("new", 4)
+            assert values["diff"].endswith("@@ -0,0 +1 @@\n+é\n") # Printed by the CLI when silent
+
+    def test_generate_chunks(self):
+        os.environ[autojinja.defaults.AUTOJINJA_SUMMARY] = "1"
+        if file2.exists:
+            os.remove(file2)
+        def chunks(*values: str):
+            yield from values
+        def failing_chunks():
+            yield "Test1\n"
+            raise Exception("failed")
+        try:
+            sys.stdout = io.StringIO()
+            sha = autojinja.utils.generate_chunks(file2, chunks("Test1", "\n", "", "Test2"), encoding="ascii", newline="\r\n")
+            with open(file2, 'rb') as f:
+                content = f.read()
+                assert content == b"Test1\r\nTest2"
+                assert sha == hashlib.sha256(content).hexdigest()
+            assert sys.stdout.getvalue() == f"[autojinja]    new    {file2}\n"
+            sys.stdout.truncate(0)
+            sys.stdout.seek(0)
+            mtime = os.stat(file2).st_mtime_ns
+            autojinja.utils.generate_chunks(file2, chunks("Te", "st1\nTest2"), encoding="ascii", newline="\r\n")
+            assert os.stat(file2).st_mtime_ns == mtime
+            assert sys.stdout.getvalue() == f"[autojinja]  -------  {file2}\n"
+            sys.stdout.truncate(0)
+            sys.stdout.seek(0)
+            autojinja.utils.generate_chunks(file2, chunks("Test1\n", "Test"), encoding="ascii") # Old content is longer
+            with open(file2, 'r', encoding="ascii") as f:
+                assert f.read() == "Test1\nTest"
+            assert sys.stdout.getvalue() == f"[autojinja]  changed  {file2}\n"
+            sys.stdout.truncate(0)
+            sys.stdout.seek(0)
+            try:
+                autojinja.utils.generate_chunks(file2, failing_chunks(), encoding="ascii")
+                assert False
+            except Exception as e:
+                assert str(e) == "failed"
+            with open(file2, 'r', encoding="ascii") as f:
+                assert f.read() == "Test1\nTest"
+            assert sys.stdout.getvalue() == ""
+            assert [x for x in os.listdir(root) if x.startswith(autojinja.tracker.TEMPORARY_FILE_PREFIX)] == []
+        finally:
+            sys.stdout = sys.__stdout__
+
     def test_parse_file(self):
         object = autojinja.utils.parse_file(file3, settings1, encoding="ascii")
         assert object.settings == settings1
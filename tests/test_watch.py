@@ -0,0 +1,136 @@
+import autojinja
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+tmp = tempfile.TemporaryDirectory()
+root = autojinja.path.DirPath(tmp.name)
+
+data = root.join("data.txt")
+generated = root.join("generated.txt")
+script1 = root.join("script1.py")
+script2 = root.join("script2.py")
+script3 = root.join("script3.py")
+templates = root.join("templates/")
+with open(data, 'w') as f:
+    f.write("data\n")
+with open(script1, 'w') as f:
+    f.write("import autojinja\n" \
+            "with open('data.txt') as f:\n" \
+            "    content = f.read()\n" \
+            "autojinja.utils.generate_file('generated.txt', content)\n")
+with open(script2, 'w') as f:
+    f.write("with open('generated.txt') as f:\n" \
+            "    f.read()\n")
+os.mkdir(templates)
+with open(script3, 'w') as f:
+    f.write("import glob\n" \
+            "glob.glob('templates/*.txt')\n")
+
+env = os.environ.copy()
+env["PYTHONPATH"] = os.path.dirname(os.path.dirname(autojinja.__file__))
+env[autojinja.defaults.AUTOJINJA_SUMMARY] = "0"
+
+def touch(filepath: str, content: str):
+    with open(filepath, 'w') as f:
+        f.write(content)
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+class TestTracker:
+    def test_1(self):
+        runner = autojinja.runner.Runner(env, silent=True, track=True)
+        results = runner.run([script1.abspath, script2.abspath])
+        record1 = results[0].record
+        assert data in record1.inputs
+        assert script1 in record1.inputs
+        assert generated in record1.outputs
+        assert record1.generated[generated]["size"] == 5
+        record2 = results[1].record
+        assert generated in record2.inputs
+        assert record2.outputs == {}
+
+    def test_2(self):
+        runner = autojinja.runner.Runner(env, silent=True, in_process=True, track=True)
+        results = runner.run([script1.abspath])
+        record = results[0].record
+        assert data in record.inputs
+        assert generated not in record.outputs
+        assert record.generated[generated]["status"] == "unchanged"
+
+    def test_3(self):
+        runner = autojinja.runner.Runner(env, silent=True, track=True)
+        record = runner.run([script3.abspath])[0].record
+        assert list(record.listed) == [autojinja.tracker.normpath(templates)]
+        assert record.inputs == { script3: None }
+
+class TestDependencies:
+    def test_1(self):
+        runner = autojinja.runner.Runner(env, silent=True, track=True)
+        scripts = [script1.abspath, script2.abspath]
+        dependencies = autojinja.watch.Dependencies(scripts, [])
+        dependencies.update(runner.run(scripts))
+        assert dependencies.changed_scripts() == []
+        touch(data, "new data\n")
+        assert dependencies.changed_scripts() == [script1]
+        assert dependencies.changed_scripts() == []
+        dependencies.update(runner.run([script1.abspath]))
+        assert dependencies.changed_scripts() == [script2]
+        touch(script2, open(script2).read())
+        assert dependencies.changed_scripts() == [script2]
+
+    def test_2(self):
+        envfile = root.join("file.env")
+        touch(envfile, "VAR1=1\n")
+        scripts = [script1.abspath, script2.abspath]
+        dependencies = autojinja.watch.Dependencies(scripts, [envfile])
+        assert dependencies.changed_scripts() == []
+        touch(envfile, "VAR1=2\n")
+        assert dependencies.changed_scripts() == scripts
+
+    def test_3(self):
+        runner = autojinja.runner.Runner(env, silent=True, track=True)
+        scripts = [script3.abspath]
+        dependencies = autojinja.watch.Dependencies(scripts, [])
+        dependencies.update(runner.run(scripts))
+        assert dependencies.changed_scripts() == []
+        touch(templates.join("new.txt"), "new\n")
+        assert dependencies.changed_scripts() == scripts
+        assert dependencies.changed_scripts() == []
+
+class TestWatcher:
+    def test_1(self):
+        watcher = autojinja.watch.create_watcher()
+        try:
+            watcher.add([data])
+            thread = threading.Thread(target=lambda: (time.sleep(0.2), touch(data, "data\n")))
+            thread.start()
+            start = time.monotonic()
+            watcher.wait()
+            assert time.monotonic() - start < 5
+            thread.join()
+        finally:
+            watcher.close()
+
+class TestWatch:
+    def test_1(self):
+        class Watcher:
+            def add(self, filepaths):
+                pass
+            def wait(self):
+                raise KeyboardInterrupt()
+            def close(self):
+                pass
+        old_create_watcher = autojinja.watch.create_watcher
+        autojinja.watch.create_watcher = lambda polling=False: Watcher()
+        try:
+            stream = io.StringIO()
+            runner = autojinja.runner.Runner(env, silent=True, event_writer=autojinja.events.EventWriter(stream))
+            autojinja.watch.watch([script1], runner, [])
+        finally:
+            autojinja.watch.create_watcher = old_create_watcher
+        values = [json.loads(x) for x in stream.getvalue().splitlines()] # Only events
+        assert values[-1]["event"] == "watching" and values[-1]["files"] > 0